@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+ベンチマーク用スタブ: tweepy・Discord送信のプロセス内代替とテストデータ
+（gspreadは sheets_emulator.py を使用）
+"""
+
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+# スプレッドシートの列構成（README参照）
+QUERIES_HEADER = ["query_id", "timestamp", "platform", "username", "content", "category",
+                  "status", "assigned_to", "response", "resolved_at", "tweet_id", "reply_tweet_id"]
+TEMPLATES_HEADER = ["category", "template_id", "name", "template_text"]
+STATS_HEADER = ["date", "total_queries", "resolved_queries", "average_response_time", "top_category"]
+
+CATEGORIES = ["general", "product", "technical", "billing", "complaint", "feature"]
+STATUSES = ["未対応", "対応中", "完了", "保留中", "クローズ"]
+
+# カテゴリ推定に使われるキーワードを含むサンプル文
+SAMPLE_TEXTS = [
+    "@yourcompany 製品の使い方がわかりません。説明書はどこにありますか？",
+    "@yourcompany アプリがエラーで動かないです",
+    "@yourcompany 今月の請求金額が違うので返金してください",
+    "@yourcompany 対応が遅いし最悪です",
+    "@yourcompany ダークモードを追加してほしいです。要望です",
+    "@yourcompany こんにちは、少し質問があります"
+]
+
+class RateLimiter:
+    """固定ウィンドウのレート制限（超過時は待機: wait_on_rate_limit相当）"""
+
+    def __init__(self, limit=None, window=60.0):
+        """初期化（limit=Noneで無制限）"""
+        self.limit = limit
+        self.window = window
+        self.calls = deque()
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """呼び出し枠を1つ消費（枠がなければ空くまで待機）"""
+        if not self.limit:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            while self.calls and now - self.calls[0] >= self.window:
+                self.calls.popleft()
+
+            if len(self.calls) >= self.limit:
+                delay = self.window - (now - self.calls[0])
+                self.waited += delay
+                time.sleep(delay)
+                self.calls.popleft()
+
+            self.calls.append(time.monotonic())
+
+class Latency:
+    """固定値＋ゆらぎの遅延"""
+
+    def __init__(self, base=0.0, jitter=0.0, seed=0):
+        """初期化"""
+        self.base = base
+        self.jitter = jitter
+        self.random = random.Random(seed)
+
+    def sample(self):
+        """遅延時間（秒）を取得"""
+        if not self.base and not self.jitter:
+            return 0.0
+        return max(0.0, self.base + self.random.uniform(-self.jitter, self.jitter))
+
+    def sleep(self):
+        """同期的に待機（gspread・tweepyはブロッキング呼び出し）"""
+        delay = self.sample()
+        if delay:
+            time.sleep(delay)
+
+    async def async_sleep(self):
+        """非同期に待機（discord.pyの送信）"""
+        delay = self.sample()
+        if delay:
+            await asyncio.sleep(delay)
+
+# --- tweepy ---
+
+class FakeResponse:
+    """tweepy.Response相当"""
+
+    def __init__(self, data=None):
+        """初期化"""
+        self.data = data
+        self.includes = {}
+        self.errors = []
+        self.meta = {}
+
+class FakeTweet:
+    """tweepy.Tweet相当"""
+
+    def __init__(self, tweet_id, text, author_id, created_at):
+        """初期化"""
+        self.id = tweet_id
+        self.text = text
+        self.author_id = author_id
+        self.created_at = created_at
+        self.conversation_id = tweet_id
+        self.referenced_tweets = None
+
+class FakeReferencedTweet:
+    """tweepy.ReferencedTweet相当"""
+
+    def __init__(self, tweet_id, type="replied_to"):
+        """初期化"""
+        self.id = tweet_id
+        self.type = type
+
+class FakeUser:
+    """tweepy.User相当"""
+
+    def __init__(self, user_id, username):
+        """初期化"""
+        self.id = user_id
+        self.username = username
+        self.name = username
+
+class FakeTweepyClient:
+    """tweepy.Clientのスタブ"""
+
+    def __init__(self, latency=None, rate_limit=None, rate_window=900.0, seed=0):
+        """初期化"""
+        self.latency = latency or Latency()
+        self.limiter = RateLimiter(rate_limit, rate_window)
+        self.random = random.Random(seed)
+        self.pending_mentions = []
+        self.replies = []
+        self.next_tweet_id = 10 ** 18
+
+    def generate_mentions(self, count, start=None):
+        """メンションを生成してキューに追加"""
+        start = start or datetime.now(timezone.utc) - timedelta(minutes=count)
+        for i in range(count):
+            self.next_tweet_id += 1
+            self.pending_mentions.append(FakeTweet(
+                self.next_tweet_id,
+                self.random.choice(SAMPLE_TEXTS),
+                1000 + self.random.randrange(5000),
+                start + timedelta(seconds=i)
+            ))
+        return list(self.pending_mentions)
+
+    def _call(self):
+        """API呼び出し1回分の待機"""
+        self.limiter.wait()
+        self.latency.sleep()
+
+    def get_me(self, **kwargs):
+        self._call()
+        return FakeResponse(FakeUser(1, "yourcompany"))
+
+    def get_users_mentions(self, id, start_time=None, end_time=None, max_results=None, pagination_token=None, **kwargs):
+        self._call()
+        if end_time is None:
+            # 通常の確認: 届いている分をすべて返す
+            mentions, self.pending_mentions = self.pending_mentions, []
+            return FakeResponse(mentions or None)
+
+        # 期間指定（取りこぼし回収）: 範囲内を新しい順にページ分割して返す
+        start = datetime.strptime(start_time, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+        end = datetime.strptime(end_time, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+        matched = sorted(
+            (m for m in self.pending_mentions if start <= m.created_at < end),
+            key=lambda m: m.created_at, reverse=True
+        )
+        offset = int(pagination_token or 0)
+        page = matched[offset:offset + (max_results or len(matched))]
+
+        response = FakeResponse(page or None)
+        if offset + len(page) < len(matched):
+            response.meta = {"next_token": str(offset + len(page))}
+        return response
+
+    def get_user(self, id, **kwargs):
+        self._call()
+        return FakeResponse(FakeUser(id, f"user{id}"))
+
+    def get_users_tweets(self, id, start_time=None, max_results=None, **kwargs):
+        self._call()
+        tweets = [tweet for _, tweet in self.replies][::-1][:max_results]
+        return FakeResponse(tweets or None)
+
+    def create_tweet(self, text, in_reply_to_tweet_id=None, **kwargs):
+        self._call()
+        self.next_tweet_id += 1
+        tweet = FakeTweet(self.next_tweet_id, text, 1, datetime.now(timezone.utc))
+        if in_reply_to_tweet_id is not None:
+            tweet.referenced_tweets = [FakeReferencedTweet(int(in_reply_to_tweet_id))]
+        self.replies.append((in_reply_to_tweet_id, tweet))
+        # 実際のAPIと同様に作成結果は辞書（IDは文字列）で返す
+        return FakeResponse({"id": str(self.next_tweet_id), "text": text})
+
+def generate_query_rows(count, days=30, seed=0):
+    """queriesシートのサンプル行を生成"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    rows = []
+
+    for i in range(count):
+        created = now - timedelta(seconds=rng.randrange(days * 86400))
+        status = rng.choice(STATUSES)
+        resolved_at = ""
+        if status in ("完了", "クローズ"):
+            resolved_at = (created + timedelta(minutes=rng.randrange(5, 600))).strftime("%Y-%m-%d %H:%M:%S")
+
+        rows.append([
+            "",
+            created.strftime("%Y-%m-%d %H:%M:%S"),
+            "X",
+            f"@user{rng.randrange(5000)}",
+            rng.choice(SAMPLE_TEXTS),
+            rng.choice(CATEGORIES),
+            status,
+            "",
+            "",
+            resolved_at,
+            "",
+            ""
+        ])
+
+    # 実際のシートと同様にID順（＝受信順）に並べる
+    rows.sort(key=lambda row: row[1])
+    for i, row in enumerate(rows):
+        row[0] = f"Q{i + 1:03d}"
+    return rows
+
+def generate_template_rows(count=20):
+    """templatesシートのサンプル行を生成"""
+    return [
+        [
+            CATEGORIES[i % len(CATEGORIES)],
+            f"T{i + 1:03d}",
+            f"テンプレート{i + 1}",
+            "{username}様、{company_name}サポートです。お問い合わせ({query_id})ありがとうございます。"
+            "{date} {time}時点で確認中です。{support_email}までご連絡ください。"
+        ]
+        for i in range(count)
+    ]
+
+def build_spreadsheet(client, spreadsheet_id="benchmark", query_rows=1000, template_count=20, seed=0):
+    """queries・templates・statsシートを持つスプレッドシートをエミュレータ上に作成"""
+    spreadsheet = client.create_spreadsheet(spreadsheet_id)
+    spreadsheet.seed_worksheet("queries", [QUERIES_HEADER] + generate_query_rows(query_rows, seed=seed))
+    spreadsheet.seed_worksheet("templates", [TEMPLATES_HEADER] + generate_template_rows(template_count))
+    spreadsheet.seed_worksheet("stats", [STATS_HEADER])
+    return spreadsheet
+
+# --- discord.py ---
+
+class FakeChannel:
+    """discord.TextChannelの送信部分のスタブ"""
+
+    def __init__(self, name, latency=None, rate_limit=5, rate_window=5.0):
+        """初期化（Discordのチャンネル送信上限は概ね5件/5秒）"""
+        self.name = name
+        self.latency = latency or Latency()
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.sent = []
+        self.sent_at = []
+        self.calls = deque()
+        self.waited = 0.0
+
+    async def send(self, content=None, **kwargs):
+        """メッセージ送信（上限超過時はdiscord.pyと同様に待機）"""
+        if self.rate_limit:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            while self.calls and now - self.calls[0] >= self.rate_window:
+                self.calls.popleft()
+            if len(self.calls) >= self.rate_limit:
+                delay = self.rate_window - (now - self.calls[0])
+                self.waited += delay
+                await asyncio.sleep(delay)
+                self.calls.popleft()
+            self.calls.append(loop.time())
+
+        await self.latency.async_sleep()
+        self.sent.append((content, kwargs))
+        self.sent_at.append(time.perf_counter())
+        return self.sent[-1]
+
+def build_channels(latency=None, rate_limit=5, rate_window=5.0):
+    """サポートチャンネル一式を作成"""
+    names = CATEGORIES + ["notifications"]
+    return {name: FakeChannel(f"support-{name}", latency, rate_limit, rate_window) for name in names}
\ No newline at end of file
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+負荷試験: Sheetsエミュレータ上でSheetsManagerに同時アクセスを発生させる
+
+使い方:
+    python -m benchmarks.load_test --rows 100000 --backend sqlite --duration 60 --workers 4
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import threading
+
+from benchmarks.fakes import build_spreadsheet, SAMPLE_TEXTS, CATEGORIES
+from benchmarks.sheets_emulator import SheetsEmulator, MemoryStorage, SQLiteStorage, QuotaModel, LatencyModel
+from benchmarks.run import summarize
+from data_manager.sheets import SheetsManager
+
+SPREADSHEET_ID = "load-test"
+
+# 操作の比率（本番の傾向: 取り込み・更新が多く、検索は少ない）
+DEFAULT_MIX = {"log_query": 4, "update_status": 3, "get_query": 2, "search_queries": 1}
+
+def build_operations(sheets_manager, rows):
+    """操作名 → 非同期関数"""
+    def random_query_id(rng):
+        return f"Q{rng.randrange(1, rows + 1):03d}"
+
+    return {
+        "log_query": lambda rng: sheets_manager.log_query({
+            "username": f"@load{rng.randrange(1000)}",
+            "content": rng.choice(SAMPLE_TEXTS),
+            "category": rng.choice(CATEGORIES)
+        }),
+        "update_status": lambda rng: sheets_manager.update_status(random_query_id(rng), "対応中"),
+        "get_query": lambda rng: sheets_manager.get_query(random_query_id(rng)),
+        "search_queries": lambda rng: sheets_manager.search_queries(rng.choice(["エラー", "返金", "user1"]))
+    }
+
+def worker(index, operations, mix, deadline, results, lock):
+    """1スレッド分の負荷（呼び出し元が複数いる状況を模擬）"""
+    rng = random.Random(index)
+    names = [name for name, weight in mix.items() for _ in range(weight)]
+
+    while time.monotonic() < deadline:
+        name = rng.choice(names)
+        start = time.perf_counter()
+        failed = False
+        try:
+            result = asyncio.run(operations[name](rng))
+            failed = result is None and name == "get_query"
+        except Exception:
+            failed = True
+        elapsed = time.perf_counter() - start
+
+        with lock:
+            entry = results.setdefault(name, {"latencies": [], "errors": 0})
+            entry["latencies"].append(elapsed)
+            entry["errors"] += int(failed)
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="Sheetsエミュレータを使った負荷試験")
+    parser.add_argument("--rows", type=int, default=100000, help="queriesシートの初期行数")
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory", help="エミュレータの保存先")
+    parser.add_argument("--sqlite-path", default=":memory:", help="SQLiteのファイルパス")
+    parser.add_argument("--duration", type=float, default=30.0, help="実行時間（秒）")
+    parser.add_argument("--workers", type=int, default=4, help="同時に呼び出すスレッド数")
+    parser.add_argument("--read-quota", type=int, default=60, help="1分あたりの読み取り上限（0で無制限）")
+    parser.add_argument("--write-quota", type=int, default=60, help="1分あたりの書き込み上限（0で無制限）")
+    parser.add_argument("--quota-mode", choices=["error", "wait"], default="error", help="上限超過時の動作（429を返す／待機）")
+    parser.add_argument("--no-scheduler", action="store_true", help="クォータのスケジューラーを使わない（比較用）")
+    parser.add_argument("--latency", type=float, default=0.05, help="リクエストごとの遅延（秒）")
+    parser.add_argument("--cell-latency", type=float, default=0.0000005, help="1セルあたりの追加遅延（秒）")
+    parser.add_argument("--mix", default=None, help='操作の比率（JSON、例: {"log_query": 1, "get_query": 1}）')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """メイン実行関数"""
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.CRITICAL)
+
+    storage = SQLiteStorage(args.sqlite_path) if args.backend == "sqlite" else MemoryStorage()
+    emulator = SheetsEmulator(
+        storage=storage,
+        quota=QuotaModel(args.read_quota or None, args.write_quota or None, mode=args.quota_mode),
+        latency=LatencyModel(args.latency, args.cell_latency)
+    )
+
+    print(f"{args.rows}行のデータを準備しています...", file=sys.stderr)
+    build_spreadsheet(emulator, SPREADSHEET_ID, query_rows=args.rows)
+
+    # --no-scheduler ではクォータのスケジューラーを通さず、429をそのまま受ける
+    if args.no_scheduler:
+        sheets_manager = SheetsManager(None, client=emulator, read_quota=None, write_quota=None)
+    else:
+        sheets_manager = SheetsManager(None, client=emulator, read_quota=args.read_quota or None,
+                                       write_quota=args.write_quota or None)
+    sheets_manager.set_spreadsheet_id(SPREADSHEET_ID)
+    operations = build_operations(sheets_manager, args.rows)
+    mix = json.loads(args.mix) if args.mix else DEFAULT_MIX
+
+    results = {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+    start = time.perf_counter()
+
+    threads = [
+        threading.Thread(target=worker, args=(i, operations, mix, deadline, results, lock), daemon=True)
+        for i in range(args.workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.perf_counter() - start
+    report = {
+        "parameters": vars(args),
+        "operations": {},
+        "sheets_api": emulator.stats(),
+        "scheduler": sheets_manager.scheduler.status()
+    }
+    for name, entry in results.items():
+        summary = summarize(entry["latencies"], elapsed)
+        summary["errors"] = entry["errors"]
+        report["operations"][name] = summary
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
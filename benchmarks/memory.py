@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+メモリ使用量の比較: 問い合わせを辞書・pandas DataFrame・QueryCache でメモリ上に保持した場合
+
+形式ごとに別プロセスで、スプレッドシートから読んだのと同じ（値ごとに別の文字列オブジェクトの）
+問い合わせを保持し、増えた常駐メモリ（RSS）・作成時間・IDで1件引く時間を計測します。
+
+使い方:
+    python -m benchmarks.memory --rows 1000000
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import subprocess
+
+import pandas as pd
+
+from benchmarks.fakes import QUERIES_HEADER, generate_query_rows
+from data_manager.records import QueryCache
+
+SHAPES = ("dict", "dataframe", "query_cache")
+
+# 実際のシートに近づける値（ツイートIDは19桁、一部に担当者・返信内容あり）
+FIRST_TWEET_ID = 1800000000000000000
+SAMPLE_RESPONSE = "お問い合わせありがとうございます。担当者より順次ご連絡いたします。"
+
+def _rss():
+    """現在の常駐メモリ（バイト）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # /proc がない環境では最大常駐メモリで代用
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def build_lines(count, seed=0):
+    """queriesシートの行をJSON（1行1件）で作成（読み込むたびに別の文字列オブジェクトになる）"""
+    rng = random.Random(seed)
+    lines = []
+    for i, row in enumerate(generate_query_rows(count, days=365, seed=seed)):
+        row[10] = str(FIRST_TWEET_ID + i * 7)
+        if row[6] != "未対応":
+            row[7] = f"staff{rng.randrange(10)}"
+            row[8] = SAMPLE_RESPONSE
+        lines.append(json.dumps(row, ensure_ascii=False))
+    return lines
+
+def _records(lines):
+    """JSONの行を1件ずつ辞書に変換"""
+    for line in lines:
+        yield dict(zip(QUERIES_HEADER, json.loads(line)))
+
+def build_shape(shape, lines):
+    """形式ごとに問い合わせを保持し、IDで1件引く関数を返す"""
+    if shape == "dict":
+        # スプレッドシートの全行（get_all_records）と、IDで引くための索引
+        records = list(_records(lines))
+        index = {record["query_id"]: record for record in records}
+        return records, index.get
+
+    if shape == "dataframe":
+        # get_as_dataframe と同じく文字列の列（object型）
+        columns = {column: [] for column in QUERIES_HEADER}
+        for line in lines:
+            for column, value in zip(QUERIES_HEADER, json.loads(line)):
+                columns[column].append(value)
+        frame = pd.DataFrame(columns).set_index("query_id", drop=False)
+        del columns
+        return frame, lambda query_id: frame.loc[query_id].to_dict()
+
+    cache = QueryCache(capacity=len(lines))
+    cache.load(_records(lines))
+    return cache, lambda query_id: cache.get(query_id).to_dict()
+
+def measure(shape, rows, lookups, seed=0):
+    """1つの形式を計測（子プロセスで実行）"""
+    lines = build_lines(rows, seed)
+    gc.collect()
+
+    rss_before = _rss()
+    start = time.perf_counter()
+    holder, lookup = build_shape(shape, lines)
+    build_seconds = time.perf_counter() - start
+    gc.collect()
+    rss = _rss() - rss_before
+
+    rng = random.Random(seed)
+    query_ids = [f"Q{rng.randrange(1, rows + 1):03d}" for _ in range(lookups)]
+    start = time.perf_counter()
+    for query_id in query_ids:
+        lookup(query_id)
+    lookup_seconds = time.perf_counter() - start
+
+    result = {
+        "shape": shape,
+        "rows": rows,
+        "rss_bytes": rss,
+        "bytes_per_row": round(rss / rows, 1),
+        "build_seconds": round(build_seconds, 3),
+        "lookup_us": round(lookup_seconds / lookups * 1e6, 2)
+    }
+    if shape == "query_cache":
+        result["array_bytes"] = holder.nbytes()
+    return result
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="問い合わせをメモリ上に保持する形式ごとのメモリ使用量の比較")
+    parser.add_argument("--rows", type=int, default=1000000, help="保持する問い合わせの件数")
+    parser.add_argument("--lookups", type=int, default=10000, help="IDで引く回数")
+    parser.add_argument("--shapes", default=",".join(SHAPES), help=f"計測する形式（カンマ区切り: {', '.join(SHAPES)}）")
+    parser.add_argument("--output", default=None, help="結果のJSONを保存するパス")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """メイン実行関数"""
+    args = parse_args(argv)
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.rows, args.lookups)))
+        return 0
+
+    # 形式ごとに別プロセスで計測（前の形式で確保したメモリの影響を受けないように）
+    results = []
+    for shape in args.shapes.split(","):
+        print(f"{shape}: {args.rows}件を計測しています...", file=sys.stderr)
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.memory", "--rows", str(args.rows),
+             "--lookups", str(args.lookups), "--child", shape],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output))
+
+    baseline = results[0]["rss_bytes"] if results else 0
+    for result in results:
+        ratio = baseline / result["rss_bytes"] if result["rss_bytes"] > 0 else 0
+        print(
+            f"{result['shape']:<12} {result['rss_bytes'] / 2 ** 20:9.1f}MB {result['bytes_per_row']:8.1f}B/件 "
+            f"（{results[0]['shape']}の1/{ratio:.1f}） 作成 {result['build_seconds']:7.2f}秒 "
+            f"1件 {result['lookup_us']:7.2f}µs"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
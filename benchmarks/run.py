@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+ベンチマーク: スタブのX・Sheets・Discordを使ったオフライン性能計測
+
+使い方:
+    python -m benchmarks.run --rows 5000 --output bench.json
+    python -m benchmarks.run --baseline bench.json   # 前回結果との比較（劣化時は終了コード1）
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import platform
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.fakes import Latency, FakeTweepyClient, build_spreadsheet, build_channels, CATEGORIES, SAMPLE_TEXTS
+from benchmarks.sheets_emulator import (
+    SheetsEmulator, MemoryStorage, SQLiteStorage, QuotaModel, LatencyModel
+)
+from data_manager.sheets import SheetsManager
+from data_manager.storage import create_storage
+from data_manager.templates import TemplateManager, DEFAULT_TEMPLATE_CONSTANTS
+from x_monitor.api_client import XMonitor
+from discord_bot.bot import SupportBot
+from x_monitor.anomaly import AnomalyDetector
+from main import process_mention
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ("ingestion", "stats", "search", "search_page", "analyze", "export", "template", "catchup", "forward_burst")
+
+SPREADSHEET_ID = "benchmark"
+
+def percentile(sorted_values, pct):
+    """ソート済みの値から百分位数を取得（最近傍順位法）"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+def summarize(latencies, elapsed):
+    """レイテンシの一覧を集計"""
+    values = sorted(latencies)
+    ops = len(values)
+    return {
+        "ops": ops,
+        "seconds": round(elapsed, 4),
+        "throughput_per_sec": round(ops / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(sum(values) / ops * 1000, 3) if ops else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p90_ms": round(percentile(values, 90) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0
+    }
+
+async def measure(func, iterations):
+    """非同期関数を指定回数実行し、1回ごとの所要時間を記録"""
+    latencies = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        op_start = time.perf_counter()
+        await func(i)
+        latencies.append(time.perf_counter() - op_start)
+    return summarize(latencies, time.perf_counter() - start)
+
+class Environment:
+    """スタブで構成したアプリケーション一式"""
+
+    def __init__(self, args):
+        """初期化"""
+        self.gspread_client = SheetsEmulator(
+            storage=SQLiteStorage() if args.sheets_backend == "sqlite" else MemoryStorage(),
+            quota=QuotaModel(args.sheets_read_quota, args.sheets_write_quota, mode="wait"),
+            latency=LatencyModel(args.sheets_latency, args.sheets_cell_latency, args.jitter, seed=1)
+        )
+        build_spreadsheet(self.gspread_client, SPREADSHEET_ID, query_rows=args.rows, seed=args.seed)
+
+        # main.py と同じく、sheetsモードでは分析用の集計テーブルを持つ
+        self.sheets_manager = SheetsManager(
+            None, client=self.gspread_client, read_quota=args.sheets_read_quota, write_quota=args.sheets_write_quota,
+            rollup_path=":memory:" if args.storage == "sheets" else None
+        )
+        self.sheets_manager.set_spreadsheet_id(SPREADSHEET_ID)
+
+        self.tweepy_client = FakeTweepyClient(
+            Latency(args.x_latency, args.jitter, seed=2), rate_limit=args.x_rate_limit, seed=args.seed
+        )
+        self.x_monitor = XMonitor(None, client=self.tweepy_client)
+        self.args = args
+
+    async def setup(self):
+        """ストレージを作成し、Bot・テンプレート管理を組み立てる"""
+        args = self.args
+        self.storage = await create_storage(args.storage, self.sheets_manager, ":memory:")
+
+        self.template_manager = TemplateManager(self.storage, constants=dict(DEFAULT_TEMPLATE_CONSTANTS))
+
+        self.bot = SupportBot(
+            self.template_manager, self.storage, forward_batch_window=args.forward_batch_window,
+            anomaly_detector=AnomalyDetector()
+        )
+        self.bot.support_channels = build_channels(
+            Latency(args.discord_latency, args.jitter, seed=3), rate_limit=args.discord_rate_limit
+        )
+        return self
+
+async def bench_ingestion(env, args):
+    """メンション1件の処理（分類→記録→転送）"""
+    mentions = env.tweepy_client.generate_mentions(args.mentions)
+    env.tweepy_client.pending_mentions = []
+    return await measure(lambda i: process_mention(env.bot, env.x_monitor, env.storage, mentions[i]), len(mentions))
+
+async def bench_stats(env, args):
+    """統計の更新と取得"""
+    async def run(i):
+        await env.storage.update_stats()
+        await env.storage.get_todays_stats()
+    return await measure(run, args.iterations)
+
+async def bench_search(env, args):
+    """キーワード検索"""
+    keywords = ["エラー", "返金", "user12", "product", "存在しないキーワード"]
+    return await measure(lambda i: env.storage.search_queries(keywords[i % len(keywords)]), args.iterations)
+
+async def bench_search_page(env, args):
+    """キーワード検索の最初のページ（!search の表示に必要な分だけ取得）"""
+    keywords = ["エラー", "返金", "user12", "product", "存在しないキーワード"]
+    return await measure(lambda i: env.storage.search_queries_page(keywords[i % len(keywords)]), args.iterations)
+
+async def bench_analyze(env, args):
+    """期間分析（初回は集計テーブルの作成を含む）"""
+    periods = ["day", "week", "month", "year"]
+    return await measure(lambda i: env.storage.analyze_queries(periods[i % len(periods)]), args.iterations)
+
+async def bench_export(env, args):
+    """CSVエクスポート"""
+    return await measure(lambda i: env.storage.export_queries(7), args.iterations)
+
+async def bench_template(env, args):
+    """テンプレートの適用"""
+    await env.template_manager.load_templates()
+    query_data = {"username": "@benchmark", "query_id": "Q001", "category": "product",
+                  "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    template_ids = list(env.template_manager.template_set.by_id)
+    return await measure(
+        lambda i: env.template_manager.apply_template(template_ids[i % len(template_ids)], query_data),
+        args.iterations * 100
+    )
+
+async def bench_catchup(env, args):
+    """停止後の取りこぼし回収（期間分割・並行取得）"""
+    gap = timedelta(hours=args.catchup_hours)
+
+    async def run(i):
+        # 停止していた期間にメンションが均等に届いた状態を作る
+        env.tweepy_client.pending_mentions = []
+        start = datetime.now(timezone.utc) - gap
+        env.tweepy_client.generate_mentions(args.mentions, start=start)
+        for j, mention in enumerate(env.tweepy_client.pending_mentions):
+            mention.created_at = start + gap * j / args.mentions
+        env.x_monitor.last_check_time = start
+
+        mentions = await env.x_monitor.catch_up(concurrency=args.catchup_concurrency)
+        assert len(mentions) == args.mentions
+    return await measure(run, args.iterations)
+
+async def bench_forward_burst(env, args):
+    """新規問い合わせのDiscord転送（--forward-rate 件/秒で届いたときの、到着から送信までの遅延）"""
+    rng = random.Random(args.seed)
+    interval = 1 / args.forward_rate
+    arrivals = {}
+    start = time.perf_counter()
+
+    for i in range(args.mentions):
+        # 到着時刻は処理の遅れに関係なく一定間隔（遅れた分は到着からの遅延に含める）
+        arrival = start + i * interval
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        query_id = f"Q{i + 1:03d}"
+        arrivals[query_id] = arrival
+        await env.bot.forward_query({
+            "query_id": query_id,
+            "content": rng.choice(SAMPLE_TEXTS),
+            "username": f"@user{rng.randrange(5000)}",
+            "category": rng.choice(CATEGORIES),
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        })
+    await env.bot.flush_forwards()
+
+    # カテゴリチャンネルに埋め込みが送信された時刻から遅延を求める
+    latencies = []
+    for name, channel in env.bot.support_channels.items():
+        if name == "notifications":
+            continue
+        for (content, kwargs), sent_at in zip(channel.sent, channel.sent_at):
+            for embed in kwargs.get("embeds") or [kwargs["embed"]]:
+                latencies.append(sent_at - arrivals[embed.title.split(": ", 1)[1]])
+
+    result = summarize(latencies, time.perf_counter() - start)
+    result["messages"] = sum(len(channel.sent) for channel in env.bot.support_channels.values())
+    return result
+
+BENCHMARKS = {
+    "ingestion": bench_ingestion,
+    "stats": bench_stats,
+    "search": bench_search,
+    "search_page": bench_search_page,
+    "analyze": bench_analyze,
+    "export": bench_export,
+    "template": bench_template,
+    "catchup": bench_catchup,
+    "forward_burst": bench_forward_burst
+}
+
+def compare(results, baseline, tolerance):
+    """前回結果と比較して劣化した項目を返す"""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+
+        if previous["p99_ms"] and current["p99_ms"] > previous["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {previous['p99_ms']}ms → {current['p99_ms']}ms")
+        if previous["throughput_per_sec"] and current["throughput_per_sec"] < previous["throughput_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: スループット {previous['throughput_per_sec']}/s → {current['throughput_per_sec']}/s")
+    return regressions
+
+async def run_benchmarks(args):
+    """選択されたシナリオを実行"""
+    results = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "scenarios": {}
+    }
+
+    for name in args.scenarios:
+        # シナリオごとにデータを作り直して互いに影響しないようにする
+        env = await Environment(args).setup()
+        sheets_calls = env.gspread_client.calls
+        result = await BENCHMARKS[name](env, args)
+        result["sheets_api_calls"] = env.gspread_client.calls - sheets_calls
+        results["scenarios"][name] = result
+        print(f"{name:10s} {result['ops']:6d}件 {result['throughput_per_sec']:10.2f}/s "
+              f"p50 {result['p50_ms']:9.3f}ms p99 {result['p99_ms']:9.3f}ms", file=sys.stderr)
+
+    return results
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="Discord-X-Support-Hub オフラインベンチマーク")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"実行するシナリオ（カンマ区切り: {', '.join(SCENARIOS)}）")
+    parser.add_argument("--rows", type=int, default=1000, help="queriesシートの初期行数")
+    parser.add_argument("--mentions", type=int, default=200, help="ingestionで処理するメンション数")
+    parser.add_argument("--iterations", type=int, default=20, help="各シナリオの繰り返し回数")
+    parser.add_argument("--sheets-latency", type=float, default=0.0, help="Sheets API 1回あたりの遅延（秒）")
+    parser.add_argument("--x-latency", type=float, default=0.0, help="X API 1回あたりの遅延（秒）")
+    parser.add_argument("--discord-latency", type=float, default=0.0, help="Discord送信1回あたりの遅延（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="遅延のゆらぎ幅（秒）")
+    parser.add_argument("--sheets-cell-latency", type=float, default=0.0, help="Sheets APIの1セルあたりの追加遅延（秒）")
+    parser.add_argument("--sheets-read-quota", type=int, default=None, help="Sheets APIの1分あたりの読み取り上限（超過時は待機）")
+    parser.add_argument("--sheets-write-quota", type=int, default=None, help="Sheets APIの1分あたりの書き込み上限（超過時は待機）")
+    parser.add_argument("--sheets-backend", choices=["memory", "sqlite"], default="memory", help="エミュレータの保存先")
+    parser.add_argument("--storage", choices=["sheets", "sqlite", "dual"], default="sheets", help="アプリケーションのストレージ（STORAGE_BACKEND相当）")
+    parser.add_argument("--catchup-hours", type=float, default=6, help="catchupで回収する停止期間（時間）")
+    parser.add_argument("--catchup-concurrency", type=int, default=4, help="catchupで同時に取得する期間の数")
+    parser.add_argument("--x-rate-limit", type=int, default=None, help="X APIの15分あたりの上限")
+    parser.add_argument("--discord-rate-limit", type=int, default=0, help="チャンネルごとの5秒あたりの送信上限（0で無制限）")
+    parser.add_argument("--forward-rate", type=float, default=10.0, help="forward_burstで1秒あたりに届く問い合わせ数")
+    parser.add_argument("--forward-batch-window", type=float, default=0.5,
+                        help="転送をまとめる待ち時間（秒、FORWARD_BATCH_WINDOW_MS相当、0で1件ずつ送信）")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード")
+    parser.add_argument("--output", help="結果を書き出すJSONファイル（省略時は標準出力）")
+    parser.add_argument("--baseline", help="比較対象の過去の結果JSON")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="許容する劣化率（0.2 = 20%%）")
+    parser.add_argument("--verbose", action="store_true", help="アプリケーションのログを表示")
+
+    args = parser.parse_args(argv)
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"不明なシナリオ: {', '.join(unknown)}")
+    return args
+
+def main(argv=None):
+    """メイン実行関数"""
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    # エクスポートファイルなどは一時ディレクトリに書き出す
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            results = asyncio.run(run_benchmarks(args))
+        finally:
+            os.chdir(cwd)
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if baseline:
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print("性能劣化を検出しました:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
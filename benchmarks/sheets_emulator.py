@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+Sheetsエミュレータ: gspread互換のインメモリ／SQLiteスプレッドシート
+
+SheetsManagerが使うgspreadのAPI（find, append_row, update_cell, row_values,
+col_values, get_all_values など）とgspread_dataframeが使うvalues_getを再現し、
+1分あたりのクォータとリクエストごとの遅延を模擬します。
+"""
+
+import re
+import json
+import time
+import random
+import sqlite3
+import threading
+from collections import deque
+
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import a1_range_to_grid_range
+
+# Google Sheets APIのユーザーあたりの既定クォータ（1分あたり）
+DEFAULT_READ_QUOTA = 60
+DEFAULT_WRITE_QUOTA = 60
+
+class EmulatedResponse:
+    """APIErrorに渡すHTTPレスポンス相当"""
+
+    def __init__(self, status_code, payload):
+        """初期化"""
+        self.status_code = status_code
+        self._payload = payload
+        self.text = json.dumps(payload, ensure_ascii=False)
+
+    def json(self):
+        return self._payload
+
+def quota_error(kind, limit):
+    """Google Sheetsと同じ形式の429エラーを作成"""
+    metric = "Read requests" if kind == "read" else "Write requests"
+    return APIError(EmulatedResponse(429, {
+        "error": {
+            "code": 429,
+            "message": f"Quota exceeded for quota metric '{metric}' and limit '{metric} per minute per user' "
+                       f"of service 'sheets.googleapis.com' ({limit}/min, エミュレータ)",
+            "status": "RESOURCE_EXHAUSTED"
+        }
+    }))
+
+class QuotaModel:
+    """読み取り・書き込み別の1分あたりクォータ（スライディングウィンドウ）"""
+
+    def __init__(self, read_per_minute=DEFAULT_READ_QUOTA, write_per_minute=DEFAULT_WRITE_QUOTA,
+                 mode="error", window=60.0):
+        """初期化（mode: "error"は429を送出、"wait"は枠が空くまで待機、Noneの上限は無制限）"""
+        self.limits = {"read": read_per_minute, "write": write_per_minute}
+        self.mode = mode
+        self.window = window
+        self.calls = {"read": deque(), "write": deque()}
+        self.requests = {"read": 0, "write": 0}
+        self.rejected = {"read": 0, "write": 0}
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def consume(self, kind):
+        """リクエスト1回分の枠を消費"""
+        limit = self.limits[kind]
+        with self._lock:
+            self.requests[kind] += 1
+            if not limit:
+                return
+
+            calls = self.calls[kind]
+            now = time.monotonic()
+            while calls and now - calls[0] >= self.window:
+                calls.popleft()
+
+            if len(calls) >= limit:
+                if self.mode != "wait":
+                    self.rejected[kind] += 1
+                    raise quota_error(kind, limit)
+
+                delay = self.window - (now - calls[0])
+                self.waited += delay
+                time.sleep(delay)
+                calls.popleft()
+
+            calls.append(time.monotonic())
+
+    def usage(self):
+        """直近1分の使用数"""
+        now = time.monotonic()
+        with self._lock:
+            return {kind: sum(1 for t in calls if now - t < self.window) for kind, calls in self.calls.items()}
+
+class LatencyModel:
+    """リクエストごとの固定遅延＋処理セル数に比例する遅延"""
+
+    def __init__(self, base=0.0, per_cell=0.0, jitter=0.0, seed=0):
+        """初期化"""
+        self.base = base
+        self.per_cell = per_cell
+        self.jitter = jitter
+        self.random = random.Random(seed)
+
+    def sleep(self, cells=0):
+        """遅延を発生させる（gspreadと同様にブロッキング）"""
+        delay = self.base + self.per_cell * cells
+        if self.jitter:
+            delay += self.random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+class EmulatedCell:
+    """gspread.Cell相当"""
+
+    def __init__(self, row, col, value):
+        """初期化"""
+        self.row = row
+        self.col = col
+        self.value = value
+
+    def __repr__(self):
+        return f"<EmulatedCell R{self.row}C{self.col} {self.value!r}>"
+
+# --- 保存先 ---
+
+class MemoryStorage:
+    """シートの内容をメモリ上のリストで保持"""
+
+    def __init__(self):
+        """初期化"""
+        self.sheets = {}
+
+    def create(self, sheet):
+        self.sheets.setdefault(sheet, [])
+
+    def drop(self, sheet):
+        self.sheets.pop(sheet, None)
+
+    def row_count(self, sheet):
+        return len(self.sheets[sheet])
+
+    def get_row(self, sheet, row):
+        rows = self.sheets[sheet]
+        return list(rows[row - 1]) if row <= len(rows) else []
+
+    def iter_rows(self, sheet, start=1, end=None):
+        rows = self.sheets[sheet]
+        for row in rows[start - 1:end]:
+            yield list(row)
+
+    def set_row(self, sheet, row, values):
+        rows = self.sheets[sheet]
+        while len(rows) < row:
+            rows.append([])
+        rows[row - 1] = list(values)
+
+    def append_rows(self, sheet, rows):
+        self.sheets[sheet].extend(list(row) for row in rows)
+
+    def delete_rows(self, sheet, start, end):
+        del self.sheets[sheet][start - 1:end]
+
+class SQLiteStorage:
+    """シートの内容をSQLiteに保持（10万行以上の負荷試験用）"""
+
+    def __init__(self, path=":memory:"):
+        """初期化"""
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cells_rows (sheet TEXT, row INTEGER, data TEXT, PRIMARY KEY (sheet, row))"
+        )
+        self._lock = threading.Lock()
+
+    def create(self, sheet):
+        pass
+
+    def drop(self, sheet):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM cells_rows WHERE sheet = ?", (sheet,))
+
+    def row_count(self, sheet):
+        with self._lock:
+            result = self.conn.execute("SELECT MAX(row) FROM cells_rows WHERE sheet = ?", (sheet,)).fetchone()
+        return result[0] or 0
+
+    def get_row(self, sheet, row):
+        with self._lock:
+            result = self.conn.execute(
+                "SELECT data FROM cells_rows WHERE sheet = ? AND row = ?", (sheet, row)
+            ).fetchone()
+        return json.loads(result[0]) if result else []
+
+    def iter_rows(self, sheet, start=1, end=None):
+        end = end or self.row_count(sheet)
+        with self._lock:
+            found = dict(self.conn.execute(
+                "SELECT row, data FROM cells_rows WHERE sheet = ? AND row BETWEEN ? AND ? ORDER BY row",
+                (sheet, start, end)
+            ).fetchall())
+        for row in range(start, end + 1):
+            yield json.loads(found[row]) if row in found else []
+
+    def set_row(self, sheet, row, values):
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cells_rows (sheet, row, data) VALUES (?, ?, ?)",
+                (sheet, row, json.dumps(list(values), ensure_ascii=False))
+            )
+
+    def append_rows(self, sheet, rows):
+        start = self.row_count(sheet) + 1
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO cells_rows (sheet, row, data) VALUES (?, ?, ?)",
+                [(sheet, start + i, json.dumps(list(row), ensure_ascii=False)) for i, row in enumerate(rows)]
+            )
+
+    def delete_rows(self, sheet, start, end):
+        count = end - start + 1
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM cells_rows WHERE sheet = ? AND row BETWEEN ? AND ?", (sheet, start, end))
+            # 主キーの衝突を避けるため一度負の値に退避してから詰める
+            self.conn.execute("UPDATE cells_rows SET row = -(row - ?) WHERE sheet = ? AND row > ?", (count, sheet, end))
+            self.conn.execute("UPDATE cells_rows SET row = -row WHERE sheet = ? AND row < 0", (sheet,))
+
+# --- gspread互換API ---
+
+def _trim(values):
+    """末尾の空セルを除く（Sheets APIの応答と同じ）"""
+    values = list(values)
+    while values and values[-1] in ("", None):
+        values.pop()
+    return values
+
+def _to_cell_value(value):
+    """書き込み値を文字列に変換（RAW入力相当）"""
+    if value is None:
+        return ""
+    return str(value)
+
+class EmulatedWorksheet:
+    """gspread.Worksheet互換のシート"""
+
+    def __init__(self, spreadsheet, title, sheet_id):
+        """初期化"""
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+
+    @property
+    def _storage(self):
+        return self.spreadsheet.client.storage
+
+    @property
+    def _key(self):
+        return f"{self.spreadsheet.id}/{self.title}"
+
+    @property
+    def row_count(self):
+        return max(self._storage.row_count(self._key), 1)
+
+    @property
+    def col_count(self):
+        # 列数はヘッダー行の幅とみなす
+        return max(len(self._storage.get_row(self._key, 1)), 1)
+
+    def _request(self, kind, cells=0):
+        self.spreadsheet.client.request_cost(kind, cells)
+
+    def _grid(self, range_name):
+        """A1形式の範囲を (開始行, 終了行, 開始列, 終了列)（1始まり・両端含む）に変換"""
+        if "!" in range_name:
+            range_name = range_name.split("!", 1)[1]
+        grid = a1_range_to_grid_range(range_name)
+        start_row = grid.get("startRowIndex", 0) + 1
+        end_row = grid.get("endRowIndex", self._storage.row_count(self._key))
+        start_col = grid.get("startColumnIndex", 0) + 1
+        end_col = grid.get("endColumnIndex")
+        return start_row, end_row, start_col, end_col
+
+    # 読み取り
+
+    def find(self, query, in_row=None, in_column=None, case_sensitive=True):
+        scanned = 0
+        found = None
+        for r, row in enumerate(self._storage.iter_rows(self._key), start=1):
+            if in_row and r != in_row:
+                continue
+            for c, value in enumerate(row, start=1):
+                if in_column and c != in_column:
+                    continue
+                scanned += 1
+                if isinstance(query, re.Pattern):
+                    matched = query.search(value) is not None
+                elif case_sensitive:
+                    matched = value == str(query)
+                else:
+                    matched = value.lower() == str(query).lower()
+                if matched:
+                    found = EmulatedCell(r, c, value)
+                    break
+            if found:
+                break
+
+        # findは全セルを取得してから照合するため、シート全体のセル数に比例して遅くなる
+        self._request("read", cells=max(scanned, self._storage.row_count(self._key) * 10))
+        return found
+
+    def row_values(self, row, **kwargs):
+        values = _trim(self._storage.get_row(self._key, row))
+        self._request("read", cells=len(values))
+        return values
+
+    def col_values(self, col, **kwargs):
+        values = _trim(row[col - 1] if col <= len(row) else "" for row in self._storage.iter_rows(self._key))
+        self._request("read", cells=len(values))
+        return values
+
+    def get_all_values(self, **kwargs):
+        rows = list(self._storage.iter_rows(self._key))
+        width = max((len(row) for row in rows), default=0)
+        values = [row + [""] * (width - len(row)) for row in rows]
+        self._request("read", cells=len(rows) * width)
+        return values
+
+    def get(self, range_name=None, **kwargs):
+        if range_name is None:
+            return [_trim(row) for row in self.get_all_values()]
+
+        start_row, end_row, start_col, end_col = self._grid(range_name)
+        values = []
+        for row in self._storage.iter_rows(self._key, start_row, end_row):
+            values.append(_trim(row[start_col - 1:end_col]))
+        while values and not values[-1]:
+            values.pop()
+        self._request("read", cells=sum(len(row) for row in values))
+        return values
+
+    def acell(self, label, **kwargs):
+        start_row, _, start_col, _ = self._grid(label)
+        row = self._storage.get_row(self._key, start_row)
+        value = row[start_col - 1] if start_col <= len(row) else ""
+        self._request("read", cells=1)
+        return EmulatedCell(start_row, start_col, value)
+
+    def cell(self, row, col, **kwargs):
+        values = self._storage.get_row(self._key, row)
+        self._request("read", cells=1)
+        return EmulatedCell(row, col, values[col - 1] if col <= len(values) else "")
+
+    # 書き込み
+
+    def append_row(self, values, **kwargs):
+        self._storage.append_rows(self._key, [[_to_cell_value(v) for v in values]])
+        self._request("write", cells=len(values))
+
+    def append_rows(self, values, **kwargs):
+        rows = [[_to_cell_value(v) for v in row] for row in values]
+        self._storage.append_rows(self._key, rows)
+        self._request("write", cells=sum(len(row) for row in rows))
+
+    def _write_cells(self, start_row, start_col, values):
+        for offset, row_values in enumerate(values):
+            row_number = start_row + offset
+            row = self._storage.get_row(self._key, row_number)
+            end_col = start_col + len(row_values) - 1
+            if len(row) < end_col:
+                row.extend([""] * (end_col - len(row)))
+            row[start_col - 1:end_col] = [_to_cell_value(v) for v in row_values]
+            self._storage.set_row(self._key, row_number, row)
+
+    def update_cell(self, row, col, value):
+        self._write_cells(row, col, [[value]])
+        self._request("write", cells=1)
+
+    def update(self, range_name, values=None, **kwargs):
+        start_row, _, start_col, _ = self._grid(range_name)
+        if values and not isinstance(values[0], (list, tuple)):
+            values = [values]
+        self._write_cells(start_row, start_col, values or [])
+        self._request("write", cells=sum(len(row) for row in values or []))
+
+    def batch_update(self, data, **kwargs):
+        cells = 0
+        for item in data:
+            start_row, _, start_col, _ = self._grid(item["range"])
+            self._write_cells(start_row, start_col, item["values"])
+            cells += sum(len(row) for row in item["values"])
+        self._request("write", cells=cells)
+
+    def add_cols(self, cols):
+        # 列数はヘッダー行の幅とみなすため、書き込みの回数だけ数える
+        self._request("write")
+
+    def delete_rows(self, start_index, end_index=None):
+        self._storage.delete_rows(self._key, start_index, end_index or start_index)
+        self._request("write")
+
+    def clear(self):
+        self._storage.drop(self._key)
+        self._storage.create(self._key)
+        self._request("write")
+
+class EmulatedSpreadsheet:
+    """gspread.Spreadsheet互換のスプレッドシート"""
+
+    def __init__(self, client, spreadsheet_id, title=None):
+        """初期化"""
+        self.client = client
+        self.id = spreadsheet_id
+        self.title = title or spreadsheet_id
+        self._worksheets = {}
+
+    def _add(self, title):
+        worksheet = EmulatedWorksheet(self, title, len(self._worksheets))
+        self.client.storage.create(f"{self.id}/{title}")
+        self._worksheets[title] = worksheet
+        return worksheet
+
+    def seed_worksheet(self, title, rows):
+        """クォータを消費せずにシートを作成してデータを投入（テスト準備用）"""
+        worksheet = self._worksheets.get(title) or self._add(title)
+        self.client.storage.append_rows(f"{self.id}/{title}", [[_to_cell_value(v) for v in row] for row in rows])
+        return worksheet
+
+    def worksheet(self, title):
+        # 実際のgspreadはメタデータ取得のためにリクエストを1回行う
+        self.client.request_cost("read")
+        if title not in self._worksheets:
+            raise WorksheetNotFound(title)
+        return self._worksheets[title]
+
+    def worksheets(self):
+        self.client.request_cost("read")
+        return list(self._worksheets.values())
+
+    def add_worksheet(self, title, rows=1000, cols=26, index=None):
+        self.client.request_cost("write")
+        return self._add(title)
+
+    def del_worksheet(self, worksheet):
+        self.client.request_cost("write")
+        self._worksheets.pop(worksheet.title, None)
+        self.client.storage.drop(f"{self.id}/{worksheet.title}")
+
+    def batch_update(self, body):
+        """spreadsheets.batchUpdate（行の削除 deleteDimension のみ、要求の順に適用）"""
+        self.client.request_cost("write")
+        requests = body.get("requests", [])
+        for request in requests:
+            grid = request["deleteDimension"]["range"]
+            worksheet = next(w for w in self._worksheets.values() if w.id == grid["sheetId"])
+            self.client.storage.delete_rows(worksheet._key, grid["startIndex"] + 1, grid["endIndex"])
+        return {"spreadsheetId": self.id, "replies": [{} for _ in requests]}
+
+    def values_get(self, range_name, params=None):
+        """gspread_dataframe.get_as_dataframe が使用"""
+        worksheet = self._worksheets[range_name.split("!", 1)[0]]
+        rows = [_trim(row) for row in worksheet._storage.iter_rows(worksheet._key)]
+        while rows and not rows[-1]:
+            rows.pop()
+        self.client.request_cost("read", cells=sum(len(row) for row in rows))
+        return {"range": range_name, "majorDimension": "ROWS", "values": rows}
+
+class SheetsEmulator:
+    """gspread.Client互換のエミュレータ"""
+
+    def __init__(self, storage=None, quota=None, latency=None):
+        """初期化（storage: MemoryStorage / SQLiteStorage）"""
+        self.storage = storage or MemoryStorage()
+        self.quota = quota or QuotaModel(None, None)
+        self.latency = latency or LatencyModel()
+        self.spreadsheets = {}
+        self.calls = 0
+        self.modified_time = time.time()
+        # SheetsManagerが設定するクォータのスケジューラー（QuotaAwareClientと同じ位置で待機させる）
+        self.scheduler = None
+
+    def request_cost(self, kind, cells=0):
+        """リクエスト1回分のクォータ消費と遅延"""
+        if self.scheduler is not None:
+            self.scheduler.acquire(kind)
+
+        self.calls += 1
+        try:
+            self.quota.consume(kind)
+        except APIError:
+            if self.scheduler is not None:
+                self.scheduler.throttled(kind)
+            raise
+        self.latency.sleep(cells)
+        if kind == "write":
+            self.modified_time = time.time()
+
+    def create_spreadsheet(self, spreadsheet_id, title=None):
+        """スプレッドシートを作成"""
+        self.spreadsheets[spreadsheet_id] = EmulatedSpreadsheet(self, spreadsheet_id, title)
+        return self.spreadsheets[spreadsheet_id]
+
+    def open_by_key(self, key):
+        self.request_cost("read")
+        return self.spreadsheets[key]
+
+    def request(self, method, endpoint, params=None, **kwargs):
+        """Drive APIの更新日時取得に応答（Sheetsのクォータは消費しない）"""
+        self.latency.sleep()
+        modified = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(self.modified_time))
+        return EmulatedResponse(200, {"modifiedTime": modified})
+
+    def stats(self):
+        """リクエスト数・拒否数などの集計"""
+        return {
+            "requests": dict(self.quota.requests),
+            "rejected": dict(self.quota.rejected),
+            "quota_wait_seconds": round(self.quota.waited, 3)
+        }
\ No newline at end of file
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+一括取り込み: JSON Lines形式のツイート・問い合わせをまとめて記録
+
+使い方:
+    python bulk_import.py mentions.jsonl --batch-size 500
+    python bulk_import.py mentions.jsonl --forward --forward-rate 0.5
+
+1行に1件のJSONを読み込み、カテゴリを推定してストレージにまとめて書き込みます。
+ツイート形式（id, text, created_at, username または author.username）と
+問い合わせ形式（content, username, timestamp, category, status ...）のどちらにも対応します。
+処理済みの行数は <入力ファイル>.offset に保存され、中断しても続きから再開できます。
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+
+from main import init_storage, STORAGE_BACKEND, DISCORD_TOKEN
+from discord_bot.bot import SupportBot
+from data_manager.templates import TemplateManager
+from x_monitor.api_client import estimate_category
+from monitoring.log_pipeline import setup_logging
+
+logger = logging.getLogger(__name__)
+
+def parse_timestamp(value):
+    """ISO 8601 などの日時をスプレッドシートの書式に変換"""
+    if not value:
+        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return str(value)
+
+def record_to_query(record):
+    """JSONの1レコードを問い合わせデータに変換（変換できなければNone）"""
+    content = record.get("text") or record.get("content")
+    if not content:
+        return None
+
+    # ユーザー名（ツイート形式・問い合わせ形式・旧API形式）
+    author = record.get("author") or record.get("user") or {}
+    username = record.get("username") or author.get("username") or author.get("screen_name") or "不明"
+    if username != "不明" and not username.startswith("@"):
+        username = f"@{username}"
+
+    query_data = {
+        "platform": record.get("platform", "X"),
+        "username": username,
+        "content": content,
+        "timestamp": parse_timestamp(record.get("created_at") or record.get("timestamp")),
+        "category": record.get("category") or estimate_category(content),
+        "status": record.get("status", "未対応"),
+        "assigned_to": record.get("assigned_to", ""),
+        "response": record.get("response", ""),
+        "resolved_at": record.get("resolved_at", "")
+    }
+
+    tweet_id = record.get("tweet_id") or (record.get("id") if "text" in record else None)
+    if tweet_id:
+        query_data["tweet_id"] = tweet_id
+        query_data["url"] = f"https://twitter.com/user/status/{tweet_id}"
+
+    return query_data
+
+def read_offset(state_file):
+    """前回までに処理した行数"""
+    try:
+        with open(state_file, "r", encoding="utf-8") as f:
+            return json.load(f).get("offset", 0)
+    except FileNotFoundError:
+        return 0
+
+def write_offset(state_file, offset, imported):
+    """処理済みの行数を保存（途中で落ちても壊れないよう置き換えで書く）"""
+    temp_file = f"{state_file}.tmp"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        json.dump({"offset": offset, "imported": imported, "updated_at": datetime.now().isoformat()}, f)
+    os.replace(temp_file, state_file)
+
+def read_batches(path, offset, batch_size, limit=None):
+    """offset行目以降を (処理済みの行数, 問い合わせのリスト, スキップ数) の単位で返す"""
+    batch = []
+    skipped = 0
+    last_line = offset
+    read = 0
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if line_number <= offset:
+                continue
+            if limit is not None and read >= limit:
+                break
+
+            read += 1
+            last_line = line_number
+
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                query_data = record_to_query(json.loads(line))
+            except (json.JSONDecodeError, AttributeError) as e:
+                logger.warning(f"{line_number}行目を読み込めませんでした: {e}")
+                query_data = None
+
+            if query_data is None:
+                skipped += 1
+            else:
+                batch.append(query_data)
+
+            if len(batch) >= batch_size:
+                yield last_line, batch, skipped
+                batch = []
+                skipped = 0
+
+    if batch or skipped:
+        yield last_line, batch, skipped
+
+class Forwarder:
+    """Discordへの転送を一定間隔で行う（取り込みは待たせない）"""
+
+    def __init__(self, bot, rate):
+        """初期化（rate: 1秒あたりの転送件数）"""
+        self.bot = bot
+        self.interval = 1 / rate if rate > 0 else 0
+        self.queue = asyncio.Queue()
+        self.worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        """キューの順に転送"""
+        while True:
+            query_data = await self.queue.get()
+            try:
+                await self.bot.forward_query(query_data)
+            except Exception as e:
+                logger.error(f"問い合わせ {query_data.get('query_id')} の転送に失敗しました: {e}", exc_info=True)
+            finally:
+                self.queue.task_done()
+            await asyncio.sleep(self.interval)
+
+    def submit(self, queries):
+        """転送待ちに追加"""
+        for query_data in queries:
+            self.queue.put_nowait(query_data)
+
+    async def close(self):
+        """転送待ちがなくなるまで待機"""
+        await self.queue.join()
+        self.worker.cancel()
+
+async def start_forwarder(storage, rate):
+    """Discordボットにログインして転送の準備をする"""
+    bot = SupportBot(TemplateManager(storage), storage)
+    asyncio.create_task(bot.start(DISCORD_TOKEN))
+    await bot.wait_until_ready()
+
+    # on_readyでチャンネルが設定されるまで待つ
+    while "notifications" not in bot.support_channels:
+        await asyncio.sleep(0.5)
+
+    return bot, Forwarder(bot, rate)
+
+async def run_import(args):
+    """一括取り込みを実行"""
+    # スプレッドシート管理は取り込み中に直近の問い合わせを参照しないため、メモリ上への読み込みは行わない
+    storage, _ = await init_storage(args.storage)
+
+    bot = forwarder = None
+    if args.forward:
+        bot, forwarder = await start_forwarder(storage, args.forward_rate)
+
+    state_file = args.state_file or f"{args.input}.offset"
+    offset = args.offset if args.offset is not None else read_offset(state_file)
+    if offset:
+        logger.info(f"{offset}行目の続きから取り込みます")
+
+    imported = 0
+    skipped = 0
+    start = time.perf_counter()
+
+    for line_number, batch, batch_skipped in read_batches(args.input, offset, args.batch_size, args.limit):
+        if batch:
+            query_ids = await storage.log_queries(batch)
+            for query_data, query_id in zip(batch, query_ids):
+                query_data["query_id"] = query_id
+            if forwarder:
+                forwarder.submit(batch)
+
+        imported += len(batch)
+        skipped += batch_skipped
+        write_offset(state_file, line_number, imported)
+
+        elapsed = time.perf_counter() - start
+        logger.info(f"{line_number}行目まで処理: {imported}件記録 / {skipped}件スキップ ({imported / elapsed:.1f}件/秒)")
+
+    # 集計とミラー・転送の完了を待つ
+    if imported:
+        await storage.update_stats()
+    if hasattr(storage, "flush"):
+        await storage.flush()
+    if forwarder:
+        await forwarder.close()
+        await bot.flush_forwards()
+        await bot.close()
+
+    elapsed = time.perf_counter() - start
+    rate = imported / elapsed if elapsed > 0 else 0
+    logger.info(f"取り込み完了: {imported}件記録 / {skipped}件スキップ / {elapsed:.1f}秒 ({rate:.1f}件/秒)")
+    return imported
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="JSON Linesのツイート・問い合わせを一括で取り込む")
+    parser.add_argument("input", help="取り込むJSON Linesファイル")
+    parser.add_argument("--storage", choices=["sheets", "sqlite", "dual"], default=STORAGE_BACKEND,
+                        help="書き込み先（既定は STORAGE_BACKEND）")
+    parser.add_argument("--batch-size", type=int, default=500, help="1回の書き込みでまとめる件数")
+    parser.add_argument("--offset", type=int, default=None, help="この行数を読み飛ばして開始（省略時は前回の続き）")
+    parser.add_argument("--limit", type=int, default=None, help="取り込む最大行数")
+    parser.add_argument("--state-file", help="処理済み行数の保存先（既定: <input>.offset）")
+    parser.add_argument("--forward", action="store_true", help="Discordにも転送する（既定は転送しない）")
+    parser.add_argument("--forward-rate", type=float, default=1.0, help="Discordへの1秒あたりの転送件数")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """メイン実行関数"""
+    args = parse_args(argv)
+    log_listener = setup_logging()
+    try:
+        asyncio.run(run_import(args))
+    finally:
+        log_listener.stop()
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+アーカイブ: 古い問い合わせを受付月ごとのシート（queries_YYYYMM）へ移す対象の選定と、IDから移動先を引く索引
+
+queriesシートのfind・col_values・全行の読み込みは行数に比例して遅くなり、スプレッドシートには
+セル数の上限もあります。解決済みで保持期間を過ぎた問い合わせを受付月ごとのシートへ移し、
+queriesシートには未解決と直近の問い合わせだけを残します。索引シートには月ごとに1行
+（移動先と最初・最後のID）だけを記録し、IDからどのシートを読めばよいかを引きます。
+"""
+
+import re
+from datetime import datetime
+
+from data_manager.storage import RESOLVED_STATUSES
+from data_manager.records import seq_from_id
+from monitoring.metrics import REGISTRY
+
+# 索引シートの名前と列構成
+ARCHIVE_INDEX_SHEET = "archive_index"
+ARCHIVE_INDEX_COLUMNS = ["sheet", "spreadsheet_id", "month", "first_id", "last_id", "rows", "archived_at"]
+
+# 何か月前までの解決済みの問い合わせをqueriesシートに残すか（1: 今月と先月）
+DEFAULT_KEEP_MONTHS = 1
+
+# アーカイブの確認間隔（秒）
+ARCHIVE_INTERVAL = 24 * 60 * 60
+
+MONTH_PATTERN = re.compile(r"^(\d{4})-(\d{2})")
+
+ARCHIVED_QUERIES = REGISTRY.counter("queries_archived_total", "queriesシートから月ごとのシートへ移した問い合わせ数")
+HOT_ROWS = REGISTRY.gauge("queries_hot_rows", "queriesシートの問い合わせ数（最後にアーカイブを確認した時点）")
+
+def archive_sheet_name(month):
+    """受付月（YYYYMM）のアーカイブのシート名"""
+    return f"queries_{month}"
+
+def query_month(timestamp):
+    """受付日時の文字列から受付月（YYYYMM）を取得（形式違いはNone）"""
+    match = MONTH_PATTERN.match(str(timestamp or ""))
+    return match.group(1) + match.group(2) if match else None
+
+def cutoff_month(now, keep_months=DEFAULT_KEEP_MONTHS):
+    """queriesシートに残す最初の月（YYYYMM、これより前の月の解決済みの問い合わせを移す）"""
+    months = now.year * 12 + now.month - 1 - keep_months
+    return f"{months // 12:04d}{months % 12 + 1:02d}"
+
+def select_archivable(values, cutoff):
+    """queriesシートの全行（1行目はヘッダー）から移す行を受付月ごとに選ぶ（{受付月: [(行番号, 行), ...]}）"""
+    months = {}
+    for row_number, row in enumerate(values[1:], start=2):
+        if not row or not row[0] or len(row) < 7 or row[6] not in RESOLVED_STATUSES:
+            continue
+        month = query_month(row[1])
+        if month is not None and month < cutoff:
+            months.setdefault(month, []).append((row_number, row))
+    return months
+
+class ArchiveIndex:
+    """アーカイブのシートごとの移動先と最初・最後のIDの索引"""
+
+    def __init__(self, entries=()):
+        """初期化（entries: 索引シートの行の辞書）"""
+        self.entries = {entry["sheet"]: entry for entry in entries}
+
+    @classmethod
+    def from_values(cls, values):
+        """索引シートの全行（1行目はヘッダー）から作成"""
+        entries = []
+        for row in values[1:]:
+            if not row or not row[0]:
+                continue
+            entry = dict(zip(ARCHIVE_INDEX_COLUMNS, row + [""] * (len(ARCHIVE_INDEX_COLUMNS) - len(row))))
+            entry["rows"] = int(entry["rows"] or 0)
+            entries.append(entry)
+        return cls(entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def months(self, since=None):
+        """受付月の古い順のシート（since: この月（YYYYMM）以降だけ）"""
+        return [
+            entry for entry in sorted(self.entries.values(), key=lambda entry: entry["month"])
+            if since is None or entry["month"] >= since
+        ]
+
+    def route(self, query_id):
+        """IDが含まれうるシートを新しい月から順に返す（形式違いのIDはすべてのシート）"""
+        return [entry for entry in self.months()[::-1] if self.covers(entry, query_id)]
+
+    @staticmethod
+    def covers(entry, query_id):
+        """シートにIDが含まれうるか（最初と最後のIDの範囲内、形式違いのIDは常にTrue）"""
+        seq = seq_from_id(query_id)
+        if seq is None:
+            return True
+        return (seq_from_id(entry["first_id"]) or 0) <= seq <= (seq_from_id(entry["last_id"]) or 0)
+
+    def last_seq(self):
+        """移したIDの最大の連番（なければ0）"""
+        return max((seq_from_id(entry["last_id"]) or 0 for entry in self.entries.values()), default=0)
+
+    def add(self, sheet, spreadsheet_id, month, query_ids, rows, now=None):
+        """シートに移したIDを記録（rows: 移した後のシートの問い合わせ数）"""
+        entry = self.entries.setdefault(sheet, {
+            "sheet": sheet, "spreadsheet_id": spreadsheet_id, "month": month, "first_id": "", "last_id": ""
+        })
+        seqs = {seq_from_id(query_id): query_id for query_id in query_ids}
+        seqs.pop(None, None)
+        for query_id in (entry["first_id"], entry["last_id"]):
+            if seq_from_id(query_id) is not None:
+                seqs[seq_from_id(query_id)] = query_id
+        if seqs:
+            entry["first_id"] = seqs[min(seqs)]
+            entry["last_id"] = seqs[max(seqs)]
+        entry["rows"] = rows
+        entry["archived_at"] = (now or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+
+    def to_values(self):
+        """索引シートに書き込む全行（ヘッダーを含む）"""
+        return [ARCHIVE_INDEX_COLUMNS] + [
+            [str(entry.get(column, "")) for column in ARCHIVE_INDEX_COLUMNS] for entry in self.months()
+        ]
\ No newline at end of file
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+イベントログ: 問い合わせの状態の変化（受付・アサイン・返信・ステータス変更・解決）を追記だけで記録
+
+queriesの行は現在の状態で上書きされるため、初回返信の日時は残りません。状態が変わる
+たびに1行（日時はUNIX秒の整数）を追記し、初回返信・解決までの時間はイベントを記録した
+時点で1回だけ求めて集計テーブルに加算します。レポートのたびに全行の日時を解析し直しません。
+"""
+
+import os
+import sqlite3
+import logging
+import threading
+import contextlib
+from datetime import datetime
+
+from monitoring.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# イベントの種類（ログには整数で記録する）
+CREATED = 1
+ASSIGNED = 2
+RESPONDED = 3
+STATUS_CHANGED = 4
+RESOLVED = 5
+
+EVENT_NAMES = {
+    CREATED: "受付",
+    ASSIGNED: "アサイン",
+    RESPONDED: "返信",
+    STATUS_CHANGED: "ステータス変更",
+    RESOLVED: "解決"
+}
+
+# 初回返信のイベントの値（集計の作り直しではこの値の返信だけを初回として数える）
+FIRST_RESPONSE = "初回"
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS query_events (
+    seq INTEGER PRIMARY KEY,
+    query_id TEXT NOT NULL,
+    at INTEGER NOT NULL,
+    kind INTEGER NOT NULL,
+    value TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_query_events_query ON query_events (query_id, kind, at);
+CREATE INDEX IF NOT EXISTS idx_query_events_at ON query_events (at);
+"""
+
+# 初回返信・解決までの時間の分布（秒、5分〜3日）
+SLA_BUCKETS = (300, 900, 1800, 3600, 7200, 14400, 28800, 86400, 259200)
+
+FIRST_RESPONSE_SECONDS = REGISTRY.histogram(
+    "query_first_response_seconds", "受付から初回返信までの時間（秒）", buckets=SLA_BUCKETS
+)
+RESOLUTION_SECONDS = REGISTRY.histogram(
+    "query_resolution_seconds", "受付から解決までの時間（秒）", buckets=SLA_BUCKETS
+)
+
+def _epoch(value):
+    """日時の文字列をUNIX秒に変換（空・形式違いはNone）"""
+    try:
+        return int(datetime.strptime(str(value), TIMESTAMP_FORMAT).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+def insert_events(query_data):
+    """記録した問い合わせのイベント（受付と、解決日時があれば解決）"""
+    query_id = query_data["query_id"]
+    created_at = _epoch(query_data.get("timestamp"))
+    if created_at is None:
+        return []
+
+    events = [(query_id, created_at, CREATED, str(query_data.get("category") or ""))]
+    resolved_at = _epoch(query_data.get("resolved_at"))
+    if resolved_at is not None:
+        events.append((query_id, resolved_at, RESOLVED, str(query_data.get("status") or "")))
+    return events
+
+def update_events(query_id, fields, now):
+    """列の更新（fields: 列名→値）から生じるイベント"""
+    events = []
+    if fields.get("assigned_to"):
+        events.append((query_id, now, ASSIGNED, str(fields["assigned_to"])))
+    if fields.get("response"):
+        events.append((query_id, now, RESPONDED, ""))
+    if "status" in fields:
+        events.append((query_id, now, STATUS_CHANGED, str(fields["status"])))
+    if fields.get("resolved_at"):
+        events.append((query_id, _epoch(fields["resolved_at"]) or now, RESOLVED, str(fields.get("status") or "")))
+    return events
+
+class EventLog:
+    """問い合わせのイベントログ（SQLite、追記のみ）"""
+
+    def __init__(self, conn, managed=True):
+        """初期化（managed=Falseの場合、ロックとトランザクションは接続を共有する呼び出し側が管理する）"""
+        self.conn = conn
+        self.conn.row_factory = sqlite3.Row
+        self.managed = managed
+        self._lock = threading.Lock()
+        self.conn.executescript(SCHEMA)
+
+    @classmethod
+    def open(cls, path):
+        """ファイルを開いて単独で使うイベントログを作成"""
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        return cls(sqlite3.connect(path, check_same_thread=False))
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """単独で使う場合はロックとトランザクションを取る"""
+        if not self.managed:
+            yield
+            return
+        with self._lock, self.conn:
+            yield
+
+    def _append(self, events):
+        """イベントを追記"""
+        if events:
+            self.conn.executemany("INSERT INTO query_events (query_id, at, kind, value) VALUES (?, ?, ?, ?)", events)
+
+    def _first_at(self, query_id, kind):
+        """問い合わせの最初のイベントの日時（なければNone）"""
+        return self.conn.execute(
+            "SELECT MIN(at) FROM query_events WHERE query_id = ? AND kind = ?", (query_id, kind)
+        ).fetchone()[0]
+
+    def record_inserts(self, rows):
+        """記録した問い合わせのイベントを追記"""
+        with self._transaction():
+            for query_data in rows:
+                self._append(insert_events(query_data))
+
+    def record_update(self, query_id, fields, delta, old=None, now=None):
+        """列の更新をイベントとして追記し、初回返信までの時間をdelta（集計の差分）に追加
+        （old: 更新前の行、ログより前からある問い合わせの受付日時・返信の有無に使う）"""
+        now = int(now if now is not None else datetime.now().timestamp())
+        events = update_events(query_id, fields, now)
+        if not events:
+            return
+
+        with self._transaction():
+            kinds = {kind for _, _, kind, _ in events}
+            created_at = self._first_at(query_id, CREATED)
+            if created_at is None:
+                # ログより前からある問い合わせは、受付イベントを補って以降の計算に使う
+                created_at = _epoch(old.get("timestamp")) if old else None
+                if created_at is not None:
+                    self._append([(query_id, created_at, CREATED, "")])
+
+            # ログより前に返信済みの問い合わせは初回返信の日時が分からないため計上しない
+            first_response = (
+                RESPONDED in kinds and not (old and old.get("response"))
+                and self._first_at(query_id, RESPONDED) is None
+            )
+            if first_response:
+                events = [(*event[:3], FIRST_RESPONSE) if event[2] == RESPONDED else event for event in events]
+            self._append(events)
+
+        if created_at is None:
+            return
+
+        if first_response:
+            FIRST_RESPONSE_SECONDS.observe(max(now - created_at, 0))
+            delta.add_first_response(datetime.fromtimestamp(created_at), max(now - created_at, 0) / 60)
+        for _, at, kind, _ in events:
+            if kind == RESOLVED:
+                RESOLUTION_SECONDS.observe(max(at - created_at, 0))
+
+    def seed(self, rows):
+        """既存の問い合わせから受付・解決のイベントを作成（ログが空の場合の初回のみ）"""
+        with self._transaction():
+            events = [event for query_data in rows if query_data.get("query_id") for event in insert_events(query_data)]
+            self._append(events)
+        logger.info(f"既存の問い合わせからイベントログを作成しました（{len(events)}件）")
+
+    def is_empty(self):
+        """イベントがまだないか"""
+        with self._transaction():
+            return self.conn.execute("SELECT 1 FROM query_events LIMIT 1").fetchone() is None
+
+    def first_responses(self):
+        """問い合わせごとの受付日時と初回返信までの時間（分）（{問い合わせID: (受付日時, 分)}、集計の作り直し用）"""
+        with self._transaction():
+            rows = self.conn.execute(
+                f"SELECT query_id, MIN(CASE WHEN kind = {CREATED} THEN at END), "
+                f"MIN(CASE WHEN kind = {RESPONDED} AND value = ? THEN at END) FROM query_events "
+                f"WHERE kind IN ({CREATED}, {RESPONDED}) GROUP BY query_id",
+                (FIRST_RESPONSE,)
+            ).fetchall()
+        return {
+            query_id: (datetime.fromtimestamp(created_at), max(responded_at - created_at, 0) / 60)
+            for query_id, created_at, responded_at in rows
+            if created_at is not None and responded_at is not None
+        }
+
+    def history(self, query_id):
+        """問い合わせのイベントを古い順に取得（辞書のリスト）"""
+        with self._transaction():
+            rows = self.conn.execute(
+                "SELECT at, kind, value FROM query_events WHERE query_id = ? ORDER BY at, seq", (query_id,)
+            ).fetchall()
+        return [
+            {
+                "timestamp": datetime.fromtimestamp(row["at"]).strftime(TIMESTAMP_FORMAT),
+                "event": EVENT_NAMES.get(row["kind"], str(row["kind"])),
+                "value": row["value"]
+            }
+            for row in rows
+        ]
\ No newline at end of file
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+Sheets APIのクォータ管理: スプレッドシートごとの読み取り・書き込みトークンバケット
+
+Google Sheets APIの上限（既定: 1分あたり読み取り60回・書き込み60回）を超えないよう、
+リクエストの直前にトークンを取得します。トークンが足りない呼び出しは429で失敗させず、
+空くまで待機させます。待機中は優先度の高い呼び出し（取り込み）から先に通し、
+集計・検索などの低い優先度はバケットに一定量の余裕が残る場合だけ使えます。
+"""
+
+import time
+import logging
+import threading
+import functools
+import contextvars
+
+from monitoring.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Google Sheets APIのユーザーあたりの既定クォータ（1分あたり）
+DEFAULT_READ_QUOTA = 60
+DEFAULT_WRITE_QUOTA = 60
+
+# 一度に使えるトークン数（バースト分を除いた量を1分かけて補充するので、
+# どの1分間をとってもクォータを超えない）
+DEFAULT_BURST = 10
+
+# 優先度（小さいほど優先）
+INGEST = 0
+INTERACTIVE = 1
+REPORTING = 2
+PRIORITY_NAMES = {INGEST: "ingest", INTERACTIVE: "interactive", REPORTING: "reporting"}
+
+# 優先度ごとに残しておくトークンの割合（取り込み用の余裕を集計に使い切らせない）
+RESERVES = {INGEST: 0.0, INTERACTIVE: 0.2, REPORTING: 0.5}
+
+# 上位の優先度の待機が解けるのを待つ最大間隔（通知漏れの保険）
+MAX_WAIT_INTERVAL = 1.0
+
+SHEETS_PRIORITY = contextvars.ContextVar("sheets_priority", default=INTERACTIVE)
+
+QUOTA_WAIT_SECONDS = REGISTRY.histogram(
+    "sheets_quota_wait_seconds", "Sheets APIのクォータ待ち時間（秒）", ("bucket", "priority")
+)
+QUOTA_THROTTLED = REGISTRY.counter(
+    "sheets_quota_throttled_total", "スケジューラーを通過した後に429を受けた回数", ("bucket",)
+)
+
+_SCHEDULERS = {}
+_SCHEDULERS_LOCK = threading.Lock()
+
+def quota_priority(priority):
+    """コルーチン内（to_threadで実行する処理を含む）のSheets APIリクエストの優先度を設定するデコレーター"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            token = SHEETS_PRIORITY.set(priority)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                SHEETS_PRIORITY.reset(token)
+        return wrapper
+    return decorator
+
+class TokenBucket:
+    """優先度付きで待機するトークンバケット（スレッドセーフ、取得はブロッキング）"""
+
+    def __init__(self, name, per_minute, burst=DEFAULT_BURST):
+        """初期化（per_minute: 1分あたりの上限）"""
+        self.name = name
+        self.capacity = max(1, min(burst, per_minute))
+        self.rate = max(per_minute - self.capacity, 1) / 60.0  # 1秒あたりの補充数
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.waiting = {priority: 0 for priority in PRIORITY_NAMES}
+        self._condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, priority=INTERACTIVE, tokens=1):
+        """トークンを取得（足りなければ待機）し、待った秒数を返す"""
+        start = time.monotonic()
+        floor = RESERVES.get(priority, 0.0) * self.capacity
+
+        with self._condition:
+            self.waiting[priority] += 1
+            try:
+                while True:
+                    self._refill()
+                    higher_waiting = any(self.waiting[p] for p in self.waiting if p < priority)
+                    if not higher_waiting and self.tokens - tokens >= floor:
+                        self.tokens -= tokens
+                        break
+
+                    if higher_waiting:
+                        timeout = MAX_WAIT_INTERVAL
+                    else:
+                        timeout = min(max((tokens + floor - self.tokens) / self.rate, 0.001), MAX_WAIT_INTERVAL)
+                    self._condition.wait(timeout)
+            finally:
+                self.waiting[priority] -= 1
+                self._condition.notify_all()
+
+        waited = time.monotonic() - start
+        QUOTA_WAIT_SECONDS.observe(waited, bucket=self.name, priority=PRIORITY_NAMES[priority])
+        return waited
+
+    def drain(self):
+        """429を受けたときに残りのトークンを捨てる（補充を待ってから再開させる）"""
+        with self._condition:
+            self._refill()
+            self.tokens = 0.0
+            self.updated = time.monotonic()
+
+    def fill_ratio(self):
+        """バケットの充填率（1.0で満杯）"""
+        with self._condition:
+            self._refill()
+            return self.tokens / self.capacity
+
+    def waiting_count(self, priority):
+        """待機中の呼び出し数"""
+        return self.waiting[priority]
+
+class SheetsScheduler:
+    """スプレッドシート1つ分の読み取り・書き込みバケット"""
+
+    def __init__(self, spreadsheet_id, read_per_minute=DEFAULT_READ_QUOTA,
+                 write_per_minute=DEFAULT_WRITE_QUOTA, burst=DEFAULT_BURST):
+        """初期化（上限がNoneまたは0の種類は制限しない）"""
+        self.spreadsheet_id = spreadsheet_id
+        limits = {"read": read_per_minute, "write": write_per_minute}
+        self.buckets = {kind: TokenBucket(kind, limit, burst) for kind, limit in limits.items() if limit}
+
+        fill = REGISTRY.gauge(
+            "sheets_quota_fill_ratio", "Sheets APIのトークンバケットの充填率（1で満杯）", ("spreadsheet", "bucket")
+        )
+        waiting = REGISTRY.gauge(
+            "sheets_quota_waiting", "Sheets APIのクォータ待ちの呼び出し数", ("spreadsheet", "bucket", "priority")
+        )
+        for kind, bucket in self.buckets.items():
+            fill.set_function(bucket.fill_ratio, spreadsheet=spreadsheet_id, bucket=kind)
+            for priority, name in PRIORITY_NAMES.items():
+                waiting.set_function(
+                    functools.partial(bucket.waiting_count, priority),
+                    spreadsheet=spreadsheet_id, bucket=kind, priority=name
+                )
+
+    def acquire(self, kind):
+        """リクエスト1回分のトークンを取得（優先度は呼び出し元のquota_priorityに従う）"""
+        bucket = self.buckets.get(kind)
+        if bucket is None:
+            return 0.0
+        return bucket.acquire(SHEETS_PRIORITY.get())
+
+    def throttled(self, kind):
+        """スケジューラーの外で枠を使われて429になった場合（他のプロセスと共有しているなど）"""
+        QUOTA_THROTTLED.inc(bucket=kind)
+        if kind in self.buckets:
+            self.buckets[kind].drain()
+        logger.warning(f"Sheets APIのクォータ超過を検知しました（{kind}）。補充まで待機します")
+
+    def status(self):
+        """バケットの状態（充填率と優先度別の待機数）"""
+        return {
+            kind: {
+                "fill_ratio": round(bucket.fill_ratio(), 3),
+                "waiting": {name: bucket.waiting_count(priority) for priority, name in PRIORITY_NAMES.items()}
+            }
+            for kind, bucket in self.buckets.items()
+        }
+
+def get_scheduler(spreadsheet_id, read_per_minute=DEFAULT_READ_QUOTA,
+                  write_per_minute=DEFAULT_WRITE_QUOTA, burst=DEFAULT_BURST):
+    """スプレッドシートIDごとに共有するスケジューラー（同じスプレッドシートを使う処理で枠を分け合い、上限は最初の設定を使う）"""
+    with _SCHEDULERS_LOCK:
+        scheduler = _SCHEDULERS.get(spreadsheet_id)
+        if scheduler is None:
+            scheduler = SheetsScheduler(spreadsheet_id, read_per_minute, write_per_minute, burst)
+            _SCHEDULERS[spreadsheet_id] = scheduler
+        return scheduler
\ No newline at end of file
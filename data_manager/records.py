@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+問い合わせのメモリ上の保持: 直近の問い合わせを列ごとの配列に詰めて保持し、IDで引く
+
+問い合わせ1件を辞書で持つと、値の文字列オブジェクトとキーの表だけで1件あたり1KB前後になります。
+列ごとに array に詰め、カテゴリ・ステータスなど種類の少ない値は番号、日時・ツイートIDは整数、
+ユーザー名・本文・返信内容は列ごとに1本のバイト列にまとめて保持し、取り出すときにだけ文字列に戻します。
+"""
+
+import time
+import threading
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+from data_manager.storage import QUERY_COLUMNS
+from monitoring.metrics import REGISTRY
+
+# 保持する問い合わせの件数の既定値（超えた分は古い順に破棄）
+DEFAULT_QUERY_CACHE_SIZE = 1000000
+
+# 上限を超えたときにまとめて破棄する割合（破棄のたびに配列を詰め直さないよう余裕を持たせる）
+EVICTION_RATIO = 0.1
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+EPOCH = datetime(1970, 1, 1)
+ONE_SECOND = timedelta(seconds=1)
+
+# 番号に置き換える列（種類の少ない値）・整数で持つ列・バイト列で持つ列
+CODED_COLUMNS = ("platform", "category", "status", "assigned_to")
+TIME_COLUMNS = ("timestamp", "resolved_at")
+ID_COLUMNS = ("tweet_id", "reply_tweet_id")
+TEXT_COLUMNS = ("username", "content", "response")
+
+QUERY_CACHE_LOOKUPS = REGISTRY.counter("query_cache_lookups_total", "メモリ上の問い合わせの検索回数", ("result",))
+
+def _encode_time(value):
+    """日時の文字列を1970年からの秒数に変換（空は0、形式違いはNone）"""
+    if not value:
+        return 0
+    # fromisoformatは他の形式も受け付けるため、同じ文字列に戻せる形（YYYY-MM-DD HH:MM:SS）だけを変換する
+    value = str(value)
+    if len(value) != 19 or value[4] != "-" or value[7] != "-" or value[10] != " " or value[13] != ":" or value[16] != ":":
+        return None
+    try:
+        seconds = (datetime.fromisoformat(value) - EPOCH) // ONE_SECOND
+    except (TypeError, ValueError):
+        return None
+    return seconds if 0 < seconds < 2 ** 32 else None
+
+def _decode_time(seconds):
+    """1970年からの秒数を日時の文字列に戻す"""
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(seconds)) if seconds else ""
+
+def _encode_id(value):
+    """ツイートIDを整数に変換（空は0、数字以外・先頭が0の値はNone）"""
+    value = str(value or "")
+    if not value:
+        return 0
+    if not value.isdigit() or value[0] == "0" or len(value) > 19:
+        return None
+    return int(value)
+
+def seq_from_id(query_id):
+    """問い合わせID（Q001）から連番を取得（形式違いはNone）"""
+    query_id = str(query_id or "")
+    number = query_id[1:]
+    if not query_id.startswith("Q") or not number.isdigit():
+        return None
+    seq = int(number)
+    return seq if 0 < seq < 2 ** 32 and f"Q{seq:03d}" == query_id else None
+
+def _encode_text(text):
+    """文字列をバイト列に変換（Latin-1で表せる場合は1文字1バイト、それ以外はUTF-16）"""
+    try:
+        return text.encode("latin-1"), False
+    except UnicodeEncodeError:
+        return text.encode("utf-16-le", "surrogatepass"), True
+
+def _decode_text(data, wide):
+    """バイト列を文字列に戻す"""
+    return data.decode("utf-16-le", "surrogatepass") if wide else data.decode("latin-1")
+
+class CodeTable:
+    """種類の少ない文字列と番号の対応表（0は空文字列）"""
+
+    def __init__(self, values=None):
+        """初期化（values: スナップショットから戻す場合の番号順の値）"""
+        self.values = list(values or [""])
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def code(self, value):
+        """文字列の番号（初めての値は追加）"""
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+class TextColumn:
+    """文字列の列（1本のバイト列に追記し、行ごとの開始位置・長さで参照）"""
+
+    def __init__(self):
+        """初期化"""
+        self.data = bytearray()
+        self.starts = array("Q")
+        self.lengths = array("I")
+        self.wide = bytearray()
+        self.garbage = 0
+
+    def _write(self, text):
+        """バイト列の末尾に追記して(開始位置, 長さ, UTF-16か)を返す"""
+        encoded, wide = _encode_text(str(text or ""))
+        start = len(self.data)
+        self.data += encoded
+        return start, len(encoded), wide
+
+    def insert(self, index, text):
+        """index行目に挿入"""
+        start, length, wide = self._write(text)
+        self.starts.insert(index, start)
+        self.lengths.insert(index, length)
+        self.wide.insert(index, wide)
+
+    def set(self, index, text):
+        """index行目を置き換え（古い値は次に詰め直すまで残る）"""
+        self.garbage += self.lengths[index]
+        self.starts[index], self.lengths[index], self.wide[index] = self._write(text)
+        if self.garbage > len(self.data) // 2:
+            self.compact()
+
+    def raw(self, index):
+        """index行目のバイト列とUTF-16か"""
+        start = self.starts[index]
+        return bytes(self.data[start:start + self.lengths[index]]), bool(self.wide[index])
+
+    def get(self, index):
+        """index行目の文字列"""
+        return _decode_text(*self.raw(index))
+
+    def delete(self, count):
+        """先頭からcount行を削除して詰め直す"""
+        del self.starts[:count]
+        del self.lengths[:count]
+        del self.wide[:count]
+        self.compact()
+
+    def compact(self):
+        """参照されていない部分を除いてバイト列を詰め直す"""
+        data = bytearray()
+        starts = array("Q")
+        for start, length in zip(self.starts, self.lengths):
+            starts.append(len(data))
+            data += self.data[start:start + length]
+        self.data = data
+        self.starts = starts
+        self.garbage = 0
+
+    def snapshot(self):
+        """保持している内容をバイト列で取得（スナップショット用、詰め直してから取得）"""
+        self.compact()
+        return {
+            "data": bytes(self.data), "starts": self.starts.tobytes(),
+            "lengths": self.lengths.tobytes(), "wide": bytes(self.wide)
+        }
+
+    @classmethod
+    def restore(cls, state):
+        """snapshot() の内容から作成"""
+        column = cls()
+        column.data = bytearray(state["data"])
+        column.starts.frombytes(state["starts"])
+        column.lengths.frombytes(state["lengths"])
+        column.wide = bytearray(state["wide"])
+        return column
+
+    def nbytes(self):
+        """使用しているメモリ（バイト）"""
+        return len(self.data) + self.starts.itemsize * len(self.starts) + self.lengths.itemsize * len(self.lengths) + len(self.wide)
+
+class QueryRecord:
+    """問い合わせ1件（属性は固定、本文・返信内容は参照されたときに文字列に戻す）"""
+
+    __slots__ = (
+        "query_id", "timestamp", "platform", "username", "_content", "category",
+        "status", "assigned_to", "_response", "resolved_at", "tweet_id", "reply_tweet_id"
+    )
+
+    def __init__(self, **values):
+        """初期化（content・responseは(バイト列, UTF-16か)または文字列）"""
+        for column in QUERY_COLUMNS:
+            slot = f"_{column}" if column in ("content", "response") else column
+            setattr(self, slot, values.get(column, ""))
+
+    @property
+    def content(self):
+        """本文"""
+        if isinstance(self._content, tuple):
+            self._content = _decode_text(*self._content)
+        return self._content
+
+    @property
+    def response(self):
+        """返信内容"""
+        if isinstance(self._response, tuple):
+            self._response = _decode_text(*self._response)
+        return self._response
+
+    def get(self, column, default=None):
+        """辞書と同じ形で列の値を取得"""
+        return getattr(self, column, default) if column in QUERY_COLUMNS else default
+
+    def to_dict(self):
+        """問い合わせデータの辞書（他のストレージと同じ形）"""
+        return {column: getattr(self, column) for column in QUERY_COLUMNS}
+
+class QueryCache:
+    """直近の問い合わせを列ごとの配列で保持（ID順、上限を超えた分は古い順に破棄）"""
+
+    def __init__(self, capacity=DEFAULT_QUERY_CACHE_SIZE):
+        """初期化"""
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        # 読み直し中に記録・更新された問い合わせの連番（読み直していなければNone）
+        self._dirty = None
+        self.clear()
+
+        REGISTRY.gauge("query_cache_records", "メモリ上に保持している問い合わせの件数").set_function(self.__len__)
+        REGISTRY.gauge("query_cache_bytes", "メモリ上の問い合わせが使用しているメモリ（バイト）").set_function(self.nbytes)
+
+    def clear(self):
+        """すべて破棄"""
+        with self._lock:
+            self.seqs = array("I")
+            self.codes = {column: CodeTable() for column in CODED_COLUMNS}
+            self.coded = {column: array("H") for column in CODED_COLUMNS}
+            self.times = {column: array("I") for column in TIME_COLUMNS}
+            self.ids = {column: array("Q") for column in ID_COLUMNS}
+            self.texts = {column: TextColumn() for column in TEXT_COLUMNS}
+            self.arrays = {**self.coded, **self.times, **self.ids}
+            # 配列に収まらない値（形式違いの日時など）は元の文字列のまま持つ（連番 → {列名: 値}）
+            self.irregular = {}
+
+    def __len__(self):
+        return len(self.seqs)
+
+    def __contains__(self, query_id):
+        return self._index(seq_from_id(query_id)) is not None
+
+    def _index(self, seq):
+        """連番の行の位置（なければNone）"""
+        if seq is None:
+            return None
+        index = bisect_left(self.seqs, seq)
+        return index if index < len(self.seqs) and self.seqs[index] == seq else None
+
+    def _encode(self, column, value):
+        """列の値を配列に入れる値に変換（入らない値はNone）"""
+        if column in CODED_COLUMNS:
+            code = self.codes[column].code(str(value or ""))
+            return code if code < 2 ** 16 else None
+        if column in TIME_COLUMNS:
+            return _encode_time(value)
+        return _encode_id(value)
+
+    def _set(self, index, seq, column, value):
+        """index行目の列の値を更新"""
+        if column in TEXT_COLUMNS:
+            self.texts[column].set(index, value)
+            return
+
+        encoded = self._encode(column, value)
+        self.arrays[column][index] = encoded or 0
+        if encoded is None or seq in self.irregular:
+            self._set_irregular(seq, column, value, encoded)
+
+    def _set_irregular(self, seq, column, value, encoded):
+        """配列に入らない値を元の文字列のまま記録（入る値なら記録を消す）"""
+        if encoded is None:
+            self.irregular.setdefault(seq, {})[column] = value
+        elif seq in self.irregular:
+            self.irregular[seq].pop(column, None)
+            if not self.irregular[seq]:
+                del self.irregular[seq]
+
+    def put(self, query_data):
+        """問い合わせを追加（同じIDがあれば置き換え、IDの形式が違う場合はFalse）"""
+        seq = seq_from_id(query_data.get("query_id"))
+        if seq is None:
+            return False
+
+        with self._lock:
+            if self._dirty is not None:
+                self._dirty.add(seq)
+            self._put(seq, query_data)
+        return True
+
+    def _put(self, seq, query_data):
+        """put の本体（ロックを取った状態で呼ぶ）"""
+        index = self._index(seq)
+        if index is not None:
+            for column in QUERY_COLUMNS[1:]:
+                self._set(index, seq, column, query_data.get(column, ""))
+            return
+
+        index = bisect_left(self.seqs, seq)
+        self.seqs.insert(index, seq)
+        for column in QUERY_COLUMNS[1:]:
+            value = query_data.get(column, "")
+            if column in TEXT_COLUMNS:
+                self.texts[column].insert(index, value)
+                continue
+            encoded = self._encode(column, value)
+            self.arrays[column].insert(index, encoded or 0)
+            if encoded is None:
+                self._set_irregular(seq, column, value, encoded)
+
+        if len(self.seqs) > self.capacity:
+            self._evict(len(self.seqs) - self.capacity + int(self.capacity * EVICTION_RATIO))
+
+    def begin_reload(self):
+        """読み直しを開始（スプレッドシートを読む前に呼ぶ。ここからloadが終わるまでに記録・更新された問い合わせは、
+        読んだ行が古いためloadでは読み込まず、次に参照されたときにスプレッドシートから取得する）"""
+        with self._lock:
+            self._dirty = set()
+
+    def load(self, rows):
+        """すべて破棄して問い合わせを読み込み直す（スプレッドシートの全行を読んだときなど、ID順なら末尾への追加だけで済む）"""
+        self.clear()
+        for query_data in rows:
+            seq = seq_from_id(query_data.get("query_id"))
+            if seq is None:
+                continue
+            with self._lock:
+                if self._dirty is None or seq not in self._dirty:
+                    self._put(seq, query_data)
+        with self._lock:
+            self._dirty = None
+
+    def snapshot(self):
+        """保持している内容（スナップショット用、配列はバイト列）"""
+        with self._lock:
+            return {
+                "seqs": self.seqs.tobytes(),
+                "codes": {column: table.values for column, table in self.codes.items()},
+                "arrays": {column: columns.tobytes() for column, columns in self.arrays.items()},
+                "texts": {column: text.snapshot() for column, text in self.texts.items()},
+                "irregular": [[seq, values] for seq, values in self.irregular.items()]
+            }
+
+    def restore(self, state):
+        """snapshot() の内容に置き換える（起動時、記録・更新が始まる前に呼ぶ、内容が壊れていればValueError）"""
+        seqs = array("I", state["seqs"])
+        codes = {column: CodeTable(state["codes"][column]) for column in CODED_COLUMNS}
+        arrays = {}
+        for column, columns in {**self.coded, **self.times, **self.ids}.items():
+            arrays[column] = array(columns.typecode, state["arrays"][column])
+        texts = {column: TextColumn.restore(state["texts"][column]) for column in TEXT_COLUMNS}
+        if any(len(columns) != len(seqs) for columns in (*arrays.values(), *(text.starts for text in texts.values()))):
+            raise ValueError("問い合わせのスナップショットの列の長さが一致しません")
+        if any(max(columns, default=0) >= len(codes[column].values) for column, columns in arrays.items() if column in codes):
+            raise ValueError("問い合わせのスナップショットの番号が対応表にありません")
+
+        with self._lock:
+            self.seqs = seqs
+            self.codes = codes
+            self.coded = {column: arrays[column] for column in CODED_COLUMNS}
+            self.times = {column: arrays[column] for column in TIME_COLUMNS}
+            self.ids = {column: arrays[column] for column in ID_COLUMNS}
+            self.texts = texts
+            self.arrays = {**self.coded, **self.times, **self.ids}
+            self.irregular = {seq: values for seq, values in state["irregular"]}
+            if len(self.seqs) > self.capacity:
+                self._evict(len(self.seqs) - self.capacity)
+
+    def _evict(self, count):
+        """古い順にcount件を破棄"""
+        for seq in self.seqs[:count]:
+            self.irregular.pop(seq, None)
+        del self.seqs[:count]
+        for columns in self.arrays.values():
+            del columns[:count]
+        for column in self.texts.values():
+            column.delete(count)
+
+    def update(self, query_id, fields):
+        """保持している問い合わせの列を更新（保持していなければ何もしない）"""
+        seq = seq_from_id(query_id)
+        with self._lock:
+            if self._dirty is not None and seq is not None:
+                self._dirty.add(seq)
+            index = self._index(seq)
+            if index is None:
+                return False
+            for column, value in fields.items():
+                if column in QUERY_COLUMNS and column != "query_id":
+                    self._set(index, seq, column, value)
+        return True
+
+    def get(self, query_id):
+        """IDの問い合わせ（保持していなければNone）"""
+        seq = seq_from_id(query_id)
+        with self._lock:
+            index = self._index(seq)
+            if index is None:
+                QUERY_CACHE_LOOKUPS.inc(result="miss")
+                return None
+
+            values = {"query_id": query_id}
+            for column, codes in self.coded.items():
+                values[column] = self.codes[column].values[codes[index]]
+            for column, times in self.times.items():
+                values[column] = _decode_time(times[index])
+            for column, ids in self.ids.items():
+                values[column] = str(ids[index]) if ids[index] else ""
+            values["username"] = self.texts["username"].get(index)
+            values["content"] = self.texts["content"].raw(index)
+            values["response"] = self.texts["response"].raw(index)
+            values.update(self.irregular.get(seq, {}))
+
+        QUERY_CACHE_LOOKUPS.inc(result="hit")
+        return QueryRecord(**values)
+
+    def nbytes(self):
+        """使用しているメモリ（バイト、対応表・形式違いの値を除く配列の合計）"""
+        arrays = [self.seqs, *self.arrays.values()]
+        return sum(columns.itemsize * len(columns) for columns in arrays) + sum(
+            column.nbytes() for column in self.texts.values()
+        )
\ No newline at end of file
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+集計テーブル: 問い合わせを日・時間単位で事前集計し、期間分析を集計行の合算で求める
+
+問い合わせの記録・更新のたびに、受付日時の日・時間の集計行へ差分（古い値を引き、
+新しい値を足す）を反映します。期間分析は期間内の丸1日分を日単位の行、端の
+半端な時間を時間単位の行から読んで合算するため、1年分でも366行程度の読み込みで済みます。
+"""
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+import contextlib
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+from data_manager.storage import RESOLVED_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# 集計に影響する列（これ以外の列の更新では集計を読み書きしない）
+ROLLUP_COLUMNS = ("timestamp", "category", "status", "response", "resolved_at")
+
+# 解決時間の分布の区切り（分、最後の区切りを超えた分は最後の区分にまとめる）
+RESOLUTION_BINS = (15, 30, 60, 120, 240, 480, 1440, 4320)
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+DAY_FORMAT = "%Y-%m-%d"
+HOUR_FORMAT = "%Y-%m-%d %H"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollup_daily (
+    bucket TEXT PRIMARY KEY,
+    total INTEGER NOT NULL DEFAULT 0,
+    resolved INTEGER NOT NULL DEFAULT 0,
+    responded INTEGER NOT NULL DEFAULT 0,
+    resolution_sum REAL NOT NULL DEFAULT 0,
+    resolution_count INTEGER NOT NULL DEFAULT 0,
+    first_response_sum REAL NOT NULL DEFAULT 0,
+    first_response_count INTEGER NOT NULL DEFAULT 0,
+    categories TEXT NOT NULL DEFAULT '{}',
+    histogram TEXT NOT NULL DEFAULT '[]'
+);
+
+CREATE TABLE IF NOT EXISTS rollup_hourly (
+    bucket TEXT PRIMARY KEY,
+    total INTEGER NOT NULL DEFAULT 0,
+    resolved INTEGER NOT NULL DEFAULT 0,
+    responded INTEGER NOT NULL DEFAULT 0,
+    resolution_sum REAL NOT NULL DEFAULT 0,
+    resolution_count INTEGER NOT NULL DEFAULT 0,
+    first_response_sum REAL NOT NULL DEFAULT 0,
+    first_response_count INTEGER NOT NULL DEFAULT 0,
+    categories TEXT NOT NULL DEFAULT '{}',
+    histogram TEXT NOT NULL DEFAULT '[]'
+);
+"""
+
+TABLES = ("rollup_daily", "rollup_hourly")
+
+# 後から追加した列（既存の集計テーブルにはALTER TABLEで追加する）
+ADDED_COLUMNS = (("first_response_sum", "REAL"), ("first_response_count", "INTEGER"))
+
+INSERT_COLUMNS = (
+    "bucket, total, resolved, responded, resolution_sum, resolution_count, "
+    "first_response_sum, first_response_count, categories, histogram"
+)
+
+def _parse_timestamp(value):
+    """日時の文字列をdatetimeに変換（空・形式違いはNone）"""
+    try:
+        return datetime.strptime(str(value), TIMESTAMP_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+def align_range(start, end):
+    """期間[start, end)を1時間単位に広げる（集計テーブルの最小単位）"""
+    start = start.replace(minute=0, second=0, microsecond=0)
+    if end.minute or end.second or end.microsecond:
+        end = end.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    return start, end
+
+def histogram_labels():
+    """解決時間の分布の各区分の表示名"""
+    labels = []
+    lower = 0
+    for upper in RESOLUTION_BINS:
+        labels.append(f"{_format_minutes(lower)}〜{_format_minutes(upper)}")
+        lower = upper
+    labels.append(f"{_format_minutes(lower)}超")
+    return labels
+
+def _format_minutes(minutes):
+    """分を表示用の単位に変換"""
+    if minutes and minutes % 1440 == 0:
+        return f"{minutes // 1440}日"
+    if minutes and minutes % 60 == 0:
+        return f"{minutes // 60}時間"
+    return f"{minutes}分"
+
+class Rollup:
+    """1区間（または複数区間を合算した）集計値"""
+
+    def __init__(self):
+        """初期化"""
+        self.total = 0
+        self.resolved = 0
+        self.responded = 0
+        self.resolution_sum = 0.0
+        self.resolution_count = 0
+        self.first_response_sum = 0.0
+        self.first_response_count = 0
+        self.categories = {}
+        self.histogram = [0] * (len(RESOLUTION_BINS) + 1)
+
+    @classmethod
+    def from_row(cls, row):
+        """集計テーブルの行から作成"""
+        rollup = cls()
+        rollup.total = row["total"]
+        rollup.resolved = row["resolved"]
+        rollup.responded = row["responded"]
+        rollup.resolution_sum = row["resolution_sum"]
+        rollup.resolution_count = row["resolution_count"]
+        rollup.first_response_sum = row["first_response_sum"]
+        rollup.first_response_count = row["first_response_count"]
+        rollup.categories = json.loads(row["categories"])
+        histogram = json.loads(row["histogram"])
+        rollup.histogram[:len(histogram)] = histogram
+        return rollup
+
+    def add_query(self, query_data, sign=1):
+        """問い合わせ1件分を加算（sign=-1で減算）"""
+        self.total += sign
+        if query_data.get("status") in RESOLVED_STATUSES:
+            self.resolved += sign
+        if query_data.get("response"):
+            self.responded += sign
+
+        category = str(query_data.get("category") or "")
+        self.categories[category] = self.categories.get(category, 0) + sign
+
+        timestamp = _parse_timestamp(query_data.get("timestamp"))
+        resolved_at = _parse_timestamp(query_data.get("resolved_at"))
+        if timestamp is not None and resolved_at is not None:
+            minutes = (resolved_at - timestamp).total_seconds() / 60
+            self.resolution_sum += sign * minutes
+            self.resolution_count += sign
+            self.histogram[bisect_left(RESOLUTION_BINS, minutes)] += sign
+
+    def merge(self, other):
+        """別の集計値を加算"""
+        self.total += other.total
+        self.resolved += other.resolved
+        self.responded += other.responded
+        self.resolution_sum += other.resolution_sum
+        self.resolution_count += other.resolution_count
+        self.first_response_sum += other.first_response_sum
+        self.first_response_count += other.first_response_count
+        for category, count in other.categories.items():
+            self.categories[category] = self.categories.get(category, 0) + count
+        for i, count in enumerate(other.histogram):
+            self.histogram[i] += count
+
+    def values(self):
+        """集計テーブルに書き込む値（件数0のカテゴリは除く）"""
+        categories = {category: count for category, count in self.categories.items() if count}
+        return (
+            self.total, self.resolved, self.responded, self.resolution_sum, self.resolution_count,
+            self.first_response_sum, self.first_response_count, json.dumps(categories, ensure_ascii=False), json.dumps(self.histogram)
+        )
+
+class RollupDelta:
+    """集計テーブルに反映する差分（区間ごとにまとめ、一括記録でも1区間1回の書き込みにする）"""
+
+    def __init__(self):
+        """初期化"""
+        self.buckets = {table: {} for table in TABLES}
+
+    def _rollups(self, timestamp):
+        """受付日時の日・時間の区間の差分"""
+        for table, bucket in (("rollup_daily", timestamp.strftime(DAY_FORMAT)),
+                              ("rollup_hourly", timestamp.strftime(HOUR_FORMAT))):
+            rollup = self.buckets[table].get(bucket)
+            if rollup is None:
+                rollup = self.buckets[table][bucket] = Rollup()
+            yield rollup
+
+    def add_query(self, query_data, sign=1):
+        """問い合わせ1件分の差分を追加（受付日時がない・形式違いの行は集計しない）"""
+        timestamp = _parse_timestamp(query_data.get("timestamp"))
+        if timestamp is None:
+            return
+
+        for rollup in self._rollups(timestamp):
+            rollup.add_query(query_data, sign)
+
+    def add_first_response(self, timestamp, minutes):
+        """初回返信までの時間を受付日時の区間に追加（イベントログから1問い合わせにつき1回だけ）"""
+        for rollup in self._rollups(timestamp):
+            rollup.first_response_sum += minutes
+            rollup.first_response_count += 1
+
+    def replace(self, old, new):
+        """更新前の行を引き、更新後の行を足す"""
+        self.add_query(old, -1)
+        self.add_query(new)
+
+    def __bool__(self):
+        return any(self.buckets.values())
+
+class RollupStore:
+    """日・時間単位の集計テーブル（SQLite）"""
+
+    def __init__(self, conn, managed=True):
+        """初期化（managed=Falseの場合、ロックとトランザクションは接続を共有する呼び出し側が管理する）"""
+        self.conn = conn
+        self.conn.row_factory = sqlite3.Row
+        self.managed = managed
+        self._lock = threading.Lock()
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """古い集計テーブルに不足している列を追加"""
+        for table in TABLES:
+            existing = {row["name"] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            for column, column_type in ADDED_COLUMNS:
+                if column not in existing:
+                    self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type} NOT NULL DEFAULT 0")
+        self.conn.commit()
+
+    @classmethod
+    def open(cls, path):
+        """ファイルを開いて単独で使う集計テーブルを作成"""
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        return cls(sqlite3.connect(path, check_same_thread=False))
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """単独で使う場合はロックとトランザクションを取る"""
+        if not self.managed:
+            yield
+            return
+        with self._lock, self.conn:
+            yield
+
+    def apply(self, delta):
+        """差分を反映（件数が0になった区間の行は削除）"""
+        if not delta:
+            return
+        with self._transaction():
+            for table, buckets in delta.buckets.items():
+                for bucket, change in buckets.items():
+                    row = self.conn.execute(f"SELECT * FROM {table} WHERE bucket = ?", (bucket,)).fetchone()
+                    rollup = Rollup.from_row(row) if row else Rollup()
+                    rollup.merge(change)
+                    if rollup.total <= 0:
+                        self.conn.execute(f"DELETE FROM {table} WHERE bucket = ?", (bucket,))
+                        continue
+                    self.conn.execute(
+                        f"INSERT OR REPLACE INTO {table} ({INSERT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (bucket, *rollup.values())
+                    )
+
+    def rebuild(self, rows, first_responses=None):
+        """すべての問い合わせから集計し直す（first_responses: イベントログの{問い合わせID: (受付日時, 分)}）"""
+        delta = RollupDelta()
+        for query_data in rows:
+            delta.add_query(query_data)
+            first_response = (first_responses or {}).get(query_data.get("query_id"))
+            if first_response is not None:
+                delta.add_first_response(*first_response)
+
+        with self._transaction():
+            for table in TABLES:
+                self.conn.execute(f"DELETE FROM {table}")
+            for table, buckets in delta.buckets.items():
+                self.conn.executemany(
+                    f"INSERT INTO {table} ({INSERT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(bucket, *rollup.values()) for bucket, rollup in buckets.items() if rollup.total > 0]
+                )
+        logger.info(f"集計テーブルを作り直しました（{len(delta.buckets['rollup_daily'])}日分）")
+
+    def is_empty(self):
+        """集計がまだないか"""
+        with self._transaction():
+            return self.conn.execute("SELECT 1 FROM rollup_daily LIMIT 1").fetchone() is None
+
+    def combine(self, start, end):
+        """期間[start, end)の集計値（丸1日分は日単位、端は時間単位の行を合算）"""
+        start, end = align_range(start, end)
+
+        first_day = start.replace(hour=0)
+        if first_day < start:
+            first_day += timedelta(days=1)
+        last_day = end.replace(hour=0)
+
+        if first_day < last_day:
+            ranges = [
+                ("rollup_hourly", start, first_day, HOUR_FORMAT),
+                ("rollup_daily", first_day, last_day, DAY_FORMAT),
+                ("rollup_hourly", last_day, end, HOUR_FORMAT)
+            ]
+        else:
+            ranges = [("rollup_hourly", start, end, HOUR_FORMAT)]
+
+        total = Rollup()
+        with self._transaction():
+            for table, range_start, range_end, bucket_format in ranges:
+                if range_start >= range_end:
+                    continue
+                rows = self.conn.execute(
+                    f"SELECT * FROM {table} WHERE bucket >= ? AND bucket < ?",
+                    (range_start.strftime(bucket_format), range_end.strftime(bucket_format))
+                )
+                for row in rows:
+                    total.merge(Rollup.from_row(row))
+        return total
+
+    def hourly_counts(self, start, end):
+        """期間[start, end)の時間ごとのカテゴリ別件数（(YYYY-MM-DD HH, {カテゴリ: 件数}) のリスト）"""
+        with self._transaction():
+            rows = self.conn.execute(
+                "SELECT bucket, categories FROM rollup_hourly WHERE bucket >= ? AND bucket < ? ORDER BY bucket",
+                (start.strftime(HOUR_FORMAT), end.strftime(HOUR_FORMAT))
+            ).fetchall()
+        return [(row["bucket"], json.loads(row["categories"])) for row in rows]
+
+def format_range(start, end):
+    """分析期間の表示（終了は含まない日時を、含む日・時間に直す）"""
+    if start.hour == 0 and end.hour == 0:
+        return start.strftime(DAY_FORMAT), (end - timedelta(days=1)).strftime(DAY_FORMAT)
+    return start.strftime("%Y-%m-%d %H:00"), (end - timedelta(hours=1)).strftime("%Y-%m-%d %H:59")
+
+def build_analysis(rollup, start, end):
+    """集計値から分析結果を作成（データがなければNone）"""
+    total_queries = rollup.total
+    if total_queries <= 0:
+        return None
+
+    resolution_rate = round((rollup.resolved / total_queries) * 100, 1)
+
+    # カテゴリ分布（件数の多い順）
+    categories = {}
+    for category, count in sorted(rollup.categories.items(), key=lambda item: item[1], reverse=True):
+        if count > 0:
+            categories[category] = (count, round((count / total_queries) * 100, 1))
+
+    avg_first_response_time = (
+        round(rollup.first_response_sum / rollup.first_response_count, 1) if rollup.first_response_count > 0 else 0
+    )
+    avg_resolution_time = round(rollup.resolution_sum / rollup.resolution_count, 1) if rollup.resolution_count > 0 else 0
+
+    start_date, end_date = format_range(start, end)
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "total_queries": total_queries,
+        "resolved_queries": rollup.resolved,
+        "resolution_rate": resolution_rate,
+        "categories": categories,
+        "avg_first_response_time": avg_first_response_time,
+        "avg_resolution_time": avg_resolution_time,
+        "resolution_histogram": list(zip(histogram_labels(), rollup.histogram))
+    }
+
+def analyze_rows(rows, start, end):
+    """集計テーブルを使わずに全行から分析（集計テーブルを持たない保存先用）"""
+    start, end = align_range(start, end)
+    rollup = Rollup()
+    for query_data in rows:
+        timestamp = _parse_timestamp(query_data.get("timestamp"))
+        if timestamp is not None and start <= timestamp < end:
+            rollup.add_query(query_data)
+    return build_analysis(rollup, start, end)
\ No newline at end of file
@@ -7,13 +7,35 @@ Discord-X-Support-Hub
 """
 
 import os
+import asyncio
 import logging
-from datetime import datetime, timedelta
+import threading
+from datetime import datetime, timedelta, timezone
 import pandas as pd
 import gspread
 from google.oauth2.service_account import Credentials
+from google.auth.transport.requests import AuthorizedSession
+from gspread.urls import SPREADSHEETS_API_V4_BASE_URL
 from gspread_dataframe import set_with_dataframe, get_as_dataframe
 
+from data_manager.storage import StorageBackend, QUERY_COLUMNS, RESOLVED_STATUSES, analysis_range, empty_stats
+from data_manager.rollups import RollupStore, RollupDelta, ROLLUP_COLUMNS, build_analysis, analyze_rows
+from data_manager.events import EventLog
+from data_manager.records import QueryCache
+from data_manager.archive import (
+    ArchiveIndex, ARCHIVE_INDEX_SHEET, ARCHIVE_INDEX_COLUMNS, ARCHIVE_INTERVAL, DEFAULT_KEEP_MONTHS,
+    ARCHIVED_QUERIES, HOT_ROWS, archive_sheet_name, cutoff_month, select_archivable
+)
+from data_manager.quota import (
+    get_scheduler, quota_priority, INGEST, INTERACTIVE, REPORTING, DEFAULT_READ_QUOTA, DEFAULT_WRITE_QUOTA
+)
+from monitoring.metrics import timed
+from monitoring.profiler import profiled
+from monitoring.http_pool import mount_pooled_adapter
+from monitoring.resilience import (
+    CircuitBreaker, retry_call, READ_POLICY, IDEMPOTENT_WRITE_POLICY, NON_IDEMPOTENT_WRITE_POLICY
+)
+
 logger = logging.getLogger(__name__)
 
 # スコープの設定
@@ -22,15 +44,74 @@ SCOPES = [
     'https://www.googleapis.com/auth/drive'
 ]
 
-class SheetsManager:
+# 入力値として解釈させずそのまま書き込む列（19桁のツイートIDが数値に丸められるのを防ぐ）
+RAW_COLUMNS = ("tweet_id", "reply_tweet_id")
+
+# ページ単位の検索で1回に読み込む行数
+SEARCH_SCAN_ROWS = 500
+
+# Drive APIのファイル情報エンドポイント（変更検知用）
+DRIVE_FILES_URL = "https://www.googleapis.com/drive/v3/files"
+
+# メモリ上の問い合わせを読み直すか、スプレッドシートの更新日時を確認する間隔（秒）
+QUERY_CACHE_REFRESH_INTERVAL = 300
+
+# 更新日時がボット自身の最後の書き込みからこの秒数以内なら、その書き込みによる変更とみなす（時計のずれの許容）
+OWN_WRITE_SLACK = timedelta(seconds=2)
+
+class QuotaAwareClient(gspread.Client):
+    """Sheets APIへのリクエストの前にクォータのトークンを取得するgspreadクライアント"""
+
+    scheduler = None
+
+    def request(self, method, endpoint, *args, **kwargs):
+        # Drive APIは別のクォータなので対象外
+        kind = None
+        if self.scheduler is not None and endpoint.startswith(SPREADSHEETS_API_V4_BASE_URL):
+            kind = "read" if method.lower() == "get" else "write"
+            self.scheduler.acquire(kind)
+
+        try:
+            return super().request(method, endpoint, *args, **kwargs)
+        except gspread.exceptions.APIError as e:
+            if kind and e.response.status_code == 429:
+                self.scheduler.throttled(kind)
+            raise
+
+class SheetsManager(StorageBackend):
     """Google Sheetsとの連携を管理するクラス"""
 
-    def __init__(self, credentials_path):
-        """初期化"""
+    def __init__(self, credentials_path, client=None, read_quota=DEFAULT_READ_QUOTA, write_quota=DEFAULT_WRITE_QUOTA,
+                 rollup_path=None, query_cache_size=None, archive_spreadsheet_id=None, query_revision_cell=None):
+        """初期化（clientを渡した場合は認証を省略: ベンチマーク・検証用、quotaはNoneで制限なし、
+        rollup_pathを指定すると分析用の集計テーブルとイベントログをローカルに持つ、
+        query_cache_sizeを指定すると直近の問い合わせをその件数までメモリ上に保持してIDで引く、
+        archive_spreadsheet_idを指定すると月ごとのアーカイブのシートを別のスプレッドシートに作成する、
+        query_revision_cellを指定すると（例: meta!A1）更新日時の代わりにそのセルの値でシート上の編集を検知する）"""
         self.credentials_path = credentials_path
         self.spreadsheet_id = None
-        self.client = None
-        self._init_client()
+        self.client = client
+        self.read_quota = read_quota
+        self.write_quota = write_quota
+        self.scheduler = None
+        self.breaker = CircuitBreaker("sheets")
+        self.archive_spreadsheet_id = archive_spreadsheet_id
+        # 開いたスプレッドシート・シートの使い回し（毎回のメタデータ取得を省く）
+        self._spreadsheets = {}
+        self._worksheets = {}
+        self._archive_index = None
+        # 行番号を求めてから書き込む処理と、アーカイブ（queriesシートの行の削除）を排他する
+        self._row_lock = threading.Lock()
+        self.rollups = RollupStore.open(rollup_path) if rollup_path else None
+        self.events = EventLog.open(rollup_path) if rollup_path else None
+        self.query_cache = QueryCache(query_cache_size) if query_cache_size else None
+        # メモリ上の問い合わせを読み込んだ時点の変更シグナル（更新日時またはリビジョンのセルの値、変わっていれば読み直す）と、
+        # ボット自身が最後に書き込んだ日時（その書き込みで変わった更新日時では読み直さない）
+        self.query_revision_cell = query_revision_cell
+        self._cache_signal = None
+        self._last_write_at = None
+        if self.client is None:
+            self._init_client()
 
     def _init_client(self):
         """Google Sheets APIクライアントを初期化"""
@@ -39,7 +120,9 @@ class SheetsManager:
                 self.credentials_path,
                 scopes=SCOPES
             )
-            self.client = gspread.authorize(credentials)
+            # 接続を使い回すセッションを共有（TLSハンドシェイクを毎回行わない）
+            session = mount_pooled_adapter(AuthorizedSession(credentials))
+            self.client = QuotaAwareClient(auth=credentials, session=session)
             logger.info("Google Sheets APIクライアントが初期化されました")
         except Exception as e:
             logger.error(f"Google Sheets APIクライアントの初期化に失敗しました: {e}", exc_info=True)
@@ -48,51 +131,158 @@ class SheetsManager:
     def set_spreadsheet_id(self, spreadsheet_id):
         """スプレッドシートIDを設定"""
         self.spreadsheet_id = spreadsheet_id
+        self._spreadsheets = {}
+        self._worksheets = {}
+        self._archive_index = None
+
+        # 同じスプレッドシートへのリクエストはすべて共通のバケットを通す
+        self.scheduler = get_scheduler(spreadsheet_id, self.read_quota, self.write_quota)
+        self.client.scheduler = self.scheduler
+
+    def _open_spreadsheet(self, spreadsheet_id=None):
+        """スプレッドシートを開く（省略時は設定したスプレッドシート）"""
+        spreadsheet_id = spreadsheet_id or self.spreadsheet_id
+        spreadsheet = self._spreadsheets.get(spreadsheet_id)
+        if spreadsheet is None:
+            spreadsheet = self.client.open_by_key(spreadsheet_id)
+            self._spreadsheets[spreadsheet_id] = spreadsheet
+        return spreadsheet
+
+    def _worksheet(self, sheet_name, spreadsheet_id=None, create_cols=None):
+        """シートを取得（なければWorksheetNotFound、create_colsを指定した場合はその列数で作成）"""
+        key = (spreadsheet_id or self.spreadsheet_id, sheet_name)
+        worksheet = self._worksheets.get(key)
+        if worksheet is not None:
+            return worksheet
 
-    def _get_sheet(self, sheet_name):
-        """指定したシートを取得"""
+        spreadsheet = self._open_spreadsheet(spreadsheet_id)
         try:
-            spreadsheet = self.client.open_by_key(self.spreadsheet_id)
             worksheet = spreadsheet.worksheet(sheet_name)
-            return worksheet
-        except Exception as e:
+            if sheet_name == "queries" or sheet_name.startswith("queries_"):
+                self._migrate_query_header(worksheet)
+        except gspread.exceptions.WorksheetNotFound:
+            if create_cols is None:
+                raise
+            worksheet = spreadsheet.add_worksheet(sheet_name, rows=1, cols=create_cols)
+            logger.info(f"シート '{sheet_name}' を作成しました")
+        self._worksheets[key] = worksheet
+        return worksheet
+
+    @staticmethod
+    def _migrate_query_header(worksheet):
+        """問い合わせのシートの見出しに後から追加した列（tweet_id・reply_tweet_idなど）がなければ追加
+        （見出しで列を引く読み込みで、追加した列の値が空として扱われないように）"""
+        header = worksheet.row_values(1)
+        if not header or len(header) >= len(QUERY_COLUMNS):
+            return
+        if header != QUERY_COLUMNS[:len(header)]:
+            logger.warning(f"シート '{worksheet.title}' の見出しが想定と異なるため、列を追加しません: {header}")
+            return
+
+        if worksheet.col_count < len(QUERY_COLUMNS):
+            worksheet.add_cols(len(QUERY_COLUMNS) - worksheet.col_count)
+        missing = QUERY_COLUMNS[len(header):]
+        start = gspread.utils.rowcol_to_a1(1, len(header) + 1)
+        worksheet.batch_update([{"range": start, "values": [missing]}], value_input_option="RAW")
+        logger.info(f"シート '{worksheet.title}' に列を追加しました: {', '.join(missing)}")
+
+    def _get_sheet(self, sheet_name, spreadsheet_id=None):
+        """指定したシートを取得"""
+        try:
+            return self._worksheet(sheet_name, spreadsheet_id)
+        except gspread.exceptions.WorksheetNotFound as e:
+            # 通信エラーは再試行できるよう呼び出し元に送出する
             logger.error(f"シート '{sheet_name}' の取得に失敗しました: {e}", exc_info=True)
             return None
 
+    async def _call(self, policy, operation, func, *args):
+        """別スレッドで実行し、一時的なエラーはpolicyに従って再試行"""
+        result = await retry_call(lambda: asyncio.to_thread(func, *args), policy, self.breaker, operation)
+        if policy is not READ_POLICY:
+            self._last_write_at = datetime.now(timezone.utc)
+        return result
+
+    async def _append_rows_once(self, operation, sheet_name, rows):
+        """行を追加（再試行時は1列目のIDで追加済みの行を除き、二重に記録しない）"""
+        attempts = 0
+
+        def append():
+            nonlocal attempts
+            attempts += 1
+            self._append_rows(sheet_name, rows, skip_existing=attempts > 1)
+
+        await retry_call(lambda: asyncio.to_thread(append), IDEMPOTENT_WRITE_POLICY, self.breaker, operation)
+        self._last_write_at = datetime.now(timezone.utc)
+
+    def _append_rows(self, sheet_name, rows, skip_existing=False):
+        """シートに行を追加"""
+        sheet = self._get_sheet(sheet_name)
+        if not sheet:
+            raise Exception(f"{sheet_name} シートが見つかりません")
+
+        if skip_existing:
+            existing = set(sheet.col_values(1))
+            rows = [row for row in rows if str(row[0]) not in existing]
+
+        if rows:
+            sheet.append_rows(rows)
+
+    async def _record_rollups(self, rows):
+        """追加した行をイベントログ・集計テーブルに反映（失敗しても記録自体は成功として扱う）"""
+        if self.rollups is None:
+            return
+
+        queries = [dict(zip(QUERY_COLUMNS, row)) for row in rows]
+        delta = RollupDelta()
+        for query_data in queries:
+            delta.add_query(query_data)
+        try:
+            await asyncio.to_thread(self.events.record_inserts, queries)
+            await asyncio.to_thread(self.rollups.apply, delta)
+        except Exception as e:
+            logger.error(f"集計テーブルの更新に失敗しました（!analyze rebuild で作り直せます）: {e}", exc_info=True)
+
+    def _cache_rows(self, rows):
+        """追加した行をメモリ上に保持"""
+        if self.query_cache is not None:
+            for row in rows:
+                self.query_cache.put(dict(zip(QUERY_COLUMNS, row)))
+
+    def _record_updates(self, fields, old_rows):
+        """更新した問い合わせをイベントログ・集計テーブルに反映（old_rows: 問い合わせID→更新前の行、
+        集計に影響しない列の更新ではNone）、失敗しても更新自体は成功として扱う"""
+        if self.rollups is None:
+            return
+
+        delta = RollupDelta()
+        now = datetime.now().timestamp()
+        try:
+            for query_id, old in old_rows.items():
+                if old is not None:
+                    delta.replace(old, dict(old, **fields))
+                self.events.record_update(query_id, fields, delta, old, now)
+            self.rollups.apply(delta)
+        except Exception as e:
+            logger.error(f"集計テーブルの更新に失敗しました（!analyze rebuild で作り直せます）: {e}", exc_info=True)
+
+    @timed("sheets_operation", operation="log_query")
+    @profiled("sheets.log_query")
+    @quota_priority(INGEST)
     async def log_query(self, query_data):
         """問い合わせデータをスプレッドシートに記録"""
         try:
-            sheet = self._get_sheet("queries")
-            if not sheet:
-                raise Exception("queries シートが見つかりません")
-
-            # 最新の問い合わせIDを取得
-            existing_ids = sheet.col_values(1)[1:]  # ヘッダーを除く
-            if existing_ids:
-                last_id = existing_ids[-1]
-                query_num = int(last_id.replace("Q", "")) + 1
-            else:
-                query_num = 1
-
-            # 新しい問い合わせIDを生成
-            query_id = f"Q{query_num:03d}"
-
-            # スプレッドシートに追加するデータを準備
-            row_data = [
-                query_id,
-                query_data.get("timestamp", datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-                query_data.get("platform", "X"),
-                query_data.get("username", "不明"),
-                query_data.get("content", ""),
-                query_data.get("category", "general"),
-                query_data.get("status", "未対応"),
-                "",  # assigned_to
-                "",  # response
-                ""   # resolved_at
-            ]
-
-            # スプレッドシートに追加
-            sheet.append_row(row_data)
+            # IDが決まっている場合（別ストレージからのミラー）はそのまま使う
+            query_id = query_data.get("query_id")
+            if not query_id:
+                # 新しい問い合わせIDを生成
+                query_num = await self._call(READ_POLICY, "next_query_number", self._next_query_number)
+                query_id = f"Q{query_num:03d}"
+
+            # スプレッドシートに追加（クォータ待ちでイベントループを止めないよう別スレッドで実行）
+            row = self._query_row(query_id, query_data)
+            await self._append_rows_once("log_query", "queries", [row])
+            await self._record_rollups([row])
+            self._cache_rows([row])
 
             logger.info(f"問い合わせ {query_id} をスプレッドシートに記録しました")
             return query_id
@@ -101,23 +291,75 @@ class SheetsManager:
             logger.error(f"問い合わせの記録に失敗しました: {e}", exc_info=True)
             raise
 
-    async def update_assigned(self, query_id, assigned_to):
-        """担当者を更新"""
+    @timed("sheets_operation", operation="log_queries")
+    @profiled("sheets.log_queries")
+    @quota_priority(INGEST)
+    async def log_queries(self, queries):
+        """複数の問い合わせを1回の追記で記録"""
         try:
-            sheet = self._get_sheet("queries")
-            if not sheet:
-                raise Exception("queries シートが見つかりません")
+            # IDの採番は最初に1回だけ行う
+            query_num = None
+            query_ids = []
+            rows = []
+            for query_data in queries:
+                query_id = query_data.get("query_id")
+                if not query_id:
+                    if query_num is None:
+                        query_num = await self._call(READ_POLICY, "next_query_number", self._next_query_number)
+                    query_id = f"Q{query_num:03d}"
+                    query_num += 1
+                query_ids.append(query_id)
+                rows.append(self._query_row(query_id, query_data))
+
+            if rows:
+                await self._append_rows_once("log_queries", "queries", rows)
+                await self._record_rollups(rows)
+                self._cache_rows(rows)
+
+            logger.info(f"{len(query_ids)}件の問い合わせをスプレッドシートに記録しました")
+            return query_ids
 
-            # IDの行を検索
-            cell = sheet.find(query_id)
-            if not cell:
-                raise Exception(f"問い合わせ {query_id} が見つかりません")
-
-            # assigned_to列（8列目）を更新
-            sheet.update_cell(cell.row, 8, assigned_to)
+        except Exception as e:
+            logger.error(f"問い合わせの一括記録に失敗しました: {e}", exc_info=True)
+            raise
 
-            # status列（7列目）を「対応中」に更新
-            sheet.update_cell(cell.row, 7, "対応中")
+    def _next_query_number(self):
+        """次の問い合わせ番号（最終行のID + 1）"""
+        sheet = self._get_sheet("queries")
+        if not sheet:
+            raise Exception("queries シートが見つかりません")
+
+        existing_ids = sheet.col_values(1)[1:]  # ヘッダーを除く
+        last_number = int(existing_ids[-1].replace("Q", "")) if existing_ids else 0
+        # すべての行をアーカイブに移した後も番号を使い回さない
+        return max(last_number, self._load_archive_index().last_seq()) + 1
+
+    def _query_row(self, query_id, query_data):
+        """スプレッドシートに追加する行データ"""
+        return [
+            query_id,
+            query_data.get("timestamp", datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+            query_data.get("platform", "X"),
+            query_data.get("username", "不明"),
+            query_data.get("content", ""),
+            query_data.get("category", "general"),
+            query_data.get("status", "未対応"),
+            query_data.get("assigned_to", ""),
+            query_data.get("response", ""),
+            query_data.get("resolved_at", ""),
+            # ツイートIDは19桁あり数値にすると丸められるため文字列で書き込む
+            str(query_data.get("tweet_id") or ""),
+            str(query_data.get("reply_tweet_id") or "")
+        ]
+
+    @timed("sheets_operation", operation="update_assigned")
+    @profiled("sheets.update_assigned")
+    @quota_priority(INTERACTIVE)
+    async def update_assigned(self, query_id, assigned_to):
+        """担当者を更新"""
+        try:
+            # assigned_to列（8列目）を更新し、status列（7列目）を「対応中」に更新
+            await self._update_cells("update_assigned", query_id, [(8, assigned_to), (7, "対応中")])
 
             logger.info(f"問い合わせ {query_id} の担当者を {assigned_to} に更新しました")
             return True
@@ -126,20 +368,14 @@ class SheetsManager:
             logger.error(f"担当者の更新に失敗しました: {e}", exc_info=True)
             raise
 
+    @timed("sheets_operation", operation="update_response")
+    @profiled("sheets.update_response")
+    @quota_priority(INTERACTIVE)
     async def update_response(self, query_id, response):
         """返信内容を更新"""
         try:
-            sheet = self._get_sheet("queries")
-            if not sheet:
-                raise Exception("queries シートが見つかりません")
-
-            # IDの行を検索
-            cell = sheet.find(query_id)
-            if not cell:
-                raise Exception(f"問い合わせ {query_id} が見つかりません")
-
             # response列（9列目）を更新
-            sheet.update_cell(cell.row, 9, response)
+            await self._update_cells("update_response", query_id, [(9, response)])
 
             logger.info(f"問い合わせ {query_id} の返信内容を更新しました")
             return True
@@ -148,20 +384,14 @@ class SheetsManager:
             logger.error(f"返信内容の更新に失敗しました: {e}", exc_info=True)
             raise
 
+    @timed("sheets_operation", operation="update_status")
+    @profiled("sheets.update_status")
+    @quota_priority(INTERACTIVE)
     async def update_status(self, query_id, status):
         """ステータスを更新"""
         try:
-            sheet = self._get_sheet("queries")
-            if not sheet:
-                raise Exception("queries シートが見つかりません")
-
-            # IDの行を検索
-            cell = sheet.find(query_id)
-            if not cell:
-                raise Exception(f"問い合わせ {query_id} が見つかりません")
-
             # status列（7列目）を更新
-            sheet.update_cell(cell.row, 7, status)
+            await self._update_cells("update_status", query_id, [(7, status)])
 
             logger.info(f"問い合わせ {query_id} のステータスを {status} に更新しました")
             return True
@@ -170,21 +400,15 @@ class SheetsManager:
             logger.error(f"ステータスの更新に失敗しました: {e}", exc_info=True)
             raise
 
-    async def update_resolved_time(self, query_id):
-        """解決時間を更新"""
+    @timed("sheets_operation", operation="update_resolved_time")
+    @profiled("sheets.update_resolved_time")
+    @quota_priority(INTERACTIVE)
+    async def update_resolved_time(self, query_id, resolved_at=None):
+        """解決時間を更新（resolved_at: 省略時は現在時刻）"""
         try:
-            sheet = self._get_sheet("queries")
-            if not sheet:
-                raise Exception("queries シートが見つかりません")
-
-            # IDの行を検索
-            cell = sheet.find(query_id)
-            if not cell:
-                raise Exception(f"問い合わせ {query_id} が見つかりません")
-
             # resolved_at列（10列目）を更新
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            sheet.update_cell(cell.row, 10, current_time)
+            current_time = resolved_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            await self._update_cells("update_resolved_time", query_id, [(10, current_time)])
 
             logger.info(f"問い合わせ {query_id} の解決時間を更新しました")
             return True
@@ -193,325 +417,839 @@ class SheetsManager:
             logger.error(f"解決時間の更新に失敗しました: {e}", exc_info=True)
             raise
 
-    async def get_query(self, query_id):
-        """問い合わせデータを取得"""
-        try:
-            sheet = self._get_sheet("queries")
+    async def _update_cells(self, operation, query_id, cells):
+        """IDの行のセルを更新し、メモリ上の問い合わせと集計に反映（cells: (列番号, 値) のリスト）"""
+        # 再試行しても差分が正しくなるよう、更新前の行は最初に読んだものを使う
+        previous = {}
+        await self._call(IDEMPOTENT_WRITE_POLICY, operation, self._update_query_cells, query_id, cells, previous)
+        fields = {QUERY_COLUMNS[col - 1]: value for col, value in cells}
+        await asyncio.to_thread(self._apply_updates, fields, {query_id: previous.get(query_id)})
+
+    def _update_query_cells(self, query_id, cells, previous):
+        """IDの行を検索してセルを1回の書き込みで更新（previous: 更新前の行、まだなければ読んで記録する）"""
+        fields = {QUERY_COLUMNS[col - 1]: value for col, value in cells}
+        with self._row_lock:
+            # IDの行を検索（アーカイブに移した問い合わせはそのシートを更新）
+            sheet, row = self._locate(query_id)
             if not sheet:
-                raise Exception("queries シートが見つかりません")
+                raise Exception(f"問い合わせ {query_id} が見つかりません")
 
-            # ヘッダーを取得
-            headers = sheet.row_values(1)
+            # 集計に影響する列を更新する場合だけ、差分を求めるため更新前の行を読む
+            if self.rollups is not None and query_id not in previous and any(column in ROLLUP_COLUMNS for column in fields):
+                previous[query_id] = dict(zip(QUERY_COLUMNS, sheet.row_values(row)))
+
+            self._write_cells(sheet, {row: fields})
+
+    def _apply_updates(self, fields, old_rows):
+        """更新した問い合わせをメモリ上の問い合わせ・イベントログ・集計テーブルに反映"""
+        if self.query_cache is not None:
+            for query_id in old_rows:
+                self.query_cache.update(query_id, fields)
+        self._record_updates(fields, old_rows)
+
+    @staticmethod
+    def _write_cells(sheet, rows):
+        """行ごとのセル（rows: 行番号→{列名: 値}）を値の解釈ごとに1回のbatch_updateで書き込む"""
+        data = {"USER_ENTERED": [], "RAW": []}
+        for row, fields in rows.items():
+            for column, value in fields.items():
+                cell = gspread.utils.rowcol_to_a1(row, QUERY_COLUMNS.index(column) + 1)
+                # ID列以外はupdate_cellと同じく入力値として解釈させる
+                option = "RAW" if column in RAW_COLUMNS else "USER_ENTERED"
+                data[option].append({"range": cell, "values": [[value]]})
+
+        for option, cells in data.items():
+            if cells:
+                sheet.batch_update(cells, value_input_option=option)
+
+    @timed("sheets_operation", operation="update_queries")
+    @profiled("sheets.update_queries")
+    @quota_priority(INTERACTIVE)
+    async def update_queries(self, query_ids, fields):
+        """複数の問い合わせを1回のbatch_updateで更新"""
+        try:
+            # 再試行しても差分が正しくなるよう、更新前の行は最初に読んだものを使う
+            previous = {}
+            updated = await self._call(
+                IDEMPOTENT_WRITE_POLICY, "update_queries", self._batch_update_queries, query_ids, fields, previous
+            )
+            if updated:
+                await asyncio.to_thread(self._apply_updates, fields, {query_id: previous.get(query_id) for query_id in updated})
+            return updated
+
+        except Exception as e:
+            logger.error(f"問い合わせの一括更新に失敗しました: {e}", exc_info=True)
+            raise
+
+    def _batch_update_queries(self, query_ids, fields, previous):
+        """ID列を1回読み、対象セルを1回の書き込みで更新し、更新できたIDのリストを返す
+        （previous: 問い合わせID→更新前の行、まだなければ読んで記録する）"""
+        unknown = [column for column in fields if column not in QUERY_COLUMNS or column == "query_id"]
+        if unknown:
+            raise ValueError(f"更新できない列です: {', '.join(unknown)}")
+
+        with self._row_lock:
+            return self._batch_update_rows(query_ids, fields, previous)
+
+    def _batch_update_rows(self, query_ids, fields, previous):
+        """_batch_update_queries の本体（行の削除と排他した状態で呼ぶ）"""
+        sheet = self._get_sheet("queries")
+        if not sheet:
+            raise Exception("queries シートが見つかりません")
+
+        tracked = self.rollups is not None and any(column in ROLLUP_COLUMNS for column in fields)
+        query_ids = list(dict.fromkeys(query_ids))
+        found = self._batch_update_sheet(sheet, query_ids, fields, tracked, previous)
+
+        # queriesシートにない問い合わせは、索引から引いたアーカイブのシートごとにまとめて更新
+        index = self._load_archive_index()
+        for entry in index.months()[::-1]:
+            archived_ids = [query_id for query_id in query_ids if query_id not in found and index.covers(entry, query_id)]
+            archive = self._get_sheet(entry["sheet"], entry["spreadsheet_id"]) if archived_ids else None
+            if archive:
+                found.update(self._batch_update_sheet(archive, archived_ids, fields, tracked, previous))
+
+        updated = [query_id for query_id in query_ids if query_id in found]
+        logger.info(f"{len(updated)}件の問い合わせを一括更新しました")
+        return updated
+
+    def _batch_update_sheet(self, sheet, query_ids, fields, tracked, previous):
+        """シートのID列を1回読み、見つかった問い合わせのセルを1回の書き込みで更新して見つかったIDの集合を返す
+        （trackedの場合は更新前の行をpreviousに記録、再試行では最初に読んだ行を残す）"""
+        # 集計に影響する列を更新する場合は、差分を求めるためID列の代わりに全行を読む
+        if tracked:
+            values = sheet.get_all_values()
+            all_rows = {row_values[0]: dict(zip(QUERY_COLUMNS, row_values)) for row_values in values[1:] if row_values}
+            ids = [row_values[0] if row_values else "" for row_values in values]
+        else:
+            ids = sheet.col_values(1)
+
+        # IDから行番号を引く索引（1行目はヘッダー）
+        rows = {query_id: row for row, query_id in enumerate(ids, start=1) if row > 1}
+
+        found = set()
+        updates = {}
+        for query_id in query_ids:
+            row = rows.get(query_id)
+            if row is None:
+                continue
+            found.add(query_id)
+            if tracked:
+                previous.setdefault(query_id, all_rows[query_id])
+            updates[row] = fields
+
+        self._write_cells(sheet, updates)
+        return found
+
+    @timed("sheets_operation", operation="find_query_ids")
+    @profiled("sheets.find_query_ids")
+    @quota_priority(INTERACTIVE)
+    async def find_query_ids(self, filters):
+        """条件に一致する問い合わせIDを取得"""
+        records = await self._call(READ_POLICY, "find_query_ids", self._fetch_records, "queries")
+
+        def matches(record):
+            for column, value in filters.items():
+                if column == "username":
+                    if value.lower() not in str(record.get(column, "")).lower():
+                        return False
+                elif record.get(column, "") != value:
+                    return False
+            return True
 
-            # IDの行を検索
-            cell = sheet.find(query_id)
-            if not cell:
-                return None
+        return [record["query_id"] for record in records if record.get("query_id") and matches(record)]
 
-            # 行データを取得
-            row_data = sheet.row_values(cell.row)
-
-            # 辞書形式でデータを返す
-            query_data = {}
-            for i, header in enumerate(headers):
-                if i < len(row_data):
-                    query_data[header] = row_data[i]
-                else:
-                    query_data[header] = ""
+    @timed("sheets_operation", operation="get_query")
+    @profiled("sheets.get_query")
+    @quota_priority(INTERACTIVE)
+    async def get_query(self, query_id, fresh=False):
+        """問い合わせデータを取得（メモリ上にあればスプレッドシートを読まない、
+        fresh: 手動での編集を確実に反映するため、メモリ上にあってもスプレッドシートから読む）"""
+        if self.query_cache is not None and not fresh:
+            record = self.query_cache.get(query_id)
+            if record is not None:
+                return record.to_dict()
 
+        try:
+            query_data = await self._call(READ_POLICY, "get_query", self._fetch_query, query_id)
+            if query_data and self.query_cache is not None:
+                self.query_cache.put(query_data)
             return query_data
 
         except Exception as e:
             logger.error(f"問い合わせデータの取得に失敗しました: {e}", exc_info=True)
             return None
 
-    async def get_templates(self):
-        """テンプレートデータを取得"""
+    def _locate(self, query_id):
+        """IDの行を検索（queriesシートになければ索引から引いたアーカイブのシート、見つからなければ (None, None)）"""
+        sheet = self._get_sheet("queries")
+        if not sheet:
+            raise Exception("queries シートが見つかりません")
+
+        cell = sheet.find(query_id)
+        if cell:
+            return sheet, cell.row
+
+        for entry in self._load_archive_index().route(query_id):
+            archive = self._get_sheet(entry["sheet"], entry["spreadsheet_id"])
+            cell = archive.find(query_id, in_column=1) if archive else None
+            if cell:
+                return archive, cell.row
+        return None, None
+
+    def _fetch_query(self, query_id):
+        """IDの行を辞書形式で読み込む"""
+        # IDの行を検索
+        sheet, row = self._locate(query_id)
+        if not sheet:
+            return None
+
+        # ヘッダーと行データを取得
+        headers = sheet.row_values(1)
+        row_data = sheet.row_values(row)
+
+        # 辞書形式でデータを返す
+        query_data = {}
+        for i, header in enumerate(headers):
+            if i < len(row_data):
+                query_data[header] = row_data[i]
+            else:
+                query_data[header] = ""
+
+        return query_data
+
+    @timed("sheets_operation", operation="get_all_queries")
+    @profiled("sheets.get_all_queries")
+    @quota_priority(REPORTING)
+    async def get_all_queries(self):
+        """すべての問い合わせを取得（アーカイブのシートを含む）"""
+        return await self._call(READ_POLICY, "get_all_queries", self._fetch_all_records)
+
+    @quota_priority(REPORTING)
+    async def load_query_cache(self, signal=None):
+        """queriesシートの全行を読んでメモリ上の問い合わせを作り直す（起動時・シートが変更されたとき、
+        signal: 読む前に取得した変更シグナル。次の変更の確認に使う）"""
+        if self.query_cache is None:
+            return False
         try:
-            sheet = self._get_sheet("templates")
-            if not sheet:
-                raise Exception("templates シートが見つかりません")
+            # 読み込み中に書き込んだ問い合わせは、読み込んだ古い行で上書きしない
+            self.query_cache.begin_reload()
+            rows = await self._call(READ_POLICY, "load_query_cache", self._fetch_records, "queries")
+            await asyncio.to_thread(self.query_cache.load, rows)
+            self._cache_signal = signal
+            logger.info(f"{len(self.query_cache)}件の問い合わせをメモリ上に読み込みました")
+            return True
+        except Exception as e:
+            logger.error(f"問い合わせのメモリ上への読み込みに失敗しました: {e}", exc_info=True)
+            return False
 
-            # ヘッダーを取得
-            headers = sheet.row_values(1)
+    async def _cache_change_signal(self):
+        """シート上の編集を検知するシグナル（リビジョンのセルの値、指定がなければスプレッドシートの更新日時）"""
+        if self.query_revision_cell:
+            sheet_name, _, cell_label = self.query_revision_cell.rpartition("!")
+            return await self.get_cell_value(sheet_name or "queries", cell_label)
+        return await self.get_modified_time()
 
-            # すべての行データを取得
-            all_data = sheet.get_all_values()[1:]  # ヘッダーを除く
+    def _is_own_change(self, modified_time):
+        """更新日時がボット自身の最後の書き込みによるものか（その後にシート上で編集されていない）"""
+        if self._last_write_at is None:
+            return False
+        try:
+            modified_at = datetime.fromisoformat(modified_time.replace("Z", "+00:00"))
+        except (AttributeError, ValueError):
+            return False
+        return modified_at <= self._last_write_at + OWN_WRITE_SLACK
 
-            # テンプレートのリストを作成
-            templates = []
-            for row in all_data:
-                template = {}
-                for i, header in enumerate(headers):
-                    if i < len(row):
-                        template[header] = row[i]
-                    else:
-                        template[header] = ""
-                templates.append(template)
+    async def refresh_query_cache_if_changed(self):
+        """シート上で直接編集されていれば、メモリ上の問い合わせを読み直す
+        （ボット自身の記録・更新はすでに反映しているため、それで変わった更新日時では読み直さない）"""
+        signal = await self._cache_change_signal()
+        if signal is not None and signal == self._cache_signal:
+            return False
 
-            return templates
+        # リビジョンのセルは手動の編集でしか変わらない。更新日時は最後の変更がボットの書き込みなら記録だけ更新する
+        own_change = not self.query_revision_cell and signal is not None and self._is_own_change(signal)
+        if own_change and self._cache_signal is not None:
+            self._cache_signal = signal
+            return False
 
-        except Exception as e:
-            logger.error(f"テンプレートデータの取得に失敗しました: {e}", exc_info=True)
-            return []
+        # シグナルが取得できない場合は変更の有無が分からないため読み直す
+        return await self.load_query_cache(signal)
+
+    async def query_cache_refresh_loop(self, interval=QUERY_CACHE_REFRESH_INTERVAL):
+        """バックグラウンドでスプレッドシートの変更を監視し、メモリ上の問い合わせを読み直すタスク（初回はすぐに読み込む）"""
+        logger.info(f"問い合わせのメモリ上への読み直しの監視を開始しました（{interval}秒間隔）")
+        while True:
+            try:
+                await self.refresh_query_cache_if_changed()
+
+            except Exception as e:
+                logger.error(f"問い合わせの変更の確認中にエラーが発生しました: {e}", exc_info=True)
+
+            await asyncio.sleep(interval)
+
+    async def snapshot(self):
+        """スナップショットに保存する状態（アーカイブの索引・メモリ上の問い合わせと、保存時点の更新日時）"""
+        if not self.spreadsheet_id:
+            return None
+        modified_time = await self.get_modified_time()
+        if modified_time is None:
+            return None
+
+        return {
+            "spreadsheet_id": self.spreadsheet_id,
+            "modified_time": modified_time,
+            "archive_index": self._archive_index.to_values() if self._archive_index is not None else None,
+            "query_cache": await asyncio.to_thread(self.query_cache.snapshot) if self.query_cache is not None else None
+        }
+
+    async def restore_snapshot(self, state):
+        """スナップショットの状態を復元（保存後にスプレッドシートが更新されていれば使わずFalse）"""
+        if not state or state.get("spreadsheet_id") != self.spreadsheet_id:
+            return False
+
+        modified_time = await self.get_modified_time()
+        if modified_time is None or modified_time != state.get("modified_time"):
+            logger.info("スナップショットの保存後にスプレッドシートが更新されているため、シートから読み込みます")
+            return False
 
-    async def update_stats(self):
-        """統計情報を更新"""
         try:
-            queries_sheet = self._get_sheet("queries")
-            stats_sheet = self._get_sheet("stats")
+            if self.query_cache is not None:
+                if state.get("query_cache") is None:
+                    return False
+                await asyncio.to_thread(self.query_cache.restore, state["query_cache"])
+            if state.get("archive_index") is not None:
+                self._archive_index = ArchiveIndex.from_values(state["archive_index"])
+            self._cache_signal = modified_time if not self.query_revision_cell else await self._cache_change_signal()
+
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"スナップショットの問い合わせを復元できませんでした: {e}")
+            return False
 
-            if not queries_sheet or not stats_sheet:
-                raise Exception("必要なシートが見つかりません")
+        logger.info(
+            f"スナップショットから復元しました（問い合わせ{len(self.query_cache) if self.query_cache is not None else 0}件、"
+            f"アーカイブ{len(self._archive_index) if self._archive_index is not None else 0}シート）"
+        )
+        return True
+
+    def _fetch_all_records(self, since=None):
+        """アーカイブのシート（since: この受付月（YYYYMM）以降だけ）とqueriesシートの全行を古い順に読み込む"""
+        records = []
+        for entry in self._load_archive_index().months(since):
+            records.extend(self._fetch_records(entry["sheet"], entry["spreadsheet_id"]))
+        records.extend(self._fetch_records("queries"))
+        return records
+
+    def _fetch_records(self, sheet_name, spreadsheet_id=None):
+        """シートの全行を辞書のリストとして読み込む"""
+        sheet = self._get_sheet(sheet_name, spreadsheet_id)
+        if not sheet:
+            raise Exception(f"{sheet_name} シートが見つかりません")
+
+        # すべての行データを取得（1行目はヘッダー）
+        all_values = sheet.get_all_values()
+        if not all_values:
+            return []
 
-            # 今日の日付
-            today = datetime.now().strftime("%Y-%m-%d")
+        headers = all_values[0]
 
-            # 今日のデータがあるか確認
-            date_cell = stats_sheet.find(today)
+        records = []
+        for row in all_values[1:]:
+            record = {}
+            for i, header in enumerate(headers):
+                if i < len(row):
+                    record[header] = row[i]
+                else:
+                    record[header] = ""
+            records.append(record)
 
-            # クエリデータを取得
-            query_data = get_as_dataframe(queries_sheet)
+        return records
 
-            # 今日の問い合わせ数をカウント
-            today_queries = query_data[query_data['timestamp'].str.startswith(today)]
-            total_queries = len(today_queries)
+    @timed("sheets_operation", operation="get_templates")
+    @profiled("sheets.get_templates")
+    @quota_priority(INTERACTIVE)
+    async def get_templates(self):
+        """テンプレートデータを取得"""
+        try:
+            # gspreadの同期通信はイベントループを止めないよう別スレッドで実行
+            return await self._call(READ_POLICY, "get_templates", self._fetch_records, "templates")
 
-            # 解決済みの問い合わせ数
-            resolved_queries = len(today_queries[today_queries['status'].isin(['完了', 'クローズ'])])
+        except Exception as e:
+            logger.error(f"テンプレートデータの取得に失敗しました: {e}", exc_info=True)
+            return []
 
-            # 平均応答時間を計算（簡易版）
-            avg_response_time = 0
-            resolved_count = 0
+    @timed("sheets_operation", operation="add_template")
+    @profiled("sheets.add_template")
+    @quota_priority(INTERACTIVE)
+    async def add_template(self, category, template_id, name, template_text):
+        """テンプレートを追加"""
+        # IDが2列目のため追加済みかを確かめられない。処理されていないことが確実なエラーだけ再試行する
+        await self._call(
+            NON_IDEMPOTENT_WRITE_POLICY, "add_template",
+            self._append_rows, "templates", [[category, template_id, name, template_text]]
+        )
+        return True
+
+    @timed("sheets_operation", operation="delete_template")
+    @profiled("sheets.delete_template")
+    @quota_priority(INTERACTIVE)
+    async def delete_template(self, template_id):
+        """テンプレートを削除"""
+        # 毎回IDで行を探し直すため、再試行しても別の行は消さない
+        return await self._call(IDEMPOTENT_WRITE_POLICY, "delete_template", self._delete_template, template_id)
+
+    def _delete_template(self, template_id):
+        """テンプレートIDの行を削除"""
+        sheet = self._get_sheet("templates")
+        if not sheet:
+            raise Exception("templates シートが見つかりません")
+
+        # テンプレートIDを検索
+        cell = sheet.find(template_id)
+        if not cell:
+            return False
 
-            for idx, row in today_queries.iterrows():
-                if pd.notna(row['timestamp']) and pd.notna(row['resolved_at']) and row['resolved_at']:
-                    try:
-                        start_time = datetime.strptime(row['timestamp'], "%Y-%m-%d %H:%M:%S")
-                        end_time = datetime.strptime(row['resolved_at'], "%Y-%m-%d %H:%M:%S")
-                        response_time = (end_time - start_time).total_seconds() / 60  # 分単位
-                        avg_response_time += response_time
-                        resolved_count += 1
-                    except:
-                        pass
+        # 行を削除
+        sheet.delete_rows(cell.row)
+        return True
 
-            if resolved_count > 0:
-                avg_response_time = round(avg_response_time / resolved_count, 1)
+    @timed("sheets_operation", operation="get_modified_time")
+    @profiled("sheets.get_modified_time")
+    async def get_modified_time(self):
+        """スプレッドシートの最終更新日時をDrive APIから取得"""
+        try:
+            return await self._call(READ_POLICY, "get_modified_time", self._fetch_modified_time)
 
-            # 最も多いカテゴリを特定
-            if not today_queries.empty:
-                top_category = today_queries['category'].value_counts().idxmax()
-            else:
-                top_category = "N/A"
-
-            # 統計データを更新または追加
-            if date_cell:
-                # 既存の行を更新
-                stats_sheet.update_cell(date_cell.row, 2, total_queries)
-                stats_sheet.update_cell(date_cell.row, 3, resolved_queries)
-                stats_sheet.update_cell(date_cell.row, 4, avg_response_time)
-                stats_sheet.update_cell(date_cell.row, 5, top_category)
-            else:
-                # 新しい行を追加
-                stats_sheet.append_row([today, total_queries, resolved_queries, avg_response_time, top_category])
+        except Exception as e:
+            logger.warning(f"スプレッドシートの更新日時の取得に失敗しました: {e}")
+            return None
 
-            logger.info(f"{today} の統計情報を更新しました")
-            return True
+    def _fetch_modified_time(self):
+        """Drive APIのmodifiedTimeを取得"""
+        response = self.client.request(
+            "get",
+            f"{DRIVE_FILES_URL}/{self.spreadsheet_id}",
+            params={"fields": "modifiedTime", "supportsAllDrives": True}
+        )
+        return response.json().get("modifiedTime")
+
+    @timed("sheets_operation", operation="get_cell_value")
+    @profiled("sheets.get_cell_value")
+    @quota_priority(INTERACTIVE)
+    async def get_cell_value(self, sheet_name, cell_label):
+        """指定シートのセルの値を1つだけ取得"""
+        try:
+            return await self._call(READ_POLICY, "get_cell_value", self._fetch_cell_value, sheet_name, cell_label)
+
+        except Exception as e:
+            logger.warning(f"セル {sheet_name}!{cell_label} の取得に失敗しました: {e}")
+            return None
+
+    def _fetch_cell_value(self, sheet_name, cell_label):
+        """セルの値を取得"""
+        sheet = self._get_sheet(sheet_name)
+        if not sheet:
+            raise Exception(f"{sheet_name} シートが見つかりません")
+
+        return sheet.acell(cell_label).value
+
+    @timed("sheets_operation", operation="update_stats")
+    @profiled("sheets.update_stats")
+    @quota_priority(REPORTING)
+    async def update_stats(self):
+        """統計情報を更新"""
+        try:
+            # 今日の行を探し直してから書き込むため、再試行しても行は重複しない
+            return await self._call(IDEMPOTENT_WRITE_POLICY, "update_stats", self._update_stats)
 
         except Exception as e:
             logger.error(f"統計情報の更新に失敗しました: {e}", exc_info=True)
             return False
 
+    def _update_stats(self):
+        """queriesシートから今日の統計を集計してstatsシートに書き込む"""
+        queries_sheet = self._get_sheet("queries")
+        stats_sheet = self._get_sheet("stats")
+
+        if not queries_sheet or not stats_sheet:
+            raise Exception("必要なシートが見つかりません")
+
+        # 今日の日付
+        today = datetime.now().strftime("%Y-%m-%d")
+
+        # 今日のデータがあるか確認
+        date_cell = stats_sheet.find(today)
+
+        # クエリデータを取得
+        query_data = get_as_dataframe(queries_sheet)
+
+        # 今日の問い合わせ数をカウント
+        today_queries = query_data[query_data['timestamp'].str.startswith(today)]
+        total_queries = len(today_queries)
+
+        # 解決済みの問い合わせ数
+        resolved_queries = len(today_queries[today_queries['status'].isin(RESOLVED_STATUSES)])
+
+        # 平均応答時間を計算（簡易版）
+        avg_response_time = 0
+        resolved_count = 0
+
+        for idx, row in today_queries.iterrows():
+            if pd.notna(row['timestamp']) and pd.notna(row['resolved_at']) and row['resolved_at']:
+                try:
+                    start_time = datetime.strptime(row['timestamp'], "%Y-%m-%d %H:%M:%S")
+                    end_time = datetime.strptime(row['resolved_at'], "%Y-%m-%d %H:%M:%S")
+                    response_time = (end_time - start_time).total_seconds() / 60  # 分単位
+                    avg_response_time += response_time
+                    resolved_count += 1
+                except:
+                    pass
+
+        if resolved_count > 0:
+            avg_response_time = round(avg_response_time / resolved_count, 1)
+
+        # 最も多いカテゴリを特定
+        if not today_queries.empty:
+            top_category = today_queries['category'].value_counts().idxmax()
+        else:
+            top_category = "N/A"
+
+        # 統計データを更新または追加
+        if date_cell:
+            # 既存の行を更新
+            stats_sheet.update_cell(date_cell.row, 2, total_queries)
+            stats_sheet.update_cell(date_cell.row, 3, resolved_queries)
+            stats_sheet.update_cell(date_cell.row, 4, avg_response_time)
+            stats_sheet.update_cell(date_cell.row, 5, top_category)
+        else:
+            # 新しい行を追加
+            stats_sheet.append_row([today, total_queries, resolved_queries, avg_response_time, top_category])
+
+        logger.info(f"{today} の統計情報を更新しました")
+        return True
+
+    @timed("sheets_operation", operation="get_todays_stats")
+    @profiled("sheets.get_todays_stats")
+    @quota_priority(REPORTING)
     async def get_todays_stats(self):
         """今日の統計情報を取得"""
         try:
-            stats_sheet = self._get_sheet("stats")
-            if not stats_sheet:
-                raise Exception("stats シートが見つかりません")
-
-            # 今日の日付
-            today = datetime.now().strftime("%Y-%m-%d")
-
-            # 統計データを探す
-            date_cell = stats_sheet.find(today)
-
-            if date_cell:
-                # 行データを取得
-                row_data = stats_sheet.row_values(date_cell.row)
-
-                # 統計情報を辞書形式で返す
-                return {
-                    "date": row_data[0],
-                    "total_queries": row_data[1],
-                    "resolved_queries": row_data[2],
-                    "average_response_time": row_data[3],
-                    "top_category": row_data[4] if len(row_data) > 4 else "N/A"
-                }
-            else:
-                # データがない場合は現在のクエリから集計
-                await self.update_stats()
-                return await self.get_todays_stats()
+            stats = await self._call(READ_POLICY, "get_todays_stats", self._fetch_todays_stats)
+            if stats:
+                return stats
+
+            # データがない場合は現在のクエリから集計
+            await self.update_stats()
+            return await self.get_todays_stats()
 
         except Exception as e:
             logger.error(f"統計情報の取得に失敗しました: {e}", exc_info=True)
-            return {
-                "date": datetime.now().strftime("%Y-%m-%d"),
-                "total_queries": 0,
-                "resolved_queries": 0,
-                "average_response_time": 0,
-                "top_category": "N/A"
-            }
+            return empty_stats()
+
+    def _fetch_todays_stats(self):
+        """statsシートの今日の行（なければNone）"""
+        stats_sheet = self._get_sheet("stats")
+        if not stats_sheet:
+            raise Exception("stats シートが見つかりません")
 
+        # 今日の日付
+        today = datetime.now().strftime("%Y-%m-%d")
+
+        # 統計データを探す
+        date_cell = stats_sheet.find(today)
+        if not date_cell:
+            return None
+
+        # 行データを取得
+        row_data = stats_sheet.row_values(date_cell.row)
+
+        # 統計情報を辞書形式で返す
+        return {
+            "date": row_data[0],
+            "total_queries": row_data[1],
+            "resolved_queries": row_data[2],
+            "average_response_time": row_data[3],
+            "top_category": row_data[4] if len(row_data) > 4 else "N/A"
+        }
+
+    @timed("sheets_operation", operation="export_queries")
+    @profiled("sheets.export_queries")
+    @quota_priority(REPORTING)
     async def export_queries(self, days=7):
         """問い合わせデータをエクスポート"""
         try:
-            sheet = self._get_sheet("queries")
-            if not sheet:
-                raise Exception("queries シートが見つかりません")
+            return await self._call(READ_POLICY, "export_queries", self._export_queries, days)
 
-            # 全データを取得
-            all_data = get_as_dataframe(sheet)
+        except Exception as e:
+            logger.error(f"データエクスポート中にエラーが発生しました: {e}", exc_info=True)
+            return None
 
-            # 指定日数分のデータをフィルタリング
-            start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
-            filtered_data = all_data[all_data['timestamp'] >= start_date]
+    def _query_frame(self, since=None):
+        """アーカイブのシート（since: この受付月（YYYYMM）以降だけ）とqueriesシートの全行をDataFrameで読み込む"""
+        sheet = self._get_sheet("queries")
+        if not sheet:
+            raise Exception("queries シートが見つかりません")
 
-            if filtered_data.empty:
-                return None
+        frames = []
+        for entry in self._load_archive_index().months(since):
+            archive = self._get_sheet(entry["sheet"], entry["spreadsheet_id"])
+            if archive:
+                frames.append(get_as_dataframe(archive))
+        frames.append(get_as_dataframe(sheet))
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
 
-            # CSVとして保存
-            export_file = f"exports/queries_export_{datetime.now().strftime('%Y%m%d')}.csv"
-            os.makedirs("exports", exist_ok=True)
-            filtered_data.to_csv(export_file, index=False, encoding='utf-8')
+    def _export_queries(self, days=7):
+        """指定日数分をCSVに保存"""
+        start = datetime.now() - timedelta(days=days)
 
-            logger.info(f"問い合わせデータを {export_file} にエクスポートしました")
-            return export_file
+        # 全データを取得（期間にかかるアーカイブのシートを含む）
+        all_data = self._query_frame(start.strftime("%Y%m"))
 
-        except Exception as e:
-            logger.error(f"データエクスポート中にエラーが発生しました: {e}", exc_info=True)
+        # 指定日数分のデータをフィルタリング
+        start_date = start.strftime("%Y-%m-%d")
+        filtered_data = all_data[all_data['timestamp'] >= start_date]
+
+        if filtered_data.empty:
             return None
 
+        # CSVとして保存
+        export_file = f"exports/queries_export_{datetime.now().strftime('%Y%m%d')}.csv"
+        os.makedirs("exports", exist_ok=True)
+        filtered_data.to_csv(export_file, index=False, encoding='utf-8')
+
+        logger.info(f"問い合わせデータを {export_file} にエクスポートしました")
+        return export_file
+
+    @timed("sheets_operation", operation="search_queries")
+    @profiled("sheets.search_queries")
+    @quota_priority(REPORTING)
     async def search_queries(self, keyword):
         """キーワードで問い合わせを検索"""
         try:
-            sheet = self._get_sheet("queries")
-            if not sheet:
-                raise Exception("queries シートが見つかりません")
+            return await self._call(READ_POLICY, "search_queries", self._search_queries, keyword)
 
-            # 全データを取得
-            all_data = get_as_dataframe(sheet)
-
-            # キーワード検索（内容・ユーザー名・カテゴリ）
-            keyword = keyword.lower()
-            results = all_data[
-                all_data['content'].str.lower().str.contains(keyword, na=False) |
-                all_data['username'].str.lower().str.contains(keyword, na=False) |
-                all_data['category'].str.lower().str.contains(keyword, na=False)
-            ]
+        except Exception as e:
+            logger.error(f"検索中にエラーが発生しました: {e}", exc_info=True)
+            return []
 
-            # 結果を辞書のリストとして返す
-            return results.to_dict('records')
+    def _search_queries(self, keyword):
+        """全行を読み込んでキーワードで絞り込む"""
+        # 全データを取得（アーカイブのシートを含む）
+        all_data = self._query_frame()
+
+        # キーワード検索（内容・ユーザー名・カテゴリ）
+        keyword = keyword.lower()
+        results = all_data[
+            all_data['content'].str.lower().str.contains(keyword, na=False) |
+            all_data['username'].str.lower().str.contains(keyword, na=False) |
+            all_data['category'].str.lower().str.contains(keyword, na=False)
+        ]
+
+        # 結果を辞書のリストとして返す
+        return results.to_dict('records')
+
+    @timed("sheets_operation", operation="search_queries_page")
+    @quota_priority(REPORTING)
+    async def search_queries_page(self, keyword, after=None, limit=5):
+        """キーワード検索の1ページ分（カーソルは最後に返した行のシート名と行番号）"""
+        try:
+            return await self._call(READ_POLICY, "search_queries_page", self._search_queries_page, keyword, after, limit)
 
         except Exception as e:
             logger.error(f"検索中にエラーが発生しました: {e}", exc_info=True)
+            return [], None
+
+    def _search_queries_page(self, keyword, after, limit):
+        """カーソルの次の行からSEARCH_SCAN_ROWS行ずつ読み、limit件そろった時点で打ち切る（1件多く探して続きの有無を判定）、
+        queriesシートの後はアーカイブのシートを新しい月から順に読む"""
+        sheets = [("queries", None)] + [
+            (entry["sheet"], entry["spreadsheet_id"]) for entry in self._load_archive_index().months()[::-1]
+        ]
+        titles = [sheet_name for sheet_name, _ in sheets]
+        sheet_name, row = after or ("queries", 1)  # 1行目はヘッダー
+        if sheet_name not in titles:
+            return [], None
+
+        keyword = keyword.lower()
+        results = []
+        for sheet_name, spreadsheet_id in sheets[titles.index(sheet_name):]:
+            sheet = self._get_sheet(sheet_name, spreadsheet_id)
+            if not sheet:
+                raise Exception(f"{sheet_name} シートが見つかりません")
+            last_row = sheet.row_count
+
+            while row < last_row:
+                end = min(row + SEARCH_SCAN_ROWS, last_row)
+                values = sheet.get(f"A{row + 1}:{gspread.utils.rowcol_to_a1(end, len(QUERY_COLUMNS))}")
+
+                for row_number, row_values in enumerate(values, start=row + 1):
+                    query_data = dict(zip(QUERY_COLUMNS, row_values + [""] * (len(QUERY_COLUMNS) - len(row_values))))
+                    if not any(keyword in str(query_data[column]).lower() for column in ("content", "username", "category")):
+                        continue
+                    if len(results) == limit:
+                        return [query_data for _, query_data in results], results[-1][0]
+                    results.append(((sheet_name, row_number), query_data))
+
+                # 空の範囲（データの末尾より後）まで来たら次のシートへ
+                if len(values) < end - row:
+                    break
+                row = end
+            row = 1
+
+        return [query_data for _, query_data in results], None
+
+    @timed("sheets_operation", operation="analyze_queries")
+    @profiled("sheets.analyze_queries")
+    @quota_priority(REPORTING)
+    async def analyze_queries(self, period="week", start=None, end=None):
+        """問い合わせデータを分析（集計テーブルがあれば期間内の行を合算、なければ全行を読み込む）"""
+        try:
+            start, end = analysis_range(period, start, end)
+            if self.rollups is None:
+                rows = await self._call(READ_POLICY, "analyze_queries", self._fetch_all_records, start.strftime("%Y%m"))
+                return analyze_rows(rows, start, end)
+
+            # 初回（集計テーブルの作成直後）は全行から集計する
+            if await asyncio.to_thread(self.rollups.is_empty):
+                await self.rebuild_rollups()
+
+            rollup = await asyncio.to_thread(self.rollups.combine, start, end)
+            return build_analysis(rollup, start, end)
+
+        except Exception as e:
+            logger.error(f"データ分析中にエラーが発生しました: {e}", exc_info=True)
+            return None
+
+    @quota_priority(REPORTING)
+    async def rebuild_rollups(self):
+        """集計テーブルをスプレッドシートの全行（アーカイブのシートを含む）から作り直す（シート上で直接編集した場合など）"""
+        if self.rollups is None:
+            return False
+
+        if self.query_cache is not None:
+            self.query_cache.begin_reload()
+        rows = await self._call(READ_POLICY, "rebuild_rollups", self._fetch_all_records)
+        await asyncio.to_thread(self._rebuild_local, rows)
+        if self.query_cache is not None:
+            await asyncio.to_thread(self.query_cache.load, rows)
+        return True
+
+    def _rebuild_local(self, rows):
+        """イベントログ（空の場合のみ既存の行から作成）と集計テーブルを作り直す"""
+        if self.events.is_empty():
+            self.events.seed(rows)
+        self.rollups.rebuild(rows, self.events.first_responses())
+
+    async def get_hourly_counts(self, start, end):
+        """時間ごとのカテゴリ別件数（集計テーブルがなければ空）"""
+        if self.rollups is None:
             return []
+        if await asyncio.to_thread(self.rollups.is_empty):
+            await self.rebuild_rollups()
+        return await asyncio.to_thread(self.rollups.hourly_counts, start, end)
 
-    async def analyze_queries(self, period="week"):
-        """問い合わせデータを分析"""
+    async def get_query_events(self, query_id):
+        """問い合わせの状態の変化の履歴（イベントログがなければ空）"""
+        if self.events is None:
+            return []
+        return await asyncio.to_thread(self.events.history, query_id)
+
+    # アーカイブ
+
+    def _load_archive_index(self):
+        """アーカイブの索引（初回だけ索引シートから読み込み、以降はメモリ上のものを使う）"""
+        if self._archive_index is None:
+            try:
+                values = self._worksheet(ARCHIVE_INDEX_SHEET).get_all_values()
+            except gspread.exceptions.WorksheetNotFound:
+                values = []
+            self._archive_index = ArchiveIndex.from_values(values)
+        return self._archive_index
+
+    def _save_archive_index(self, index):
+        """索引シートを書き換える（月ごとに1行のため全行を書き込む）"""
+        sheet = self._worksheet(ARCHIVE_INDEX_SHEET, create_cols=len(ARCHIVE_INDEX_COLUMNS))
+        sheet.batch_update([{"range": "A1", "values": index.to_values()}], value_input_option="RAW")
+        self._archive_index = index
+
+    def _append_archive(self, spreadsheet_id, sheet_name, header, rows):
+        """アーカイブのシートに行を追加（なければ作成、追加済みのIDは除く）して、追加後の問い合わせ数を返す"""
+        sheet = self._worksheet(sheet_name, spreadsheet_id, create_cols=len(header))
+        existing = sheet.col_values(1)
+        known = set(existing[1:])
+        rows = [row for row in rows if row[0] not in known]
+        # 作成直後（前回ヘッダーを書き込む前に失敗した場合を含む）はヘッダーから書き込む
+        values = rows if existing else [header] + rows
+        if values:
+            sheet.append_rows(values, value_input_option="RAW")
+        return len(known) + len(rows)
+
+    def _delete_query_rows(self, sheet, row_numbers):
+        """queriesシートの行を1回のbatch_updateで削除（連続する行はまとめ、下の行から削除して行番号をずらさない）"""
+        ranges = []
+        for row in sorted(row_numbers, reverse=True):
+            if ranges and ranges[-1][0] == row + 1:
+                ranges[-1][0] = row
+            else:
+                ranges.append([row, row])
+
+        requests = [
+            {"deleteDimension": {"range": {
+                "sheetId": sheet.id, "dimension": "ROWS", "startIndex": start - 1, "endIndex": end
+            }}}
+            for start, end in ranges
+        ]
+        if requests:
+            sheet.spreadsheet.batch_update({"requests": requests})
+
+    @timed("sheets_operation", operation="archive_queries")
+    @profiled("sheets.archive_queries")
+    @quota_priority(REPORTING)
+    async def archive_queries(self, keep_months=DEFAULT_KEEP_MONTHS, now=None):
+        """保持期間を過ぎた解決済みの問い合わせを受付月ごとのシートへ移し、移した件数を返す"""
+        cutoff = cutoff_month(now or datetime.now(), keep_months)
         try:
+            # 移した行だけを削除し直すため、再試行しても重複・欠落しない
+            return await self._call(IDEMPOTENT_WRITE_POLICY, "archive_queries", self._archive_queries, cutoff)
+
+        except Exception as e:
+            logger.error(f"問い合わせのアーカイブに失敗しました: {e}", exc_info=True)
+            return 0
+
+    def _archive_queries(self, cutoff):
+        """cutoffの月（YYYYMM）より前に受け付けた解決済みの問い合わせを移す"""
+        # 行番号で書き込む処理が削除前の行番号を使わないよう、読み込みから削除までを排他する
+        with self._row_lock:
             sheet = self._get_sheet("queries")
             if not sheet:
                 raise Exception("queries シートが見つかりません")
 
-            # 全データを取得
-            all_data = get_as_dataframe(sheet)
-
-            # 期間に基づいて日付範囲を設定
-            end_date = datetime.now()
-            if period == "day":
-                start_date = end_date - timedelta(days=1)
-            elif period == "week":
-                start_date = end_date - timedelta(weeks=1)
-            elif period == "month":
-                start_date = end_date - timedelta(days=30)
-            elif period == "year":
-                start_date = end_date - timedelta(days=365)
-            else:
-                start_date = end_date - timedelta(weeks=1)
-
-            start_date_str = start_date.strftime("%Y-%m-%d")
-            end_date_str = end_date.strftime("%Y-%m-%d")
-
-            # 期間内のデータをフィルタリング
-            filtered_data = all_data[all_data['timestamp'] >= start_date_str]
-
-            if filtered_data.empty:
-                return None
-
-            # 基本統計情報
-            total_queries = len(filtered_data)
-            resolved_queries = len(filtered_data[filtered_data['status'].isin(['完了', 'クローズ'])])
-            resolution_rate = round((resolved_queries / total_queries) * 100, 1) if total_queries > 0 else 0
-
-            # カテゴリ分布
-            category_counts = filtered_data['category'].value_counts()
-            categories = {}
-            for category, count in category_counts.items():
-                percentage = round((count / total_queries) * 100, 1)
-                categories[category] = (count, percentage)
-
-            # 平均応答・解決時間
-            avg_first_response_time = 0
-            avg_resolution_time = 0
-            response_count = 0
-            resolution_count = 0
-
-            for idx, row in filtered_data.iterrows():
-                if pd.notna(row['timestamp']) and pd.notna(row['response']) and row['response']:
-                    # 簡易版：実際には返信時間のカラムが別途必要
-                    response_count += 1
-
-                if pd.notna(row['timestamp']) and pd.notna(row['resolved_at']) and row['resolved_at']:
-                    try:
-                        start_time = datetime.strptime(row['timestamp'], "%Y-%m-%d %H:%M:%S")
-                        end_time = datetime.strptime(row['resolved_at'], "%Y-%m-%d %H:%M:%S")
-                        resolution_time = (end_time - start_time).total_seconds() / 60  # 分単位
-                        avg_resolution_time += resolution_time
-                        resolution_count += 1
-                    except:
-                        pass
-
-            if response_count > 0:
-                avg_first_response_time = 30  # 簡易版：実際には計算が必要
-
-            if resolution_count > 0:
-                avg_resolution_time = round(avg_resolution_time / resolution_count, 1)
-
-            # トレンド分析（簡易版）
-            if total_queries > 5:
-                trend = "問い合わせ数は安定しています。"
-                if "complaint" in categories and categories["complaint"][1] > 30:
-                    trend = "苦情の割合が高くなっています。早急な対応が必要です。"
-                elif resolution_rate < 50:
-                    trend = "解決率が低下しています。サポート体制の強化を検討してください。"
-                elif avg_resolution_time > 120:  # 2時間以上
-                    trend = "解決までの時間が長くなっています。効率化が必要です。"
-            else:
-                trend = "分析するデータが不足しています。"
-
-            # 分析結果を返す
-            return {
-                "start_date": start_date_str,
-                "end_date": end_date_str,
-                "total_queries": total_queries,
-                "resolved_queries": resolved_queries,
-                "resolution_rate": resolution_rate,
-                "categories": categories,
-                "avg_first_response_time": avg_first_response_time,
-                "avg_resolution_time": avg_resolution_time,
-                "trend": trend
-            }
-
-        except Exception as e:
-            logger.error(f"データ分析中にエラーが発生しました: {e}", exc_info=True)
-            return None
\ No newline at end of file
+            values = sheet.get_all_values()
+            months = select_archivable(values, cutoff)
+            archived = sum(len(rows) for rows in months.values())
+            if not archived:
+                HOT_ROWS.set(max(len(values) - 1, 0))
+                return 0
+
+            # 月ごとのシートに追加してから索引を更新し、最後にqueriesシートから削除する
+            index = ArchiveIndex(dict(entry) for entry in self._load_archive_index().entries.values())
+            for month, rows in sorted(months.items()):
+                sheet_name = archive_sheet_name(month)
+                entry = index.entries.get(sheet_name)
+                spreadsheet_id = entry["spreadsheet_id"] if entry else self.archive_spreadsheet_id or self.spreadsheet_id
+                count = self._append_archive(spreadsheet_id, sheet_name, values[0], [row for _, row in rows])
+                index.add(sheet_name, spreadsheet_id, month, [row[0] for _, row in rows], count)
+            self._save_archive_index(index)
+            self._delete_query_rows(sheet, [row_number for rows in months.values() for row_number, _ in rows])
+
+        ARCHIVED_QUERIES.inc(archived)
+        HOT_ROWS.set(len(values) - 1 - archived)
+        logger.info(f"{archived}件の問い合わせを{len(months)}か月分のシートへ移しました（{cutoff[:4]}年{cutoff[4:]}月より前の解決済み）")
+        return archived
+
+    async def archive_loop(self, keep_months=DEFAULT_KEEP_MONTHS, interval=ARCHIVE_INTERVAL):
+        """バックグラウンドで定期的に古い問い合わせをアーカイブするタスク"""
+        logger.info(f"問い合わせのアーカイブを開始しました（{keep_months}か月前までを保持、{interval}秒間隔）")
+        while True:
+            await self.archive_queries(keep_months)
+            await asyncio.sleep(interval)
\ No newline at end of file
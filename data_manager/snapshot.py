@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+起動状態のスナップショット: 終了時にメモリ上の状態を保存し、次の起動時に読み込んで初期化を省く
+
+自分のXアカウントID・ユーザー名の対応・Discordのチャンネル・テンプレート・アーカイブの索引・
+メモリ上の問い合わせを1つのZIPファイル（state.json と、配列などのバイト列は別のファイル）に
+保存します。pickleは使わず、読み込んだ内容は各コンポーネントが検証してから使います。
+"""
+
+import os
+import json
+import time
+import logging
+import zipfile
+
+from monitoring.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# スナップショットの形式（変えた場合は古いスナップショットを読み込まない）
+SNAPSHOT_VERSION = 1
+
+# 状態を保存するファイル名と、バイト列を置き換える目印
+STATE_NAME = "state.json"
+BLOB_KEY = "$blob"
+
+SNAPSHOT_AGE = REGISTRY.gauge("warm_snapshot_age_seconds", "起動時に読み込んだスナップショットの保存からの経過時間（秒）")
+
+class WarmSnapshot:
+    """起動状態のスナップショットファイル"""
+
+    def __init__(self, path):
+        """初期化"""
+        self.path = path
+
+    def load(self):
+        """スナップショットを読み込む（{セクション名: 状態}、ない・形式が違う・壊れている場合は空）"""
+        try:
+            with zipfile.ZipFile(self.path) as archive:
+                blobs = {}
+
+                def restore_blob(value):
+                    if set(value) == {BLOB_KEY}:
+                        name = value[BLOB_KEY]
+                        if name not in blobs:
+                            blobs[name] = archive.read(name)
+                        return blobs[name]
+                    return value
+
+                state = json.loads(archive.read(STATE_NAME), object_hook=restore_blob)
+
+        except FileNotFoundError:
+            return {}
+
+        except Exception as e:
+            logger.warning(f"スナップショットの読み込みに失敗しました（通常どおり起動します）: {e}")
+            return {}
+
+        if state.get("version") != SNAPSHOT_VERSION:
+            logger.info("スナップショットの形式が違うため使用しません")
+            return {}
+
+        age = time.time() - state.get("saved_at", 0)
+        SNAPSHOT_AGE.set(age)
+        logger.info(f"スナップショットを読み込みました（{age:.0f}秒前、{', '.join(state['sections'])}）")
+        return state["sections"]
+
+    def save(self, sections):
+        """スナップショットを保存（sections: {セクション名: 状態}、状態中のbytesは別のファイルに保存）"""
+        blobs = []
+
+        def extract_blob(value):
+            if isinstance(value, (bytes, bytearray)):
+                blobs.append(value)
+                return {BLOB_KEY: f"blobs/{len(blobs)}"}
+            raise TypeError(f"保存できない値です: {type(value).__name__}")
+
+        sections = {name: state for name, state in sections.items() if state is not None}
+        state = json.dumps(
+            {"version": SNAPSHOT_VERSION, "saved_at": time.time(), "sections": sections},
+            ensure_ascii=False, default=extract_blob
+        )
+
+        # 書き込み途中で停止しても前回のスナップショットを壊さないよう、一時ファイルから置き換える
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_STORED) as archive:
+            archive.writestr(STATE_NAME, state)
+            for number, blob in enumerate(blobs, start=1):
+                archive.writestr(f"blobs/{number}", bytes(blob))
+        os.replace(temp_path, self.path)
+
+        logger.info(f"スナップショットを保存しました（{', '.join(sections)}、{os.path.getsize(self.path) / 2 ** 20:.1f}MB）")
\ No newline at end of file
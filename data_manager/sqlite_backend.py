@@ -0,0 +1,545 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+SQLiteストレージ: インデックス付きの組み込みデータベース
+"""
+
+import os
+import csv
+import asyncio
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from data_manager.storage import StorageBackend, QUERY_COLUMNS, RESOLVED_STATUSES, analysis_range, empty_stats
+from data_manager.rollups import RollupStore, RollupDelta, ROLLUP_COLUMNS, build_analysis
+from data_manager.events import EventLog
+from monitoring.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queries (
+    seq INTEGER PRIMARY KEY,
+    query_id TEXT NOT NULL UNIQUE,
+    timestamp TEXT NOT NULL DEFAULT '',
+    platform TEXT NOT NULL DEFAULT '',
+    username TEXT NOT NULL DEFAULT '',
+    content TEXT NOT NULL DEFAULT '',
+    category TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT '',
+    assigned_to TEXT NOT NULL DEFAULT '',
+    response TEXT NOT NULL DEFAULT '',
+    resolved_at TEXT NOT NULL DEFAULT '',
+    tweet_id TEXT NOT NULL DEFAULT '',
+    reply_tweet_id TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_queries_timestamp ON queries (timestamp);
+CREATE INDEX IF NOT EXISTS idx_queries_status ON queries (status);
+CREATE INDEX IF NOT EXISTS idx_queries_category ON queries (category);
+
+CREATE TABLE IF NOT EXISTS templates (
+    template_id TEXT PRIMARY KEY,
+    category TEXT NOT NULL DEFAULT 'general',
+    name TEXT NOT NULL DEFAULT '',
+    template_text TEXT NOT NULL DEFAULT '',
+    position INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS stats (
+    date TEXT PRIMARY KEY,
+    total_queries INTEGER NOT NULL DEFAULT 0,
+    resolved_queries INTEGER NOT NULL DEFAULT 0,
+    average_response_time REAL NOT NULL DEFAULT 0,
+    top_category TEXT NOT NULL DEFAULT 'N/A'
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# 後から追加した列（既存のデータベースにはALTER TABLEで追加する）
+ADDED_QUERY_COLUMNS = ("tweet_id", "reply_tweet_id")
+
+# 解決時間（分）を求める式
+RESOLUTION_MINUTES = "(strftime('%s', resolved_at) - strftime('%s', timestamp)) / 60.0"
+
+def _seq_from_id(query_id):
+    """問い合わせID（Q001）から連番を取得"""
+    number = str(query_id).lstrip("Q")
+    return int(number) if number.isdigit() else None
+
+def _escape_like(keyword):
+    """LIKE検索用にワイルドカードをエスケープ"""
+    return keyword.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+class SQLiteBackend(StorageBackend):
+    """SQLiteを使ったストレージ"""
+
+    def __init__(self, path="data/support_hub.db"):
+        """初期化"""
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        self._lock = threading.Lock()
+
+        # イベントログと分析用の集計テーブル（問い合わせと同じトランザクションで更新する）
+        self.events = EventLog(self.conn, managed=False)
+        self.rollups = RollupStore(self.conn, managed=False)
+        with self.conn:
+            has_queries = self.conn.execute("SELECT 1 FROM queries LIMIT 1").fetchone() is not None
+            if has_queries and self.events.is_empty():
+                self.events.seed(self._select_all())
+            if has_queries and self.rollups.is_empty():
+                self.rollups.rebuild(self._select_all(), self.events.first_responses())
+
+        logger.info(f"SQLiteストレージを初期化しました: {path}")
+
+    def _migrate(self):
+        """古いスキーマのデータベースに不足している列を追加"""
+        existing = {row["name"] for row in self.conn.execute("PRAGMA table_info(queries)")}
+        for column in ADDED_QUERY_COLUMNS:
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE queries ADD COLUMN {column} TEXT NOT NULL DEFAULT ''")
+                logger.info(f"queriesテーブルに {column} 列を追加しました")
+
+    async def _run(self, func, *args):
+        """SQLite処理を別スレッドで排他的に実行"""
+        def call():
+            with self._lock:
+                with self.conn:
+                    return func(*args)
+        return await asyncio.to_thread(call)
+
+    def _bump_templates_revision(self):
+        """テンプレートの変更を記録（変更検知用）"""
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('templates_revision', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (datetime.now().isoformat(),)
+        )
+
+    # 問い合わせ
+
+    def _select_all(self):
+        """すべての問い合わせを辞書のリストで読み込む"""
+        rows = self.conn.execute(f"SELECT {', '.join(QUERY_COLUMNS)} FROM queries ORDER BY seq").fetchall()
+        return [dict(row) for row in rows]
+
+    def _insert_query(self, query_data, delta):
+        """問い合わせを1件挿入してIDを返す（集計の差分はdeltaに追加し、受付イベントを記録）"""
+        query_id = query_data.get("query_id")
+        seq = _seq_from_id(query_id) if query_id else None
+        if seq is None:
+            seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM queries").fetchone()[0]
+            query_id = f"Q{seq:03d}"
+
+        values = (
+            query_id,
+            query_data.get("timestamp") or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            query_data.get("platform", "X"),
+            query_data.get("username", "不明"),
+            query_data.get("content", ""),
+            query_data.get("category", "general"),
+            query_data.get("status", "未対応"),
+            query_data.get("assigned_to", "") or "",
+            query_data.get("response", "") or "",
+            query_data.get("resolved_at", "") or "",
+            str(query_data.get("tweet_id") or ""),
+            str(query_data.get("reply_tweet_id") or "")
+        )
+        self.conn.execute(
+            "INSERT INTO queries (seq, query_id, timestamp, platform, username, content, category, status, "
+            "assigned_to, response, resolved_at, tweet_id, reply_tweet_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (seq, *values)
+        )
+        row = dict(zip(QUERY_COLUMNS, values))
+        delta.add_query(row)
+        self.events.record_inserts([row])
+        return query_id
+
+    def _insert_queries(self, queries):
+        """複数の問い合わせを挿入して集計に反映し、IDのリストを返す"""
+        delta = RollupDelta()
+        query_ids = [self._insert_query(query_data, delta) for query_data in queries]
+        self.rollups.apply(delta)
+        return query_ids
+
+    @timed("sqlite_operation", operation="log_query")
+    async def log_query(self, query_data):
+        """問い合わせデータを記録"""
+        try:
+            query_id = (await self._run(self._insert_queries, [query_data]))[0]
+            logger.info(f"問い合わせ {query_id} をSQLiteに記録しました")
+            return query_id
+
+        except Exception as e:
+            logger.error(f"問い合わせの記録に失敗しました: {e}", exc_info=True)
+            raise
+
+    @timed("sqlite_operation", operation="log_queries")
+    async def log_queries(self, queries):
+        """複数の問い合わせを1トランザクションで記録"""
+        try:
+            query_ids = await self._run(self._insert_queries, queries)
+            logger.info(f"{len(query_ids)}件の問い合わせをSQLiteに記録しました")
+            return query_ids
+
+        except Exception as e:
+            logger.error(f"問い合わせの一括記録に失敗しました: {e}", exc_info=True)
+            raise
+
+    async def import_queries(self, rows):
+        """既存の問い合わせをまとめて取り込む（IDは維持）"""
+        await self._run(self._insert_queries, [row for row in rows if row.get("query_id")])
+        return len(rows)
+
+    async def is_empty(self):
+        """問い合わせが1件もないか"""
+        return await self._run(lambda: self.conn.execute("SELECT 1 FROM queries LIMIT 1").fetchone() is None)
+
+    def _update_rows(self, query_ids, values):
+        """問い合わせの列を更新してイベントログ・集計に反映し、更新できたIDのリストを返す"""
+        assignments = ", ".join(f"{column} = ?" for column in values)
+        # 集計に影響する列を更新する場合だけ、差分を求めるため更新前の行を読む
+        tracked = any(column in ROLLUP_COLUMNS for column in values)
+        delta = RollupDelta()
+        now = datetime.now().timestamp()
+
+        updated = []
+        for query_id in dict.fromkeys(query_ids):
+            old = None
+            if tracked:
+                old = self.conn.execute(
+                    f"SELECT {', '.join(ROLLUP_COLUMNS)} FROM queries WHERE query_id = ?", (query_id,)
+                ).fetchone()
+            cursor = self.conn.execute(
+                f"UPDATE queries SET {assignments} WHERE query_id = ?", (*values.values(), query_id)
+            )
+            if cursor.rowcount:
+                updated.append(query_id)
+                if old is not None:
+                    delta.replace(dict(old), dict(dict(old), **values))
+                self.events.record_update(query_id, values, delta, dict(old) if old is not None else None, now)
+
+        self.rollups.apply(delta)
+        return updated
+
+    async def _update_columns(self, query_id, **values):
+        """指定列を更新（問い合わせがなければ例外）"""
+        def update():
+            if not self._update_rows([query_id], values):
+                raise Exception(f"問い合わせ {query_id} が見つかりません")
+
+        await self._run(update)
+        return True
+
+    @timed("sqlite_operation", operation="update_assigned")
+    async def update_assigned(self, query_id, assigned_to):
+        """担当者を更新"""
+        try:
+            await self._update_columns(query_id, assigned_to=assigned_to, status="対応中")
+            logger.info(f"問い合わせ {query_id} の担当者を {assigned_to} に更新しました")
+            return True
+
+        except Exception as e:
+            logger.error(f"担当者の更新に失敗しました: {e}", exc_info=True)
+            raise
+
+    @timed("sqlite_operation", operation="update_response")
+    async def update_response(self, query_id, response):
+        """返信内容を更新"""
+        try:
+            await self._update_columns(query_id, response=response)
+            logger.info(f"問い合わせ {query_id} の返信内容を更新しました")
+            return True
+
+        except Exception as e:
+            logger.error(f"返信内容の更新に失敗しました: {e}", exc_info=True)
+            raise
+
+    @timed("sqlite_operation", operation="update_status")
+    async def update_status(self, query_id, status):
+        """ステータスを更新"""
+        try:
+            await self._update_columns(query_id, status=status)
+            logger.info(f"問い合わせ {query_id} のステータスを {status} に更新しました")
+            return True
+
+        except Exception as e:
+            logger.error(f"ステータスの更新に失敗しました: {e}", exc_info=True)
+            raise
+
+    @timed("sqlite_operation", operation="update_resolved_time")
+    async def update_resolved_time(self, query_id, resolved_at=None):
+        """解決時間を更新（resolved_at: 省略時は現在時刻）"""
+        try:
+            await self._update_columns(query_id, resolved_at=resolved_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            logger.info(f"問い合わせ {query_id} の解決時間を更新しました")
+            return True
+
+        except Exception as e:
+            logger.error(f"解決時間の更新に失敗しました: {e}", exc_info=True)
+            raise
+
+    @timed("sqlite_operation", operation="update_queries")
+    async def update_queries(self, query_ids, fields):
+        """複数の問い合わせを1トランザクションで更新"""
+        unknown = [column for column in fields if column not in QUERY_COLUMNS or column == "query_id"]
+        if unknown:
+            raise ValueError(f"更新できない列です: {', '.join(unknown)}")
+
+        updated = await self._run(self._update_rows, query_ids, fields)
+        logger.info(f"{len(updated)}件の問い合わせを一括更新しました")
+        return updated
+
+    @timed("sqlite_operation", operation="find_query_ids")
+    async def find_query_ids(self, filters):
+        """条件に一致する問い合わせIDを取得"""
+        conditions = []
+        params = []
+        for column, value in filters.items():
+            if column not in QUERY_COLUMNS:
+                raise ValueError(f"不明な列です: {column}")
+            if column == "username":
+                conditions.append("lower(username) LIKE ? ESCAPE '\\'")
+                params.append(f"%{_escape_like(value.lower())}%")
+            else:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+
+        where = " AND ".join(conditions) or "1"
+        rows = await self._run(
+            lambda: self.conn.execute(f"SELECT query_id FROM queries WHERE {where} ORDER BY seq", params).fetchall()
+        )
+        return [row[0] for row in rows]
+
+    @timed("sqlite_operation", operation="get_query")
+    async def get_query(self, query_id, fresh=False):
+        """問い合わせデータを取得（常に保存先から読むためfreshは使わない）"""
+        try:
+            row = await self._run(
+                lambda: self.conn.execute(
+                    f"SELECT {', '.join(QUERY_COLUMNS)} FROM queries WHERE query_id = ?", (query_id,)
+                ).fetchone()
+            )
+            return dict(row) if row else None
+
+        except Exception as e:
+            logger.error(f"問い合わせデータの取得に失敗しました: {e}", exc_info=True)
+            return None
+
+    async def get_all_queries(self):
+        """すべての問い合わせを取得"""
+        return await self._run(self._select_all)
+
+    # テンプレート
+
+    @timed("sqlite_operation", operation="get_templates")
+    async def get_templates(self):
+        """テンプレートデータを取得"""
+        try:
+            rows = await self._run(
+                lambda: self.conn.execute(
+                    "SELECT category, template_id, name, template_text FROM templates ORDER BY position, template_id"
+                ).fetchall()
+            )
+            return [dict(row) for row in rows]
+
+        except Exception as e:
+            logger.error(f"テンプレートデータの取得に失敗しました: {e}", exc_info=True)
+            return []
+
+    async def add_template(self, category, template_id, name, template_text):
+        """テンプレートを追加"""
+        def insert():
+            position = self.conn.execute("SELECT COALESCE(MAX(position), 0) + 1 FROM templates").fetchone()[0]
+            self.conn.execute(
+                "INSERT OR REPLACE INTO templates (template_id, category, name, template_text, position) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (template_id, category, name, template_text, position)
+            )
+            self._bump_templates_revision()
+        await self._run(insert)
+        return True
+
+    async def delete_template(self, template_id):
+        """テンプレートを削除"""
+        def delete():
+            cursor = self.conn.execute("DELETE FROM templates WHERE template_id = ?", (template_id,))
+            self._bump_templates_revision()
+            return cursor.rowcount > 0
+        return await self._run(delete)
+
+    async def get_modified_time(self):
+        """テンプレートの最終変更日時"""
+        row = await self._run(
+            lambda: self.conn.execute("SELECT value FROM meta WHERE key = 'templates_revision'").fetchone()
+        )
+        return row[0] if row else None
+
+    # 統計・検索・エクスポート
+
+    def _compute_stats(self, date):
+        """指定日の統計を集計"""
+        prefix = f"{date}%"
+        total, resolved = self.conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM(status IN {RESOLVED_STATUSES}), 0) FROM queries WHERE timestamp LIKE ?",
+            (prefix,)
+        ).fetchone()
+        avg_response_time = self.conn.execute(
+            f"SELECT AVG({RESOLUTION_MINUTES}) FROM queries WHERE timestamp LIKE ? AND resolved_at != ''",
+            (prefix,)
+        ).fetchone()[0]
+        top = self.conn.execute(
+            "SELECT category FROM queries WHERE timestamp LIKE ? GROUP BY category ORDER BY COUNT(*) DESC LIMIT 1",
+            (prefix,)
+        ).fetchone()
+        return total, resolved, round(avg_response_time or 0, 1), top[0] if top else "N/A"
+
+    @timed("sqlite_operation", operation="update_stats")
+    async def update_stats(self):
+        """統計情報を更新"""
+        try:
+            today = datetime.now().strftime("%Y-%m-%d")
+
+            def upsert():
+                total, resolved, avg_response_time, top_category = self._compute_stats(today)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO stats (date, total_queries, resolved_queries, average_response_time, "
+                    "top_category) VALUES (?, ?, ?, ?, ?)",
+                    (today, total, resolved, avg_response_time, top_category)
+                )
+
+            await self._run(upsert)
+            logger.info(f"{today} の統計情報を更新しました")
+            return True
+
+        except Exception as e:
+            logger.error(f"統計情報の更新に失敗しました: {e}", exc_info=True)
+            return False
+
+    @timed("sqlite_operation", operation="get_todays_stats")
+    async def get_todays_stats(self):
+        """今日の統計情報を取得"""
+        try:
+            today = datetime.now().strftime("%Y-%m-%d")
+            fetch = lambda: self.conn.execute("SELECT * FROM stats WHERE date = ?", (today,)).fetchone()
+
+            row = await self._run(fetch)
+            if not row:
+                # データがない場合は現在のクエリから集計
+                await self.update_stats()
+                row = await self._run(fetch)
+
+            return dict(row) if row else empty_stats()
+
+        except Exception as e:
+            logger.error(f"統計情報の取得に失敗しました: {e}", exc_info=True)
+            return empty_stats()
+
+    @timed("sqlite_operation", operation="export_queries")
+    async def export_queries(self, days=7):
+        """問い合わせデータをエクスポート"""
+        try:
+            start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+            rows = await self._run(
+                lambda: self.conn.execute(
+                    f"SELECT {', '.join(QUERY_COLUMNS)} FROM queries WHERE timestamp >= ? ORDER BY seq", (start_date,)
+                ).fetchall()
+            )
+
+            if not rows:
+                return None
+
+            # CSVとして保存
+            export_file = f"exports/queries_export_{datetime.now().strftime('%Y%m%d')}.csv"
+            os.makedirs("exports", exist_ok=True)
+            with open(export_file, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(QUERY_COLUMNS)
+                writer.writerows(tuple(row) for row in rows)
+
+            logger.info(f"問い合わせデータを {export_file} にエクスポートしました")
+            return export_file
+
+        except Exception as e:
+            logger.error(f"データエクスポート中にエラーが発生しました: {e}", exc_info=True)
+            return None
+
+    @timed("sqlite_operation", operation="search_queries")
+    async def search_queries(self, keyword):
+        """キーワードで問い合わせを検索"""
+        try:
+            pattern = f"%{_escape_like(keyword.lower())}%"
+            rows = await self._run(
+                lambda: self.conn.execute(
+                    f"SELECT {', '.join(QUERY_COLUMNS)} FROM queries "
+                    "WHERE lower(content) LIKE ?1 ESCAPE '\\' OR lower(username) LIKE ?1 ESCAPE '\\' "
+                    "OR lower(category) LIKE ?1 ESCAPE '\\' ORDER BY seq",
+                    (pattern,)
+                ).fetchall()
+            )
+            return [dict(row) for row in rows]
+
+        except Exception as e:
+            logger.error(f"検索中にエラーが発生しました: {e}", exc_info=True)
+            return []
+
+    @timed("sqlite_operation", operation="search_queries_page")
+    async def search_queries_page(self, keyword, after=None, limit=5):
+        """キーワード検索の1ページ分（カーソルは最後に返した行のseq、1件多く読んで続きの有無を判定）"""
+        try:
+            pattern = f"%{_escape_like(keyword.lower())}%"
+            rows = await self._run(
+                lambda: self.conn.execute(
+                    f"SELECT seq, {', '.join(QUERY_COLUMNS)} FROM queries "
+                    "WHERE (lower(content) LIKE ?1 ESCAPE '\\' OR lower(username) LIKE ?1 ESCAPE '\\' "
+                    "OR lower(category) LIKE ?1 ESCAPE '\\') AND seq > ?2 ORDER BY seq LIMIT ?3",
+                    (pattern, after or 0, limit + 1)
+                ).fetchall()
+            )
+            cursor = rows[limit - 1]["seq"] if len(rows) > limit else None
+            page = [{column: row[column] for column in QUERY_COLUMNS} for row in rows[:limit]]
+            return page, cursor
+
+        except Exception as e:
+            logger.error(f"検索中にエラーが発生しました: {e}", exc_info=True)
+            return [], None
+
+    @timed("sqlite_operation", operation="analyze_queries")
+    async def analyze_queries(self, period="week", start=None, end=None):
+        """問い合わせデータを分析（集計テーブルの期間内の行を合算）"""
+        try:
+            start, end = analysis_range(period, start, end)
+            rollup = await self._run(self.rollups.combine, start, end)
+            return build_analysis(rollup, start, end)
+
+        except Exception as e:
+            logger.error(f"データ分析中にエラーが発生しました: {e}", exc_info=True)
+            return None
+
+    async def rebuild_rollups(self):
+        """集計テーブルを問い合わせとイベントログから作り直す"""
+        await self._run(lambda: self.rollups.rebuild(self._select_all(), self.events.first_responses()))
+        return True
+
+    async def get_hourly_counts(self, start, end):
+        """時間ごとのカテゴリ別件数（集計テーブルから取得）"""
+        return await self._run(self.rollups.hourly_counts, start, end)
+
+    async def get_query_events(self, query_id):
+        """問い合わせの状態の変化の履歴（イベントログから取得）"""
+        return await self._run(self.events.history, query_id)
\ No newline at end of file
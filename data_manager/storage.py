@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+ストレージ: 問い合わせ・テンプレート・統計の保存先インターフェース
+"""
+
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, time
+
+from monitoring.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# queriesの列構成（スプレッドシートの列順）
+QUERY_COLUMNS = [
+    "query_id", "timestamp", "platform", "username", "content", "category",
+    "status", "assigned_to", "response", "resolved_at", "tweet_id", "reply_tweet_id"
+]
+
+# 解決済みとみなすステータス
+RESOLVED_STATUSES = ("完了", "クローズ")
+
+def period_start(period, end_date):
+    """分析期間の開始日時"""
+    if period == "day":
+        return end_date - timedelta(days=1)
+    elif period == "week":
+        return end_date - timedelta(weeks=1)
+    elif period == "month":
+        return end_date - timedelta(days=30)
+    elif period == "year":
+        return end_date - timedelta(days=365)
+    return end_date - timedelta(weeks=1)
+
+def analysis_range(period="week", start=None, end=None):
+    """分析期間の開始・終了日時（終了は含まない、startを省略するとperiodの開始日から今日の終わりまで）"""
+    today = datetime.combine(datetime.now().date(), time())
+    if start is None:
+        start = datetime.combine(period_start(period, datetime.now()).date(), time())
+    if end is None:
+        end = today + timedelta(days=1)
+    return start, end
+
+def empty_stats():
+    """統計情報が取得できない場合の値"""
+    return {
+        "date": datetime.now().strftime("%Y-%m-%d"),
+        "total_queries": 0,
+        "resolved_queries": 0,
+        "average_response_time": 0,
+        "top_category": "N/A"
+    }
+
+class StorageBackend(ABC):
+    """問い合わせデータの保存先の共通インターフェース"""
+
+    # 問い合わせ
+
+    @abstractmethod
+    async def log_query(self, query_data):
+        """問い合わせを記録して問い合わせIDを返す（query_dataにquery_idがあればそれを使う）"""
+
+    async def log_queries(self, queries):
+        """複数の問い合わせを記録してIDのリストを返す（一括書き込みできる保存先は上書きする）"""
+        return [await self.log_query(query_data) for query_data in queries]
+
+    @abstractmethod
+    async def update_assigned(self, query_id, assigned_to):
+        """担当者を更新（ステータスは「対応中」になる）"""
+
+    @abstractmethod
+    async def update_response(self, query_id, response):
+        """返信内容を更新"""
+
+    @abstractmethod
+    async def update_status(self, query_id, status):
+        """ステータスを更新"""
+
+    @abstractmethod
+    async def update_resolved_time(self, query_id, resolved_at=None):
+        """解決日時を更新（resolved_at: "%Y-%m-%d %H:%M:%S" の文字列、省略時は現在時刻）"""
+
+    @abstractmethod
+    async def update_queries(self, query_ids, fields):
+        """複数の問い合わせの列（fields: 列名→値）をまとめて更新し、更新できたIDのリストを返す"""
+
+    @abstractmethod
+    async def find_query_ids(self, filters):
+        """列の値（filters: 列名→値、usernameは部分一致）に一致する問い合わせIDのリスト"""
+
+    @abstractmethod
+    async def get_query(self, query_id, fresh=False):
+        """問い合わせを辞書で取得（見つからなければNone、fresh: メモリ上に保持していても保存先から読む）"""
+
+    @abstractmethod
+    async def get_all_queries(self):
+        """すべての問い合わせを辞書のリストで取得（移行用）"""
+
+    # テンプレート
+
+    @abstractmethod
+    async def get_templates(self):
+        """テンプレートを辞書のリストで取得"""
+
+    @abstractmethod
+    async def add_template(self, category, template_id, name, template_text):
+        """テンプレートを追加"""
+
+    @abstractmethod
+    async def delete_template(self, template_id):
+        """テンプレートを削除（削除できたらTrue）"""
+
+    @abstractmethod
+    async def get_modified_time(self):
+        """変更検知用の更新日時（取得できなければNone）"""
+
+    async def get_cell_value(self, sheet_name, cell_label):
+        """チェックサムセルの値（スプレッドシート以外では未対応）"""
+        return None
+
+    # 統計・検索・エクスポート
+
+    @abstractmethod
+    async def update_stats(self):
+        """今日の統計情報を更新"""
+
+    @abstractmethod
+    async def get_todays_stats(self):
+        """今日の統計情報を取得"""
+
+    @abstractmethod
+    async def export_queries(self, days=7):
+        """指定日数分をCSVに出力してパスを返す（データがなければNone）"""
+
+    @abstractmethod
+    async def search_queries(self, keyword):
+        """内容・ユーザー名・カテゴリのキーワード検索"""
+
+    async def search_queries_page(self, keyword, after=None, limit=5):
+        """キーワード検索の1ページ分と次のページのカーソル（なければNone）を返す（after: 前のページで返されたカーソル）"""
+        # 先頭から読み進められる保存先は上書きし、必要な分だけ取得する
+        results = await self.search_queries(keyword)
+        start = after or 0
+        cursor = start + limit if start + limit < len(results) else None
+        return results[start:start + limit], cursor
+
+    @abstractmethod
+    async def analyze_queries(self, period="week", start=None, end=None):
+        """期間の分析結果（データがなければNone、start・endを指定すると[start, end)の任意期間）"""
+
+    async def rebuild_rollups(self):
+        """分析用の集計テーブルを作り直す（集計テーブルを持たない保存先ではFalse）"""
+        return False
+
+    async def get_hourly_counts(self, start, end):
+        """期間[start, end)の時間ごとのカテゴリ別件数（集計テーブルを持たない保存先では空）"""
+        return []
+
+    async def get_query_events(self, query_id):
+        """問い合わせの状態の変化の履歴（イベントログを持たない保存先では空）"""
+        return []
+
+class DualWriteStorage(StorageBackend):
+    """主ストレージに書き込み、スプレッドシートへ非同期にミラーする"""
+
+    def __init__(self, primary, mirror):
+        """初期化（primary: 検索・集計に使う保存先、mirror: 人が見るスプレッドシート）"""
+        self.primary = primary
+        self.mirror = mirror
+        self.queue = asyncio.Queue()
+        self.worker = None
+
+        REGISTRY.gauge("storage_mirror_queue_depth", "スプレッドシートへのミラー待ち件数").set_function(self.queue.qsize)
+        self.mirror_errors = REGISTRY.counter("storage_mirror_errors_total", "スプレッドシートへのミラー失敗件数")
+
+    def start(self):
+        """ミラー処理タスクを開始"""
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._mirror_loop())
+
+    async def _mirror_loop(self):
+        """キューの順に書き込みをミラー"""
+        while True:
+            method, args = await self.queue.get()
+            try:
+                await getattr(self.mirror, method)(*args)
+            except Exception as e:
+                self.mirror_errors.inc()
+                logger.error(f"スプレッドシートへのミラーに失敗しました ({method}): {e}", exc_info=True)
+            finally:
+                self.queue.task_done()
+
+    def _mirror(self, method, *args):
+        """ミラーをキューに追加"""
+        self.start()
+        self.queue.put_nowait((method, args))
+
+    async def flush(self):
+        """ミラー待ちがなくなるまで待機（終了時など）"""
+        await self.queue.join()
+
+    @staticmethod
+    def _with_timestamp(query_data):
+        """受付日時がなければ現在時刻を入れる（両方のストレージに同じ日時を記録する）"""
+        if query_data.get("timestamp"):
+            return query_data
+        return dict(query_data, timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+    async def log_query(self, query_data):
+        query_data = self._with_timestamp(query_data)
+        query_id = await self.primary.log_query(query_data)
+        self._mirror("log_query", dict(query_data, query_id=query_id))
+        return query_id
+
+    async def log_queries(self, queries):
+        queries = [self._with_timestamp(query_data) for query_data in queries]
+        query_ids = await self.primary.log_queries(queries)
+        mirrored = [dict(query_data, query_id=query_id) for query_data, query_id in zip(queries, query_ids)]
+        self._mirror("log_queries", mirrored)
+        return query_ids
+
+    async def update_assigned(self, query_id, assigned_to):
+        result = await self.primary.update_assigned(query_id, assigned_to)
+        self._mirror("update_assigned", query_id, assigned_to)
+        return result
+
+    async def update_response(self, query_id, response):
+        result = await self.primary.update_response(query_id, response)
+        self._mirror("update_response", query_id, response)
+        return result
+
+    async def update_status(self, query_id, status):
+        result = await self.primary.update_status(query_id, status)
+        self._mirror("update_status", query_id, status)
+        return result
+
+    async def update_resolved_time(self, query_id, resolved_at=None):
+        # ミラーが遅れて書き込んでも同じ日時になるよう、ここで決めた日時を両方に渡す
+        resolved_at = resolved_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        result = await self.primary.update_resolved_time(query_id, resolved_at)
+        self._mirror("update_resolved_time", query_id, resolved_at)
+        return result
+
+    async def update_queries(self, query_ids, fields):
+        updated = await self.primary.update_queries(query_ids, fields)
+        if updated:
+            self._mirror("update_queries", updated, fields)
+        return updated
+
+    async def find_query_ids(self, filters):
+        return await self.primary.find_query_ids(filters)
+
+    async def get_query(self, query_id, fresh=False):
+        return await self.primary.get_query(query_id, fresh)
+
+    async def get_all_queries(self):
+        return await self.primary.get_all_queries()
+
+    # テンプレートはスプレッドシート上で編集されるため、スプレッドシートを正とする
+
+    async def get_templates(self):
+        return await self.mirror.get_templates()
+
+    async def add_template(self, category, template_id, name, template_text):
+        return await self.mirror.add_template(category, template_id, name, template_text)
+
+    async def delete_template(self, template_id):
+        return await self.mirror.delete_template(template_id)
+
+    async def get_modified_time(self):
+        return await self.mirror.get_modified_time()
+
+    async def get_cell_value(self, sheet_name, cell_label):
+        return await self.mirror.get_cell_value(sheet_name, cell_label)
+
+    async def update_stats(self):
+        result = await self.primary.update_stats()
+        self._mirror("update_stats")
+        return result
+
+    async def get_todays_stats(self):
+        return await self.primary.get_todays_stats()
+
+    async def export_queries(self, days=7):
+        return await self.primary.export_queries(days)
+
+    async def search_queries(self, keyword):
+        return await self.primary.search_queries(keyword)
+
+    async def search_queries_page(self, keyword, after=None, limit=5):
+        return await self.primary.search_queries_page(keyword, after, limit)
+
+    async def analyze_queries(self, period="week", start=None, end=None):
+        return await self.primary.analyze_queries(period, start, end)
+
+    async def rebuild_rollups(self):
+        return await self.primary.rebuild_rollups()
+
+    async def get_hourly_counts(self, start, end):
+        return await self.primary.get_hourly_counts(start, end)
+
+    async def get_query_events(self, query_id):
+        return await self.primary.get_query_events(query_id)
+
+async def create_storage(backend, sheets_manager=None, sqlite_path="data/support_hub.db"):
+    """設定に応じたストレージを作成（backend: sheets / sqlite / dual）"""
+    if backend == "sheets":
+        return sheets_manager
+
+    # 循環importを避けるためここで読み込む
+    from data_manager.sqlite_backend import SQLiteBackend
+
+    sqlite_backend = SQLiteBackend(sqlite_path)
+
+    # 初回はスプレッドシートの既存データを取り込む
+    if sheets_manager is not None and await sqlite_backend.is_empty():
+        rows = await sheets_manager.get_all_queries()
+        if rows:
+            await sqlite_backend.import_queries(rows)
+            logger.info(f"スプレッドシートから{len(rows)}件の問い合わせを取り込みました")
+
+        # sqliteモードではテンプレートもSQLiteで管理する
+        if backend == "sqlite" and not await sqlite_backend.get_templates():
+            for template in await sheets_manager.get_templates():
+                if template.get("template_id"):
+                    await sqlite_backend.add_template(
+                        template.get("category", "general"), template["template_id"],
+                        template.get("name", ""), template.get("template_text", "")
+                    )
+
+    if backend == "sqlite":
+        return sqlite_backend
+
+    if backend == "dual":
+        if sheets_manager is None:
+            raise ValueError("dual モードにはスプレッドシートの設定が必要です")
+        return DualWriteStorage(sqlite_backend, sheets_manager)
+
+    raise ValueError(f"不明なストレージ種別です: {backend}")
\ No newline at end of file
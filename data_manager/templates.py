@@ -10,38 +10,150 @@ import logging
 import json
 import os
 import re
+import asyncio
+import hashlib
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# テンプレート定数の設定ファイル
+TEMPLATE_CONSTANTS_PATH = "config/template_constants.json"
+
+# 設定ファイルがない場合の定数
+DEFAULT_TEMPLATE_CONSTANTS = {
+    "company_name": "株式会社サンプル",
+    "support_email": "support@example.com",
+    "support_phone": "03-1234-5678"
+}
+
+# 問い合わせごとに値が変わる変数
+QUERY_VARIABLES = ("username", "query_id", "category", "timestamp", "date", "time")
+
+# プレースホルダーの書式: {name}
+PLACEHOLDER_PATTERN = re.compile(r"\{(\w+)\}")
+
+# 変更確認の間隔（秒）
+TEMPLATE_REFRESH_INTERVAL = 60
+
+class CompiledTemplate:
+    """プレースホルダーをスロット化したテンプレート"""
+
+    __slots__ = ("text", "literals", "slots", "unknown")
+
+    def __init__(self, text, constants):
+        """テンプレート本文をリテラルとスロットに分解"""
+        self.text = text
+        self.literals = []
+        self.slots = []
+        self.unknown = []
+
+        # split結果は「リテラル, 変数名, リテラル, 変数名, ...」の並び
+        parts = PLACEHOLDER_PATTERN.split(text)
+        literal = parts[0]
+
+        for i in range(1, len(parts), 2):
+            name = parts[i]
+
+            if name in QUERY_VARIABLES:
+                self.literals.append(literal)
+                self.slots.append(name)
+                literal = parts[i + 1]
+                continue
+
+            if name in constants:
+                # 定数はコンパイル時に埋め込む
+                literal += constants[name]
+            else:
+                # 未知の変数はそのまま残す
+                literal += "{" + name + "}"
+                self.unknown.append(name)
+
+            literal += parts[i + 1]
+
+        self.literals.append(literal)
+
+    def render(self, values):
+        """変数を一度の走査で埋め込む"""
+        literals = self.literals
+        chunks = [literals[0]]
+
+        for i, name in enumerate(self.slots):
+            chunks.append(values[name])
+            chunks.append(literals[i + 1])
+
+        return "".join(chunks)
+
+class TemplateSet:
+    """読み込み済みテンプレートの索引（丸ごと差し替えて使う）"""
+
+    __slots__ = ("templates", "by_id", "compiled", "checksum", "version", "rows")
+
+    def __init__(self, templates=None, by_id=None, compiled=None, checksum=None, version=0, rows=None):
+        """初期化（rows: 読み込んだシートの行、スナップショットに保存する）"""
+        self.templates = templates or {}
+        self.by_id = by_id or {}
+        self.compiled = compiled or {}
+        self.checksum = checksum
+        self.version = version
+        self.rows = rows or []
+
+def load_template_constants():
+    """テンプレート定数を設定ファイルから読み込み"""
+    constants = dict(DEFAULT_TEMPLATE_CONSTANTS)
+
+    try:
+        with open(TEMPLATE_CONSTANTS_PATH, 'r', encoding='utf-8') as f:
+            constants.update({key: str(value) for key, value in json.load(f).items()})
+
+    except FileNotFoundError:
+        logger.info(f"{TEMPLATE_CONSTANTS_PATH} がないためデフォルトの定数を使用します")
+
+    except Exception as e:
+        logger.warning(f"テンプレート定数ファイルの読み込みに失敗しました: {e}")
+
+    return constants
+
 class TemplateManager:
     """返信テンプレートを管理するクラス"""
 
-    def __init__(self, sheets_manager):
+    def __init__(self, storage, constants=None, checksum_cell=None):
         """初期化"""
-        self.sheets_manager = sheets_manager
-        self.templates = {}
+        self.storage = storage
+        self.constants = constants if constants is not None else load_template_constants()
+        # templatesシート上のチェックサムセル（例: "F1"）。未設定ならDriveの更新日時を使う
+        self.checksum_cell = checksum_cell
+        self.template_set = TemplateSet()
+        self.change_signal = None
         self.last_update = None
+        self._reload_lock = asyncio.Lock()
 
-    async def load_templates(self):
-        """スプレッドシートからテンプレートを読み込む"""
-        try:
-            templates_data = await self.sheets_manager.get_templates()
+    @property
+    def templates(self):
+        """カテゴリ別のテンプレート"""
+        return self.template_set.templates
 
-            # カテゴリ別にテンプレートを整理
-            self.templates = {}
-            for template in templates_data:
-                category = template.get("category", "general")
-                template_id = template.get("template_id", "")
+    @property
+    def version(self):
+        """テンプレートセットのバージョン"""
+        return self.template_set.version
 
-                if not template_id:
-                    continue
+    async def load_templates(self):
+        """ストレージからテンプレートを読み込む"""
+        async with self._reload_lock:
+            return await self._load_templates()
 
-                if category not in self.templates:
-                    self.templates[category] = []
+    async def _load_templates(self):
+        """テンプレートを読み込み、内容が変わっていれば索引を差し替える"""
+        try:
+            templates_data = await self.storage.get_templates()
 
-                self.templates[category].append(template)
+            # 内容が前回と同じなら再構築しない
+            checksum = self._checksum(templates_data)
+            if self.template_set.version and checksum == self.template_set.checksum:
+                self.last_update = datetime.now()
+                return True
 
+            self._apply_templates(templates_data, checksum)
             self.last_update = datetime.now()
             logger.info(f"{len(templates_data)}件のテンプレートを読み込みました")
 
@@ -51,58 +163,142 @@ class TemplateManager:
             logger.error(f"テンプレートの読み込みに失敗しました: {e}", exc_info=True)
             return False
 
-    async def get_template(self, template_id):
-        """指定IDのテンプレートを取得"""
-        # 最終更新から1時間以上経過していたら再読み込み
-        if not self.last_update or (datetime.now() - self.last_update).total_seconds() > 3600:
-            await self.load_templates()
+    @staticmethod
+    def _checksum(templates_data):
+        """テンプレートの行の内容のチェックサム"""
+        return hashlib.sha1(
+            json.dumps(templates_data, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def _apply_templates(self, templates_data, checksum):
+        """テンプレートの行から索引を作成して差し替える"""
+        current = self.template_set
+
+        # カテゴリ別・ID別に索引を作成
+        templates = {}
+        templates_by_id = {}
+        compiled = {}
+
+        for template in templates_data:
+            category = template.get("category", "general")
+            template_id = template.get("template_id", "")
+
+            if not template_id:
+                continue
+
+            if category not in templates:
+                templates[category] = []
+
+            templates[category].append(template)
+            templates_by_id[template_id] = template
+
+            # 本文が変わっていなければ前回のコンパイル結果を再利用
+            template_text = template.get("template_text", "")
+            previous = current.compiled.get(template_id)
+            if previous is not None and previous.text == template_text:
+                compiled[template_id] = previous
+                continue
+
+            compiled[template_id] = CompiledTemplate(template_text, self.constants)
+            if compiled[template_id].unknown:
+                unknown = ", ".join("{" + name + "}" for name in compiled[template_id].unknown)
+                logger.warning(f"テンプレート {template_id} に未知の変数があります: {unknown}")
+
+        # 読み込み中の参照に影響しないよう、索引を一度に差し替える
+        self.template_set = TemplateSet(templates, templates_by_id, compiled, checksum, current.version + 1, templates_data)
+
+    def snapshot(self):
+        """スナップショットに保存する状態（テンプレートの行と変更検知用のシグナル）"""
+        if not self.template_set.version:
+            return None
+        return {"rows": self.template_set.rows, "signal": self.change_signal}
 
-        # すべてのカテゴリからテンプレートを検索
-        for category, templates in self.templates.items():
-            for template in templates:
-                if template.get("template_id") == template_id:
-                    return template
+    def restore(self, state):
+        """スナップショットのテンプレートを読み込む（変更はrefresh_loopが確認する）"""
+        if not state or not state.get("rows"):
+            return False
 
-        return None
+        self._apply_templates(state["rows"], self._checksum(state["rows"]))
+        self.change_signal = state.get("signal")
+        self.last_update = datetime.now()
+        logger.info(f"スナップショットから{len(state['rows'])}件のテンプレートを読み込みました")
+        return True
 
-    async def get_templates_by_category(self, category):
-        """カテゴリ別のテンプレート一覧を取得"""
-        # 最終更新から1時間以上経過していたら再読み込み
-        if not self.last_update or (datetime.now() - self.last_update).total_seconds() > 3600:
+    async def _get_change_signal(self):
+        """変更検知用のシグナルを取得"""
+        if self.checksum_cell:
+            return await self.storage.get_cell_value("templates", self.checksum_cell)
+
+        return await self.storage.get_modified_time()
+
+    async def refresh_if_changed(self):
+        """変更シグナルを確認し、変わっていた場合のみ再読み込み"""
+        async with self._reload_lock:
+            signal = await self._get_change_signal()
+
+            # シグナルが取得できない場合は読み込みで内容を比較する
+            if signal is not None and signal == self.change_signal:
+                return False
+
+            version = self.template_set.version
+            if await self._load_templates():
+                self.change_signal = signal
+
+            return self.template_set.version != version
+
+    async def refresh_loop(self, interval=TEMPLATE_REFRESH_INTERVAL):
+        """バックグラウンドでテンプレートの変更を監視するタスク"""
+        logger.info(f"テンプレート更新監視を開始しました（{interval}秒間隔）")
+        while True:
+            try:
+                if await self.refresh_if_changed():
+                    logger.info(f"テンプレートを更新しました (バージョン {self.version})")
+
+            except Exception as e:
+                logger.error(f"テンプレート更新確認中にエラーが発生しました: {e}", exc_info=True)
+
+            await asyncio.sleep(interval)
+
+    async def _ensure_loaded(self):
+        """未読み込みの場合のみ読み込む（以降の更新はバックグラウンドで行う）"""
+        if not self.template_set.version:
             await self.load_templates()
 
-        return self.templates.get(category, [])
+    async def get_template(self, template_id):
+        """指定IDのテンプレートを取得"""
+        await self._ensure_loaded()
+        return self.template_set.by_id.get(template_id)
+
+    async def get_templates_by_category(self, category):
+        """カテゴリ別のテンプレート一覧を取得"""
+        await self._ensure_loaded()
+        return self.template_set.templates.get(category, [])
 
     async def apply_template(self, template_id, query_data):
         """テンプレートを適用して返信文を生成"""
-        template = await self.get_template(template_id)
-        if not template:
-            return None
+        await self._ensure_loaded()
 
-        template_text = template.get("template_text", "")
+        compiled = self.template_set.compiled.get(template_id)
+        if compiled is None:
+            return None
 
         # 変数置換
-        replacements = {
-            "{username}": query_data.get("username", "お客様"),
-            "{query_id}": query_data.get("query_id", ""),
-            "{category}": query_data.get("category", ""),
-            "{timestamp}": query_data.get("timestamp", ""),
-            "{date}": datetime.now().strftime("%Y年%m月%d日"),
-            "{time}": datetime.now().strftime("%H:%M"),
-            "{company_name}": "株式会社サンプル",  # 実際には設定ファイルから読み込むべき
-            "{support_email}": "support@example.com",
-            "{support_phone}": "03-1234-5678"
+        now = datetime.now()
+        values = {
+            "username": str(query_data.get("username") or "お客様"),
+            "query_id": str(query_data.get("query_id", "")),
+            "category": str(query_data.get("category", "")),
+            "timestamp": str(query_data.get("timestamp", "")),
+            "date": now.strftime("%Y年%m月%d日"),
+            "time": now.strftime("%H:%M")
         }
 
-        for key, value in replacements.items():
-            template_text = template_text.replace(key, value)
-
-        return template_text
+        return compiled.render(values)
 
     async def add_custom_template(self, category, template_text, name=None):
         """カスタムテンプレートを追加"""
         try:
-            templates_data = await self.sheets_manager.get_templates()
+            templates_data = await self.storage.get_templates()
 
             # 新しいテンプレートIDを生成
             template_ids = [t.get("template_id", "") for t in templates_data]
@@ -118,10 +314,8 @@ class TemplateManager:
             if not name:
                 name = f"{category.capitalize()} Template {next_number}"
 
-            # スプレッドシートに追加
-            sheet = self.sheets_manager._get_sheet("templates")
-            row_data = [category, template_id, name, template_text]
-            sheet.append_row(row_data)
+            # ストレージに追加
+            await self.storage.add_template(category, template_id, name, template_text)
 
             # キャッシュを更新
             await self.load_templates()
@@ -136,16 +330,9 @@ class TemplateManager:
     async def delete_template(self, template_id):
         """テンプレートを削除"""
         try:
-            sheet = self.sheets_manager._get_sheet("templates")
-
-            # テンプレートIDを検索
-            cell = sheet.find(template_id)
-            if not cell:
+            if not await self.storage.delete_template(template_id):
                 return False
 
-            # 行を削除
-            sheet.delete_rows(cell.row)
-
             # キャッシュを更新
             await self.load_templates()
 
@@ -7,13 +7,20 @@ Discordボット実装: サポートボットのコア機能
 """
 
 import os
+import re
 import discord
 from discord.ext import commands
 import logging
 import json
 import asyncio
+import time
 from datetime import datetime
 
+from monitoring.metrics import REGISTRY, track
+from monitoring.profiler import PROFILER
+from discord_bot.commands import SupportCommands
+from discord_bot.forward_batcher import ForwardBatcher, BATCH_WINDOW
+
 logger = logging.getLogger(__name__)
 
 # サポートカテゴリ設定
@@ -26,11 +33,74 @@ SUPPORT_CATEGORIES = {
     "feature": "機能リクエスト"
 }
 
+# 有効なステータス
+VALID_STATUSES = ["未対応", "対応中", "完了", "保留中", "クローズ"]
+
+# 一括操作で1回に指定できる問い合わせ数
+MAX_BULK_QUERIES = 500
+
+# 一括操作の条件指定（キー=値）と対応する列
+FILTER_KEYS = {
+    "category": "category",
+    "status": "status",
+    "user": "username",
+    "assigned": "assigned_to"
+}
+
+# 問い合わせIDの範囲指定（例: Q100-Q150）
+QUERY_RANGE_PATTERN = re.compile(r"^Q(\d+)-Q?(\d+)$", re.IGNORECASE)
+
+def parse_query_targets(tokens):
+    """問い合わせの指定（Q001 / Q001,Q005 / Q100-Q150 / category=complaint）をIDと条件に分解"""
+    query_ids = []
+    filters = {}
+
+    for token in tokens:
+        for part in token.split(","):
+            part = part.strip()
+            if not part:
+                continue
+
+            # 条件指定
+            if "=" in part:
+                key, value = part.split("=", 1)
+                if key not in FILTER_KEYS:
+                    raise ValueError(f"不明な条件です: {key}（使用可能: {', '.join(FILTER_KEYS)}）")
+                filters[FILTER_KEYS[key]] = value
+                continue
+
+            # 範囲指定
+            match = QUERY_RANGE_PATTERN.match(part)
+            if match:
+                first, last = sorted((int(match.group(1)), int(match.group(2))))
+                if last - first + 1 > MAX_BULK_QUERIES:
+                    raise ValueError(f"一度に指定できるのは{MAX_BULK_QUERIES}件までです")
+                query_ids.extend(f"Q{number:03d}" for number in range(first, last + 1))
+                continue
+
+            query_ids.append(part)
+
+    return query_ids, filters
+
+def is_bulk_target(targets):
+    """一括指定（複数・範囲・条件）かどうか"""
+    return len(targets) > 1 or any(mark in targets[0] for mark in (",", "-", "="))
+
+def format_query_ids(query_ids, limit=20):
+    """問い合わせIDの一覧を短く表示"""
+    shown = ", ".join(query_ids[:limit])
+    if len(query_ids) > limit:
+        shown += f" …他{len(query_ids) - limit}件"
+    return shown
+
 class SupportBot(commands.Bot):
     """サポート用Discordボットクラス"""
 
-    def __init__(self, templates, sheets_manager):
-        """初期化"""
+    def __init__(self, template_manager, storage, reply_queue=None, forward_batch_window=BATCH_WINDOW,
+                 anomaly_detector=None):
+        """初期化（reply_queue: X上の返信の送信キュー、Noneの場合は返信を記録するのみ。
+        forward_batch_window: バースト時に転送をまとめる待ち時間（秒）、0の場合は1件ずつ送信して完了を待つ。
+        anomaly_detector: 問い合わせの急増検知、急増は通知チャンネルに送信する）"""
         intents = discord.Intents.default()
         intents.message_content = True
         intents.members = True
@@ -38,13 +108,51 @@ class SupportBot(commands.Bot):
         super().__init__(command_prefix='!', intents=intents)
 
         self.support_channels = {}
-        self.sheets_manager = sheets_manager
-        self.templates = templates
+        # 転送先のチャンネルが決まったか（スナップショットからの復元、または接続後のsetup_channels）
+        self.channels_ready = asyncio.Event()
+        self.storage = storage
+        self.template_manager = template_manager
+        self.reply_queue = reply_queue
+        self.forward_batcher = ForwardBatcher(forward_batch_window) if forward_batch_window else None
+        self.anomaly_detector = anomaly_detector
+        if anomaly_detector is not None:
+            anomaly_detector.notify = self.notify_anomaly
 
         # コマンドの登録
         self.remove_command("help")  # デフォルトのhelpコマンドを削除
         self._load_commands()
 
+        # コマンドごとの処理時間を計測
+        self.before_invoke(self._before_command)
+        self.after_invoke(self._after_command)
+
+    async def setup_hook(self):
+        """起動準備: 追加コマンド（Cog）を登録"""
+        await self.add_cog(SupportCommands(self, self.storage))
+
+    async def _before_command(self, ctx):
+        """コマンド実行前: 計測を開始"""
+        ctx.command_started_at = time.perf_counter()
+        ctx.profile_token = PROFILER.begin(f"command.{ctx.command.qualified_name}") if ctx.command else None
+
+    async def _after_command(self, ctx):
+        """コマンド実行後: 処理時間と失敗数を記録"""
+        PROFILER.end(getattr(ctx, "profile_token", None))
+
+        started_at = getattr(ctx, "command_started_at", None)
+        if started_at is None or ctx.command is None:
+            return
+
+        command_name = ctx.command.qualified_name
+        REGISTRY.histogram(
+            "discord_command_duration_seconds", "Discordコマンドの処理時間（秒）", ("command",)
+        ).observe(time.perf_counter() - started_at, command=command_name)
+
+        if ctx.command_failed:
+            REGISTRY.counter(
+                "discord_command_errors_total", "Discordコマンドのエラー件数", ("command",)
+            ).inc(command=command_name)
+
     async def on_ready(self):
         """ボット起動時の処理"""
         logger.info(f"{self.user.name} が起動しました！")
@@ -96,6 +204,30 @@ class SupportBot(commands.Bot):
 
             self.support_channels["notifications"] = notification_channel
 
+        if "general" in self.support_channels:
+            self.channels_ready.set()
+
+    async def wait_for_channels(self):
+        """転送先のチャンネルが決まるまで待機（それまでに転送すると送信先がなく失われる）"""
+        await self.channels_ready.wait()
+
+    def snapshot(self):
+        """スナップショットに保存する状態（カテゴリごとのチャンネルID）"""
+        return {"channels": {category: channel.id for category, channel in self.support_channels.items()}}
+
+    def restore_channels(self, state):
+        """スナップショットのチャンネルIDから送信先を復元（ログイン後、接続の完了を待たずに転送できる。
+        接続が完了するとsetup_channelsで実際のチャンネルに置き換える）"""
+        channels = (state or {}).get("channels", {})
+        if "notifications" not in channels or "general" not in channels:
+            return False
+
+        for category, channel_id in channels.items():
+            self.support_channels.setdefault(category, self.get_partial_messageable(int(channel_id)))
+        logger.info(f"スナップショットから{len(channels)}件のチャンネルを復元しました")
+        self.channels_ready.set()
+        return True
+
     def _load_commands(self):
         """コマンドを登録"""
         @self.command(name="help")
@@ -109,10 +241,10 @@ class SupportBot(commands.Bot):
 
             commands_list = [
                 ("!help", "このヘルプメッセージを表示"),
-                ("!assign @ユーザー #問い合わせID", "問い合わせを担当者にアサイン"),
+                ("!assign @ユーザー #問い合わせID", "問い合わせを担当者にアサイン（Q100-Q150・Q1,Q2・category=spam などで一括指定可）"),
                 ("!reply #問い合わせID 返信内容", "問い合わせに返信"),
                 ("!template #テンプレートID #問い合わせID", "テンプレートを使用して返信"),
-                ("!status #問い合わせID #ステータス", "問い合わせのステータスを更新"),
+                ("!status #問い合わせID #ステータス", "問い合わせのステータスを更新（一括指定は !assign と同じ）"),
                 ("!stats", "今日の問い合わせ統計を表示")
             ]
 
@@ -123,14 +255,28 @@ class SupportBot(commands.Bot):
             await ctx.send(embed=embed)
 
         @self.command(name="assign")
-        async def assign_command(ctx, member: discord.Member, query_id: str):
+        async def assign_command(ctx, member: discord.Member, *targets: str):
             """問い合わせを担当者にアサイン"""
             if not ctx.author.guild_permissions.manage_messages:
                 await ctx.send("このコマンドを使用する権限がありません。")
                 return
 
+            if not targets:
+                await ctx.send("❌ 問い合わせIDを指定してください。例: !assign @ユーザー Q001 / Q100-Q150 / category=billing")
+                return
+
+            # 複数指定は1回の一括更新で処理
+            if is_bulk_target(targets):
+                await self._bulk_update(
+                    ctx, targets, {"assigned_to": member.name, "status": "対応中"},
+                    f"{member.mention} にアサインしました", f"{member.name} にアサインしました"
+                )
+                return
+
+            query_id = targets[0]
+
             try:
-                await self.sheets_manager.update_assigned(query_id, member.name)
+                await self.storage.update_assigned(query_id, member.name)
                 await ctx.send(f"✅ 問い合わせ {query_id} を {member.mention} にアサインしました。")
 
                 # 通知チャンネルにも通知
@@ -150,13 +296,13 @@ class SupportBot(commands.Bot):
 
             try:
                 # 問い合わせの詳細を取得
-                query_data = await self.sheets_manager.get_query(query_id)
+                query_data = await self.storage.get_query(query_id)
                 if not query_data:
                     await ctx.send(f"❌ 問い合わせ {query_id} が見つかりません。")
                     return
 
                 # 返信をスプレッドシートに記録
-                await self.sheets_manager.update_response(query_id, response)
+                await self.storage.update_response(query_id, response)
 
                 # 返信の確認メッセージを送信
                 embed = discord.Embed(
@@ -170,8 +316,7 @@ class SupportBot(commands.Bot):
 
                 await ctx.send(embed=embed)
 
-                # XにAPIで返信するロジックは実際の実装時に追加
-                await ctx.send("✅ 返信が記録されました。X上でも返信を行います。")
+                await self._queue_reply(ctx, query_id, response, "返信")
 
             except Exception as e:
                 logger.error(f"返信処理中にエラーが発生しました: {e}")
@@ -186,28 +331,22 @@ class SupportBot(commands.Bot):
 
             try:
                 # テンプレートを取得
-                template = None
-                for t in self.templates:
-                    if t.get("template_id") == template_id:
-                        template = t
-                        break
-
+                template = await self.template_manager.get_template(template_id)
                 if not template:
                     await ctx.send(f"❌ テンプレート {template_id} が見つかりません。")
                     return
 
                 # 問い合わせの詳細を取得
-                query_data = await self.sheets_manager.get_query(query_id)
+                query_data = await self.storage.get_query(query_id)
                 if not query_data:
                     await ctx.send(f"❌ 問い合わせ {query_id} が見つかりません。")
                     return
 
                 # テンプレートの変数を置換
-                response_text = template.get("template_text", "")
-                response_text = response_text.replace("{username}", query_data.get("username", "お客様"))
+                response_text = await self.template_manager.apply_template(template_id, query_data)
 
                 # 返信を記録
-                await self.sheets_manager.update_response(query_id, response_text)
+                await self.storage.update_response(query_id, response_text)
 
                 # 返信の確認メッセージを送信
                 embed = discord.Embed(
@@ -221,31 +360,45 @@ class SupportBot(commands.Bot):
 
                 await ctx.send(embed=embed)
 
-                # XにAPIで返信するロジックは実際の実装時に追加
-                await ctx.send("✅ テンプレート返信が記録されました。X上でも返信を行います。")
+                await self._queue_reply(ctx, query_id, response_text, "テンプレート返信")
 
             except Exception as e:
                 logger.error(f"テンプレート返信処理中にエラーが発生しました: {e}")
                 await ctx.send(f"❌ エラーが発生しました: {str(e)}")
 
         @self.command(name="status")
-        async def status_command(ctx, query_id: str, status: str):
+        async def status_command(ctx, *args: str):
             """問い合わせのステータスを更新"""
             if not ctx.author.guild_permissions.manage_messages:
                 await ctx.send("このコマンドを使用する権限がありません。")
                 return
 
-            valid_statuses = ["未対応", "対応中", "完了", "保留中", "クローズ"]
-            if status not in valid_statuses:
-                await ctx.send(f"❌ 無効なステータスです。有効なステータス: {', '.join(valid_statuses)}")
+            if len(args) < 2:
+                await ctx.send("❌ 問い合わせIDとステータスを指定してください。例: !status Q001 完了 / !status Q100-Q150 クローズ")
                 return
 
+            targets, status = args[:-1], args[-1]
+            if status not in VALID_STATUSES:
+                await ctx.send(f"❌ 無効なステータスです。有効なステータス: {', '.join(VALID_STATUSES)}")
+                return
+
+            # 複数指定は1回の一括更新で処理（完了の場合は解決時間も同時に記録）
+            if is_bulk_target(targets):
+                fields = {"status": status}
+                if status == "完了" or status == "クローズ":
+                    fields["resolved_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                message = f"ステータスを「{status}」に更新しました"
+                await self._bulk_update(ctx, targets, fields, message, message)
+                return
+
+            query_id = targets[0]
+
             try:
-                await self.sheets_manager.update_status(query_id, status)
+                await self.storage.update_status(query_id, status)
 
                 # 完了の場合は解決時間も記録
                 if status == "完了" or status == "クローズ":
-                    await self.sheets_manager.update_resolved_time(query_id)
+                    await self.storage.update_resolved_time(query_id)
 
                 await ctx.send(f"✅ 問い合わせ {query_id} のステータスを「{status}」に更新しました。")
 
@@ -261,7 +414,7 @@ class SupportBot(commands.Bot):
         async def stats_command(ctx):
             """今日の問い合わせ統計を表示"""
             try:
-                stats = await self.sheets_manager.get_todays_stats()
+                stats = await self.storage.get_todays_stats()
 
                 embed = discord.Embed(
                     title="今日の問い合わせ統計",
@@ -283,6 +436,93 @@ class SupportBot(commands.Bot):
                 logger.error(f"統計取得処理中にエラーが発生しました: {e}")
                 await ctx.send(f"❌ エラーが発生しました: {str(e)}")
 
+    async def _queue_reply(self, ctx, query_id, response, label):
+        """X上の返信を送信キューに追加（投稿を待たずに応答し、結果は後からこのチャンネルに報告）"""
+        if self.reply_queue is None:
+            await ctx.send(f"✅ {label}が記録されました。（X上には返信しません）")
+        elif self.reply_queue.submit(query_id, response, ctx.channel):
+            await ctx.send(f"✅ {label}が記録されました。X上での返信を送信キューに追加しました。")
+        else:
+            await ctx.send(f"⚠️ {label}が記録されました。問い合わせ {query_id} のX上での返信はすでに送信待ちです。")
+
+    async def _bulk_update(self, ctx, targets, fields, result_message, notification_message):
+        """複数の問い合わせを一括更新し、結果と通知を1件ずつ送信"""
+        try:
+            query_ids, filters = parse_query_targets(targets)
+
+            # 条件指定がある場合は一致するIDに絞り込む（ID指定と併用時は両方に一致するもの）
+            if filters:
+                matched = await self.storage.find_query_ids(filters)
+                if query_ids:
+                    matched_ids = set(matched)
+                    query_ids = [query_id for query_id in query_ids if query_id in matched_ids]
+                else:
+                    query_ids = matched
+
+            query_ids = list(dict.fromkeys(query_ids))
+            if not query_ids:
+                await ctx.send("❌ 対象の問い合わせが見つかりません。")
+                return
+
+            if len(query_ids) > MAX_BULK_QUERIES:
+                await ctx.send(f"❌ 対象が{len(query_ids)}件あります。一度に更新できるのは{MAX_BULK_QUERIES}件までです。")
+                return
+
+            updated = await self.storage.update_queries(query_ids, fields)
+            updated_ids = set(updated)
+            missing = [query_id for query_id in query_ids if query_id not in updated_ids]
+
+            message = f"✅ {len(updated)}件の問い合わせを{result_message}。\n{format_query_ids(updated)}"
+            if missing:
+                message += f"\n⚠️ 見つからなかったID: {format_query_ids(missing)}"
+            await ctx.send(message)
+
+            # 通知チャンネルにはまとめて1件だけ通知
+            if updated:
+                notification = f"📝 {ctx.author.name} が{len(updated)}件の問い合わせを{notification_message}: {format_query_ids(updated)}"
+                await self.support_channels["notifications"].send(notification)
+
+        except ValueError as e:
+            await ctx.send(f"❌ {e}")
+
+        except Exception as e:
+            logger.error(f"一括更新処理中にエラーが発生しました: {e}", exc_info=True)
+            await ctx.send(f"❌ エラーが発生しました: {str(e)}")
+
+    async def flush_forwards(self):
+        """Discordへの転送待ちがなくなるまで待機（終了時など）"""
+        if self.forward_batcher is not None:
+            await self.forward_batcher.flush()
+
+    def observe_query(self, query_data, created_at=None):
+        """届いた問い合わせを急増検知に渡す（created_at: 元のツイートの投稿日時）"""
+        if self.anomaly_detector is None:
+            return
+        self.anomaly_detector.start()
+        self.anomaly_detector.observe(query_data.get("category"), created_at)
+
+    async def notify_anomaly(self, alert):
+        """問い合わせの急増を通知チャンネルに送信"""
+        channel = self.support_channels.get("notifications")
+        if channel is None:
+            logger.warning("通知チャンネルが未設定のため、急増の通知を送信できません")
+            return
+
+        category = alert["category"]
+        label = "全体" if category == "all" else SUPPORT_CATEGORIES.get(category, category)
+        message = (
+            f"@here 🚨 {label}の問い合わせが急増しています: {alert['window_start'].strftime('%H:%M')}からの"
+            f"{alert['count']}件（平常時は{alert['expected']:.1f}件程度）"
+        )
+        with track("discord_send", channel="notifications"):
+            await channel.send(message)
+
+    def describe_trend(self):
+        """急増検知から見た現在の傾向（急増検知を使っていなければNone）"""
+        if self.anomaly_detector is None:
+            return None
+        return self.anomaly_detector.describe(SUPPORT_CATEGORIES)
+
     async def forward_query(self, query_data):
         """Xからの問い合わせをDiscordに転送する"""
         try:
@@ -315,12 +555,22 @@ class SupportBot(commands.Bot):
             # 通知用メンション
             mention = "@here" if category in ["complaint", "billing"] else ""
 
+            # 全体通知チャンネルへの通知
+            notification = f"📢 新規問い合わせ {query_data.get('query_id')} が {SUPPORT_CATEGORIES.get(category, category)} カテゴリに届きました。"
+
+            if self.forward_batcher is not None:
+                # チャンネルごとの送信待ちに追加（送信は待たず、バースト時はまとめて送信）
+                self.forward_batcher.submit(channel, "category", embed=embed, mention=bool(mention))
+                self.forward_batcher.submit(self.support_channels["notifications"], "notifications", text=notification)
+                return True
+
             # 送信
-            await channel.send(content=mention, embed=embed)
+            with track("discord_send", channel="category"):
+                await channel.send(content=mention, embed=embed)
 
             # 全体通知チャンネルにも通知
-            notification = f"📢 新規問い合わせ {query_data.get('query_id')} が {SUPPORT_CATEGORIES.get(category, category)} カテゴリに届きました。"
-            await self.support_channels["notifications"].send(notification)
+            with track("discord_send", channel="notifications"):
+                await self.support_channels["notifications"].send(notification)
 
             return True
 
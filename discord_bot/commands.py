@@ -10,16 +10,35 @@ import discord
 from discord.ext import commands
 import logging
 import asyncio
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from monitoring.profiler import PROFILER
+from discord_bot.search_view import SearchCursorCache, SearchView
 
 logger = logging.getLogger(__name__)
 
+def _parse_range_bound(value):
+    """期間指定の日付（YYYY-MM-DD）または日時（YYYY-MM-DDTHH）と、その長さ"""
+    if "T" in value:
+        return datetime.strptime(value, "%Y-%m-%dT%H"), timedelta(hours=1)
+    return datetime.strptime(value, "%Y-%m-%d"), timedelta(days=1)
+
+def parse_analysis_range(since, until=None):
+    """!analyze の任意期間を[開始, 終了)に変換（終了日・時間を含む、省略時は開始と同じ日・時間）"""
+    start, _ = _parse_range_bound(since)
+    last, length = _parse_range_bound(until or since)
+    end = last + length
+    if start >= end:
+        raise ValueError("終了が開始より前です")
+    return start, end
+
 class SupportCommands(commands.Cog):
     """サポート関連のコマンドを提供するCog"""
 
-    def __init__(self, bot, sheets_manager):
+    def __init__(self, bot, storage):
         self.bot = bot
-        self.sheets_manager = sheets_manager
+        self.storage = storage
+        self.search_cursors = SearchCursorCache()
 
     @commands.command(name="export")
     @commands.has_permissions(administrator=True)
@@ -29,7 +48,7 @@ class SupportCommands(commands.Cog):
             await ctx.send(f"過去{days}日分の問い合わせデータをエクスポートしています...")
 
             # データをエクスポート
-            file_path = await self.sheets_manager.export_queries(days)
+            file_path = await self.storage.export_queries(days)
 
             if not file_path:
                 await ctx.send("エクスポートするデータがありませんでした。")
@@ -51,60 +70,85 @@ class SupportCommands(commands.Cog):
         try:
             await ctx.send(f"キーワード「{keyword}」で検索しています...")
 
-            # 検索を実行
-            results = await self.sheets_manager.search_queries(keyword)
+            # 最初のページだけを取得（続きはボタンが押されたときに取得）
+            session = self.search_cursors.start(ctx.author.id, keyword)
+            view = SearchView(self.storage, self.search_cursors, ctx.author.id, session)
+            embed = await view.load(0)
 
-            if not results:
+            if embed is None:
+                self.search_cursors.discard(ctx.author.id)
                 await ctx.send("検索結果はありませんでした。")
                 return
 
-            # 結果を表示
-            embed = discord.Embed(
-                title=f"検索結果: {keyword}",
-                description=f"{len(results)}件の問い合わせが見つかりました。",
-                color=discord.Color.green()
-            )
+            # 1ページに収まる場合はボタンを付けない
+            if not view.has_pages:
+                self.search_cursors.discard(ctx.author.id)
+                view.stop()
+                await ctx.send(embed=embed)
+                return
 
-            # 最大5件まで表示
-            for i, result in enumerate(results[:5]):
-                query_id = result.get("query_id", "不明")
-                content = result.get("content", "内容なし")
-                username = result.get("username", "不明")
-                timestamp = result.get("timestamp", "不明")
-
-                # 内容は最大100文字まで
-                if len(content) > 100:
-                    content = content[:97] + "..."
-
-                embed.add_field(
-                    name=f"{query_id} ({username}, {timestamp})",
-                    value=content,
-                    inline=False
-                )
+            view.message = await ctx.send(embed=embed, view=view)
 
-            if len(results) > 5:
-                embed.set_footer(text=f"他に{len(results) - 5}件の結果があります。詳細な検索はスプレッドシートで確認してください。")
+        except Exception as e:
+            logger.error(f"検索中にエラーが発生しました: {e}", exc_info=True)
+            await ctx.send(f"❌ エラーが発生しました: {str(e)}")
+
+    @commands.command(name="history")
+    @commands.has_permissions(manage_messages=True)
+    async def history_command(self, ctx, query_id: str):
+        """問い合わせの状態の変化の履歴を表示"""
+        try:
+            events = await self.storage.get_query_events(query_id)
+            if not events:
+                await ctx.send(f"問い合わせ {query_id} の履歴はありません。")
+                return
+
+            embed = discord.Embed(title=f"問い合わせ {query_id} の履歴", color=discord.Color.teal())
+
+            # 埋め込みのフィールド数の上限（25件）を超える場合は新しいものを表示
+            for event in events[-25:]:
+                value = event.get("value") or "-"
+                embed.add_field(name=f"{event['timestamp']} {event['event']}", value=value, inline=False)
+
+            if len(events) > 25:
+                embed.set_footer(text=f"全{len(events)}件のうち新しい25件を表示しています")
 
             await ctx.send(embed=embed)
 
         except Exception as e:
-            logger.error(f"検索中にエラーが発生しました: {e}", exc_info=True)
+            logger.error(f"履歴の取得中にエラーが発生しました: {e}", exc_info=True)
             await ctx.send(f"❌ エラーが発生しました: {str(e)}")
 
     @commands.command(name="analyze")
     @commands.has_permissions(administrator=True)
-    async def analyze_command(self, ctx, period: str = "week"):
-        """問い合わせ分析レポートを生成"""
+    async def analyze_command(self, ctx, period: str = "week", until: str = None):
+        """問い合わせ分析レポートを生成（期間: day/week/month/year、または 開始日 [終了日]）"""
+        if period == "rebuild":
+            await self.rebuild_rollups(ctx)
+            return
+
         valid_periods = ["day", "week", "month", "year"]
+        start = end = None
         if period not in valid_periods:
-            await ctx.send(f"❌ 無効な期間です。有効な値: {', '.join(valid_periods)}")
-            return
+            try:
+                start, end = parse_analysis_range(period, until)
+            except ValueError:
+                await ctx.send(
+                    f"❌ 無効な期間です。有効な値: {', '.join(valid_periods)}、または 開始日 [終了日]"
+                    "（YYYY-MM-DD、時間単位は YYYY-MM-DDTHH）"
+                )
+                return
+            period = None
 
+        label = f"{period}間" if period else "指定期間"
         try:
-            await ctx.send(f"{period}間の分析レポートを生成しています...")
+            await ctx.send(f"{label}の分析レポートを生成しています...")
 
-            # 分析データを取得
-            analysis = await self.sheets_manager.analyze_queries(period)
+            # 分析データを取得（集計テーブルの期間内の行を合算）
+            if period:
+                analysis = await self.storage.analyze_queries(period)
+            else:
+                analysis = await self.storage.analyze_queries(start=start, end=end)
 
             if not analysis:
                 await ctx.send("分析するデータがありませんでした。")
@@ -112,7 +156,7 @@ class SupportCommands(commands.Cog):
 
             # 結果を表示
             embed = discord.Embed(
-                title=f"{period}間の問い合わせ分析",
+                title=f"{label}の問い合わせ分析",
                 description=f"期間: {analysis.get('start_date', '不明')} から {analysis.get('end_date', '不明')}",
                 color=discord.Color.purple()
             )
@@ -132,9 +176,16 @@ class SupportCommands(commands.Cog):
             embed.add_field(name="平均初回応答時間", value=f"{analysis.get('avg_first_response_time', 0)}分", inline=True)
             embed.add_field(name="平均解決時間", value=f"{analysis.get('avg_resolution_time', 0)}分", inline=True)
 
-            # トレンド
-            if "trend" in analysis:
-                embed.add_field(name="トレンド", value=analysis["trend"], inline=False)
+            # 解決時間の分布
+            histogram = [(bucket, count) for bucket, count in analysis.get("resolution_histogram", []) if count]
+            if histogram:
+                histogram_text = "\n".join(f"{bucket}: {count}件" for bucket, count in histogram)
+                embed.add_field(name="解決時間の分布", value=histogram_text, inline=False)
+
+            # 現在の傾向（届いた問い合わせから急増検知が求めた値）
+            trend = self.bot.describe_trend()
+            if trend:
+                embed.add_field(name="現在の傾向", value=trend, inline=False)
 
             embed.set_footer(text=f"分析日時: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
 
@@ -144,6 +195,19 @@ class SupportCommands(commands.Cog):
             logger.error(f"分析中にエラーが発生しました: {e}", exc_info=True)
             await ctx.send(f"❌ エラーが発生しました: {str(e)}")
 
+    async def rebuild_rollups(self, ctx):
+        """分析用の集計テーブルを作り直す（スプレッドシートを直接編集した後など）"""
+        try:
+            await ctx.send("分析用の集計テーブルを作り直しています...")
+            if await self.storage.rebuild_rollups():
+                await ctx.send("✅ 集計テーブルを作り直しました。")
+            else:
+                await ctx.send("この保存先は集計テーブルを使用していません。")
+
+        except Exception as e:
+            logger.error(f"集計テーブルの作り直し中にエラーが発生しました: {e}", exc_info=True)
+            await ctx.send(f"❌ エラーが発生しました: {str(e)}")
+
     @commands.command(name="clear")
     @commands.has_permissions(administrator=True)
     async def clear_command(self, ctx, channel: discord.TextChannel = None):
@@ -176,6 +240,40 @@ class SupportCommands(commands.Cog):
             except:
                 pass
 
+    @commands.command(name="profile")
+    @commands.has_permissions(administrator=True)
+    async def profile_command(self, ctx, action: str = "status", threshold_ms: int = None):
+        """プロファイリングの有効化・無効化・状態表示"""
+        if action == "on":
+            PROFILER.enable(threshold_ms / 1000 if threshold_ms else None)
+            await ctx.send(f"✅ プロファイリングを有効化しました（閾値 {PROFILER.threshold * 1000:.0f}ms）。")
+            return
+
+        if action == "off":
+            PROFILER.disable()
+            await ctx.send("✅ プロファイリングを無効化しました。")
+            return
+
+        if action != "status":
+            await ctx.send("❌ 無効な操作です。有効な値: on, off, status")
+            return
+
+        embed = discord.Embed(
+            title="プロファイリング状態",
+            description=f"{'有効' if PROFILER.enabled else '無効'}（閾値 {PROFILER.threshold * 1000:.0f}ms）",
+            color=discord.Color.dark_grey()
+        )
+
+        # 直近の低速処理を最大5件表示
+        for record in list(PROFILER.recent_slow)[-5:]:
+            embed.add_field(
+                name=f"{record['operation']} ({record['timestamp']})",
+                value=f"実時間 {record['wall_time']}秒 / CPU {record['cpu_time']}秒\n{record['profile'] or 'スタックなし'}",
+                inline=False
+            )
+
+        await ctx.send(embed=embed)
+
     @commands.Cog.listener()
     async def on_command_error(self, ctx, error):
         """コマンドエラーハンドリング"""
@@ -193,6 +291,6 @@ class SupportCommands(commands.Cog):
         logger.error(f"コマンド実行中にエラーが発生しました: {error}", exc_info=True)
         await ctx.send(f"❌ エラーが発生しました: {str(error)}")
 
-def setup(bot, sheets_manager):
+async def setup(bot, storage):
     """Cogをセットアップ"""
-    bot.add_cog(SupportCommands(bot, sheets_manager))
\ No newline at end of file
+    await bot.add_cog(SupportCommands(bot, storage))
\ No newline at end of file
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+転送のバースト対応: チャンネルごとに送信待ちをまとめ、1メッセージに最大10件の埋め込みで送信
+
+平常時は届いた問い合わせをすぐに1件ずつ送信します。送信中（Discordのレート制限で
+待たされている間など）に次の問い合わせが届くとバーストとみなし、短い時間だけ待って
+1メッセージ分（埋め込み10件・本文2000文字まで）をまとめて送信します。@here は
+1メッセージに1回だけ付けます。まとめた送信が失敗した場合は間隔を空けて再送し、
+それでも送れなければ1件ずつ送り直します。
+"""
+
+import asyncio
+import logging
+from collections import deque
+
+from monitoring.metrics import REGISTRY, track
+from monitoring.resilience import retry_after
+
+logger = logging.getLogger(__name__)
+
+# Discordの1メッセージあたりの上限
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_CONTENT_LENGTH = 2000
+
+# バースト中に1メッセージ分を集めるため待つ最大時間（秒）
+BATCH_WINDOW = 0.5
+
+MENTION = "@here"
+
+# 送信の試行回数と、再送までの待ち時間（秒、試行ごとに2倍、レート制限はDiscordの指定に従う）
+SEND_ATTEMPTS = 3
+SEND_RETRY_DELAY = 1.0
+SEND_MAX_DELAY = 30.0
+
+FORWARD_BATCH_SIZE = REGISTRY.histogram(
+    "discord_forward_batch_size", "転送1メッセージにまとめた件数", ("channel",),
+    buckets=(1, 2, 3, 5, 10, 20, 50)
+)
+FORWARD_DELIVERY_SECONDS = REGISTRY.histogram(
+    "discord_forward_delivery_seconds", "転送を受け付けてからDiscordに送信されるまでの時間（秒）", ("channel",)
+)
+
+class ChannelBatcher:
+    """1チャンネル分の送信待ち"""
+
+    def __init__(self, channel, kind, window=BATCH_WINDOW):
+        """初期化（kind: 計測用のチャンネル種別）"""
+        self.channel = channel
+        self.kind = kind
+        self.window = window
+        self.pending = deque()
+        self.pending_embeds = 0
+        self.pending_chars = 0
+        self.task = None
+        self.wakeup = asyncio.Event()
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    def submit(self, text="", embed=None, mention=False):
+        """送信待ちに追加"""
+        loop = asyncio.get_running_loop()
+        self.pending.append({"text": text, "embed": embed, "mention": mention, "queued_at": loop.time()})
+        self.pending_embeds += embed is not None
+        self.pending_chars += len(text) + 1
+        self.idle.clear()
+        self.wakeup.set()
+
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    def _full(self):
+        """1メッセージ分がそろったか"""
+        return self.pending_embeds >= MAX_EMBEDS_PER_MESSAGE or self.pending_chars >= MAX_CONTENT_LENGTH - len(MENTION)
+
+    def _take(self):
+        """先頭から1メッセージに収まる分を取り出す"""
+        batch = []
+        embeds = 0
+        chars = len(MENTION)
+        while self.pending:
+            item = self.pending[0]
+            item_embeds = item["embed"] is not None
+            item_chars = len(item["text"]) + 1
+            if batch and (embeds + item_embeds > MAX_EMBEDS_PER_MESSAGE or chars + item_chars > MAX_CONTENT_LENGTH):
+                break
+
+            batch.append(self.pending.popleft())
+            embeds += item_embeds
+            chars += item_chars
+            self.pending_embeds -= item_embeds
+            self.pending_chars -= item_chars
+        return batch
+
+    async def _run(self):
+        """送信待ちを順に送信（送信中に次が届いた場合はまとめる）"""
+        loop = asyncio.get_running_loop()
+        burst = False
+        while True:
+            if not self.pending:
+                self.idle.set()
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            # バースト中は1メッセージ分がそろうか、一定時間が過ぎるまで待つ
+            if burst:
+                deadline = loop.time() + self.window
+                while not self._full() and loop.time() < deadline:
+                    self.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), deadline - loop.time())
+                    except asyncio.TimeoutError:
+                        break
+
+            batch = self._take()
+            await self._send(batch)
+
+            # 送信中に次が届いていればバースト、1件ずつで間に合っていれば平常
+            burst = len(batch) > 1 or bool(self.pending)
+
+    async def _send(self, batch):
+        """1メッセージで送信し、送れなければ1件ずつ送り直す（1件の不正な埋め込みやレート制限でまとめて失わない）"""
+        if await self._deliver(batch) or len(batch) == 1:
+            return
+
+        logger.warning(f"まとめた転送を送信できなかったため、1件ずつ送り直します（{self.kind}, {len(batch)}件）")
+        mention = any(item["mention"] for item in batch)
+        for item in batch:
+            await self._deliver([dict(item, mention=mention)])
+            mention = False
+
+    async def _deliver(self, batch):
+        """1メッセージで送信（@hereは1回だけ）、一時的なエラーは間隔を空けて再送し、送れたかを返す"""
+        lines = [item["text"] for item in batch if item["text"]]
+        if any(item["mention"] for item in batch):
+            lines.insert(0, MENTION)
+        content = "\n".join(lines)
+        embeds = [item["embed"] for item in batch if item["embed"] is not None]
+
+        for attempt in range(1, SEND_ATTEMPTS + 1):
+            try:
+                with track("discord_send", channel=self.kind):
+                    if len(embeds) == 1:
+                        await self.channel.send(content=content, embed=embeds[0])
+                    elif embeds:
+                        await self.channel.send(content=content, embeds=embeds)
+                    else:
+                        await self.channel.send(content)
+                break
+
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None or attempt == SEND_ATTEMPTS:
+                    logger.error(f"Discordへの転送に失敗しました（{self.kind}, {len(batch)}件）: {e}", exc_info=True)
+                    return False
+                logger.warning(f"Discordへの転送を{delay:.1f}秒後に再送します（{self.kind}, {len(batch)}件、{attempt}回目）: {e}")
+                await asyncio.sleep(delay)
+
+        now = asyncio.get_running_loop().time()
+        FORWARD_BATCH_SIZE.observe(len(batch), channel=self.kind)
+        for item in batch:
+            FORWARD_DELIVERY_SECONDS.observe(now - item["queued_at"], channel=self.kind)
+        return True
+
+    @staticmethod
+    def _retry_delay(error, attempt):
+        """再送までの待ち時間（権限・内容の誤りなど再送しても成功しないエラーはNone）"""
+        status = getattr(error, "status", None)
+        if status == 429 or hasattr(error, "retry_after"):
+            # discord.RateLimitedはretry_after、429のHTTPExceptionはRetry-Afterヘッダーで待ち時間が指定される
+            wait = getattr(error, "retry_after", None) or retry_after(error)
+            return min(max(wait, SEND_RETRY_DELAY), SEND_MAX_DELAY)
+        if status is not None and status < 500:
+            return None
+        return min(SEND_RETRY_DELAY * 2 ** (attempt - 1), SEND_MAX_DELAY)
+
+class ForwardBatcher:
+    """チャンネルごとの送信待ちをまとめて管理"""
+
+    def __init__(self, window=BATCH_WINDOW):
+        """初期化"""
+        self.window = window
+        self.channels = {}
+
+        REGISTRY.gauge("discord_forward_queue_depth", "Discordへの転送待ち件数").set_function(self.depth)
+
+    def submit(self, channel, kind, text="", embed=None, mention=False):
+        """チャンネルの送信待ちに追加（送信は待たない）"""
+        batcher = self.channels.get(channel)
+        if batcher is None:
+            batcher = self.channels[channel] = ChannelBatcher(channel, kind, self.window)
+        batcher.submit(text, embed, mention)
+
+    def depth(self):
+        """全チャンネルの送信待ち件数"""
+        return sum(len(batcher.pending) for batcher in self.channels.values())
+
+    async def flush(self):
+        """送信待ちがなくなるまで待機（終了時など）"""
+        await asyncio.gather(*(batcher.idle.wait() for batcher in list(self.channels.values())))
\ No newline at end of file
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+検索結果のページ送り: ボタンが押されたときに次のページだけを取得して表示
+"""
+
+import time
+import logging
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+# 1ページに表示する件数
+SEARCH_PAGE_SIZE = 5
+
+# 検索カーソルの有効期間（秒、最後の操作から）
+SEARCH_CURSOR_TTL = 600
+
+class SearchCursorCache:
+    """ユーザーごとの検索カーソル（1人につき直近の検索1件、期限切れは破棄）"""
+
+    def __init__(self, ttl=SEARCH_CURSOR_TTL):
+        """初期化"""
+        self.ttl = ttl
+        self.sessions = {}
+
+    def _expire(self):
+        """期限切れのカーソルを破棄"""
+        now = time.monotonic()
+        for user_id in [user_id for user_id, session in self.sessions.items() if session["expires_at"] <= now]:
+            del self.sessions[user_id]
+
+    def start(self, user_id, keyword):
+        """新しい検索を開始（同じユーザーの前の検索は操作できなくなる）"""
+        self._expire()
+        session = {
+            "keyword": keyword,
+            "cursors": [None],  # 各ページの開始カーソル（ページ番号 → カーソル）
+            "page": 0,
+            "expires_at": time.monotonic() + self.ttl
+        }
+        self.sessions[user_id] = session
+        return session
+
+    def get(self, user_id):
+        """有効な検索を取得して期限を延長（なければNone）"""
+        self._expire()
+        session = self.sessions.get(user_id)
+        if session is not None:
+            session["expires_at"] = time.monotonic() + self.ttl
+        return session
+
+    def discard(self, user_id):
+        """検索を破棄"""
+        self.sessions.pop(user_id, None)
+
+def build_search_embed(keyword, results, page, page_size, has_next, ttl):
+    """検索結果1ページ分の埋め込み"""
+    first = page * page_size + 1
+    embed = discord.Embed(
+        title=f"検索結果: {keyword}",
+        description=f"{page + 1}ページ目（{first}〜{first + len(results) - 1}件目）",
+        color=discord.Color.green()
+    )
+
+    for result in results:
+        query_id = result.get("query_id", "不明")
+        content = str(result.get("content", "内容なし"))
+        username = result.get("username", "不明")
+        timestamp = result.get("timestamp", "不明")
+
+        # 内容は最大100文字まで
+        if len(content) > 100:
+            content = content[:97] + "..."
+
+        embed.add_field(
+            name=f"{query_id} ({username}, {timestamp})",
+            value=content,
+            inline=False
+        )
+
+    if has_next:
+        embed.set_footer(text=f"「次へ」で続きを表示します（最後の操作から{ttl // 60}分間有効）")
+    return embed
+
+class SearchView(discord.ui.View):
+    """検索結果のページ送りボタン（検索したユーザーだけが操作できる）"""
+
+    def __init__(self, storage, cache, user_id, session, page_size=SEARCH_PAGE_SIZE):
+        """初期化"""
+        super().__init__(timeout=cache.ttl)
+        self.storage = storage
+        self.cache = cache
+        self.user_id = user_id
+        self.session = session
+        self.page_size = page_size
+        self.message = None
+
+    async def load(self, page):
+        """pageページ目を取得して埋め込みを返す（結果がなければNone）"""
+        session = self.session
+        results, cursor = await self.storage.search_queries_page(
+            session["keyword"], session["cursors"][page], self.page_size
+        )
+        if not results:
+            return None
+
+        # 次のページの開始カーソルを記録（データが変わっていれば以降を取り直す）
+        del session["cursors"][page + 1:]
+        if cursor is not None:
+            session["cursors"].append(cursor)
+        session["page"] = page
+
+        self.previous_page.disabled = page == 0
+        self.next_page.disabled = cursor is None
+        return build_search_embed(session["keyword"], results, page, self.page_size, cursor is not None, self.cache.ttl)
+
+    @property
+    def has_pages(self):
+        """2ページ以上あるか"""
+        return len(self.session["cursors"]) > 1
+
+    async def interaction_check(self, interaction):
+        if interaction.user.id != self.user_id:
+            await interaction.response.send_message("この検索結果は検索したユーザーだけが操作できます。", ephemeral=True)
+            return False
+
+        if self.cache.get(self.user_id) is not self.session:
+            await interaction.response.send_message(
+                "この検索結果は有効期限が切れました。もう一度 !search を実行してください。", ephemeral=True
+            )
+            await self._disable()
+            return False
+
+        return True
+
+    @discord.ui.button(label="◀ 前へ", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction, button):
+        await self._show(interaction, self.session["page"] - 1)
+
+    @discord.ui.button(label="次へ ▶", style=discord.ButtonStyle.primary)
+    async def next_page(self, interaction, button):
+        await self._show(interaction, self.session["page"] + 1)
+
+    async def _show(self, interaction, page):
+        """ページを取得して同じメッセージを書き換え"""
+        # スプレッドシートの読み込みは3秒を超えることがあるため先に応答しておく
+        await interaction.response.defer()
+        embed = await self.load(page)
+        if embed is None:
+            await interaction.followup.send("このページの検索結果はなくなりました。", ephemeral=True)
+            return
+        await interaction.edit_original_response(embed=embed, view=self)
+
+    async def on_timeout(self):
+        if self.cache.sessions.get(self.user_id) is self.session:
+            self.cache.discard(self.user_id)
+        await self._disable()
+
+    async def _disable(self):
+        """ボタンを無効化"""
+        self.stop()
+        for item in self.children:
+            item.disabled = True
+        if self.message is not None:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException as e:
+                logger.warning(f"検索結果のボタンを無効化できませんでした: {e}")
\ No newline at end of file
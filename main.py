@@ -7,23 +7,27 @@ Discord-X-Support-Hub
 """
 
 import os
+import math
+import time
+import signal
 import asyncio
 import logging
 from datetime import datetime
 
 from discord_bot.bot import SupportBot
 from x_monitor.api_client import XMonitor
+from x_monitor.reply_queue import ReplyQueue
+from x_monitor.anomaly import AnomalyDetector
 from data_manager.sheets import SheetsManager
+from data_manager.storage import create_storage
+from data_manager.templates import TemplateManager
+from data_manager.snapshot import WarmSnapshot
+from monitoring.metrics import REGISTRY, track, monitor_event_loop_lag
+from monitoring.server import MonitoringServer
+from monitoring.health import TaskSupervisor, LoopWatchdog, HealthChecks, CachedCheck
+from monitoring.profiler import PROFILER
+from monitoring.log_pipeline import setup_logging, log_context
 
-# ロギング設定
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(f"logs/support_hub_{datetime.now().strftime('%Y%m%d')}.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 # 環境変数
@@ -34,43 +38,244 @@ X_ACCESS_TOKEN = os.environ.get("X_ACCESS_TOKEN")
 X_ACCESS_TOKEN_SECRET = os.environ.get("X_ACCESS_TOKEN_SECRET")
 SHEETS_CREDENTIALS_PATH = os.environ.get("SHEETS_CREDENTIALS_PATH", "credentials/sheets_credentials.json")
 SPREADSHEET_ID = os.environ.get("SPREADSHEET_ID")
+SHEETS_READ_QUOTA = int(os.environ.get("SHEETS_READ_QUOTA", "60"))
+SHEETS_WRITE_QUOTA = int(os.environ.get("SHEETS_WRITE_QUOTA", "60"))
+X_CURSOR_PATH = os.environ.get("X_CURSOR_PATH", "data/x_cursor.json")
+X_CATCHUP_CONCURRENCY = int(os.environ.get("X_CATCHUP_CONCURRENCY", "4"))
+X_REPLY_RATE_LIMIT = int(os.environ.get("X_REPLY_RATE_LIMIT", "100"))
+X_REPLY_CONCURRENCY = int(os.environ.get("X_REPLY_CONCURRENCY", "4"))
+X_REPLY_LOG_PATH = os.environ.get("X_REPLY_LOG_PATH", "data/x_replies.json")
+FORWARD_BATCH_WINDOW_MS = int(os.environ.get("FORWARD_BATCH_WINDOW_MS", "500"))
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "sheets")
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "data/support_hub.db")
+ROLLUP_PATH = os.environ.get("ROLLUP_PATH", "data/rollups.db")
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", "1000000"))
+ARCHIVE_KEEP_MONTHS = int(os.environ.get("ARCHIVE_KEEP_MONTHS", "1"))
+ARCHIVE_SPREADSHEET_ID = os.environ.get("ARCHIVE_SPREADSHEET_ID")
+TEMPLATES_CHECKSUM_CELL = os.environ.get("TEMPLATES_CHECKSUM_CELL")
+TEMPLATE_REFRESH_INTERVAL = int(os.environ.get("TEMPLATE_REFRESH_INTERVAL", "60"))
+QUERY_CACHE_REFRESH_INTERVAL = int(os.environ.get("QUERY_CACHE_REFRESH_INTERVAL", "300"))
+QUERY_CACHE_REVISION_CELL = os.environ.get("QUERY_CACHE_REVISION_CELL")
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9108"))
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0") == "1"
+PROFILE_THRESHOLD_MS = int(os.environ.get("PROFILE_THRESHOLD_MS", "1000"))
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", "14"))
+HEALTH_MAX_POLL_AGE = int(os.environ.get("HEALTH_MAX_POLL_AGE", "1800"))
+HEALTH_STALL_SECONDS = float(os.environ.get("HEALTH_STALL_SECONDS", "5"))
+WARM_SNAPSHOT_PATH = os.environ.get("WARM_SNAPSHOT_PATH", "data/warm_snapshot.zip")
 
-async def check_x_mentions(bot, x_monitor, sheets_manager):
+# メンションの確認間隔（秒）と、失敗時に次の確認までの最短の待ち時間（失敗が続くと倍にする）
+POLL_INTERVAL = 600
+POLL_RETRY_DELAY = 15
+
+# 終了時に送信・書き込み待ちを送り切るのを待つ時間（秒、キューごと）
+SHUTDOWN_DRAIN_TIMEOUT = 10
+
+# パイプラインのメトリクス
+MENTIONS_PROCESSED = REGISTRY.counter("mentions_processed_total", "処理したメンション数", ("category",))
+PIPELINE_BACKLOG = REGISTRY.gauge("pipeline_backlog", "処理待ちのメンション数")
+LAST_POLL_TIMESTAMP = REGISTRY.gauge("pipeline_last_poll_timestamp_seconds", "最後にメンションを確認した時刻（UNIX秒）")
+
+async def process_mention(bot, x_monitor, storage, mention):
+    """メンション1件を問い合わせとして記録・転送する"""
+    with log_context(tweet_id=str(mention.id)):
+        # 問い合わせとして処理
+        with track("pipeline_stage", stage="process_tweet"):
+            query_data = await x_monitor.process_tweet(mention)
+
+        # スプレッドシートに記録
+        with track("pipeline_stage", stage="log_query"):
+            query_id = await storage.log_query(query_data)
+        query_data['query_id'] = query_id
+
+        # 急増検知（停止後に回収した古いツイートは投稿日時で除く）
+        bot.observe_query(query_data, getattr(mention, "created_at", None))
+
+        with log_context(query_id=query_id):
+            # Discordに転送
+            with track("pipeline_stage", stage="forward_query"):
+                await bot.forward_query(query_data)
+
+            MENTIONS_PROCESSED.inc(category=query_data.get("category", "general"))
+            logger.info(f"問い合わせ処理完了: {query_id} ({query_data['username']})")
+    return query_data
+
+async def process_mentions(bot, x_monitor, storage, mentions):
+    """取得したメンションを記録・転送する（途中で失敗した場合、未処理の分はmentionsに残る）"""
+    PIPELINE_BACKLOG.set(len(mentions))
+
+    processed = 0
+    while mentions:
+        await process_mention(bot, x_monitor, storage, mentions[0])
+        # 保存する確認時刻は記録が済んだ分だけ進める（停止しても未処理の分は次の起動で取得し直す）
+        x_monitor.mark_processed(mentions.pop(0))
+        processed += 1
+        PIPELINE_BACKLOG.dec()
+
+    # 統計情報を更新
+    if processed:
+        with track("pipeline_stage", stage="update_stats"):
+            await storage.update_stats()
+
+async def check_x_mentions(bot, x_monitor, storage):
     """X上の新規メンションを定期的に確認するタスク"""
+    # 転送先のチャンネルが決まる前に処理すると、記録だけされてDiscordに届かない
+    # （スナップショットがない初回の起動では、ゲートウェイに接続してチャンネルを設定するまで待つ）
+    await bot.wait_for_channels()
     logger.info("Xモニタリングタスクを開始しました")
+    pending = []
+    failures = 0
     while True:
         try:
-            # 新規メンションを確認
-            mentions = await x_monitor.check_new_mentions()
+            if x_monitor.needs_catch_up():
+                # 停止・障害で空いた期間は分割して並行取得（古い順）
+                with track("pipeline_stage", stage="catch_up"):
+                    mentions = await x_monitor.catch_up(concurrency=X_CATCHUP_CONCURRENCY)
+            else:
+                # 新規メンションを確認
+                with track("pipeline_stage", stage="check_new_mentions"):
+                    mentions = await x_monitor.check_new_mentions()
+            LAST_POLL_TIMESTAMP.set(datetime.now().timestamp())
 
-            for mention in mentions:
-                # 問い合わせとして処理
-                query_data = await x_monitor.process_tweet(mention)
+            # 前回記録できなかった分から順に処理
+            pending.extend(mentions)
+            await process_mentions(bot, x_monitor, storage, pending)
+            failures = 0
 
-                # スプレッドシートに記録
-                query_id = await sheets_manager.log_query(query_data)
-                query_data['query_id'] = query_id
+        except Exception as e:
+            failures += 1
+            logger.error(f"Xモニタリング中にエラーが発生しました: {e}", exc_info=True)
 
-                # Discordに転送
-                await bot.forward_query(query_data)
+        # 通常は10分(600秒)待機。失敗した場合は未取得・未処理の分が残っているので、短い間隔でやり直す
+        if failures:
+            delay = min(POLL_INTERVAL, POLL_RETRY_DELAY * 2 ** (failures - 1))
+            logger.info(f"{delay}秒後にメンションの確認をやり直します（未処理 {len(pending)}件）")
+        else:
+            delay = POLL_INTERVAL
+        await asyncio.sleep(delay)
 
-                logger.info(f"問い合わせ処理完了: {query_id} ({query_data['username']})")
+async def init_storage(backend):
+    """スプレッドシート管理とストレージを初期化（ストレージとスプレッドシート管理を返す）"""
+    # sqliteモードでは認証情報がある場合のみ、初回の取り込みに使う
+    sheets_manager = None
+    if backend != "sqlite" or os.path.exists(SHEETS_CREDENTIALS_PATH):
+        # sheetsモードでは分析用の集計テーブルと直近の問い合わせをローカルに持つ（SQLiteを使うモードでは不要）
+        sheets_manager = SheetsManager(
+            SHEETS_CREDENTIALS_PATH, read_quota=SHEETS_READ_QUOTA, write_quota=SHEETS_WRITE_QUOTA,
+            rollup_path=ROLLUP_PATH if backend == "sheets" else None,
+            query_cache_size=QUERY_CACHE_SIZE if backend == "sheets" else None,
+            archive_spreadsheet_id=ARCHIVE_SPREADSHEET_ID, query_revision_cell=QUERY_CACHE_REVISION_CELL
+        )
+        sheets_manager.set_spreadsheet_id(SPREADSHEET_ID)
 
-            # 統計情報を更新
-            if mentions:
-                await sheets_manager.update_stats()
+    storage = await create_storage(backend, sheets_manager, SQLITE_PATH)
+    logger.info(f"ストレージ: {backend}")
+    return storage, sheets_manager
 
-        except Exception as e:
-            logger.error(f"Xモニタリング中にエラーが発生しました: {e}", exc_info=True)
+async def restore_sheets(sheets_manager, state):
+    """スプレッドシート管理の状態をスナップショットから復元（使えない場合、直近の問い合わせは起動後にシートから読み込む）"""
+    if sheets_manager is None:
+        return
+    await sheets_manager.restore_snapshot(state)
 
-        # 10分(600秒)待機
-        await asyncio.sleep(600)
+async def save_snapshot(warm_snapshot, x_monitor, bot, template_manager, sheets_manager):
+    """終了時の状態をスナップショットに保存（失敗しても終了は妨げない）"""
+    try:
+        sections = {
+            "x": x_monitor.snapshot(),
+            "discord": bot.snapshot(),
+            "templates": template_manager.snapshot(),
+            "sheets": await sheets_manager.snapshot() if sheets_manager is not None else None
+        }
+        await asyncio.to_thread(warm_snapshot.save, sections)
+
+    except Exception as e:
+        logger.warning(f"スナップショットの保存に失敗しました: {e}", exc_info=True)
+
+async def drain(name, flush, timeout=SHUTDOWN_DRAIN_TIMEOUT):
+    """送信・書き込み待ちがなくなるまで待機（timeout秒で打ち切り、残りは破棄される）"""
+    try:
+        await asyncio.wait_for(flush(), timeout)
+
+    except asyncio.TimeoutError:
+        logger.warning(f"終了時に{name}の待ちが{timeout}秒以内に終わりませんでした（残りは破棄されます）")
+
+    except Exception as e:
+        logger.error(f"終了時の{name}の待ちの処理に失敗しました: {e}", exc_info=True)
+
+async def shutdown(supervisor, bot, reply_queue, storage):
+    """新しい問い合わせの取得を止め、転送・X上の返信・ミラーへの書き込みの待ちを送り切ってからBotを閉じる
+    （2回呼んでも問題ない）"""
+    await supervisor.stop()
+
+    # 返信の結果はDiscordに報告し、返信のツイートIDはストレージに記録するため、Botを閉じる前・ミラーより先に送る
+    await drain("Discordへの転送", bot.flush_forwards)
+    await drain("X上の返信", reply_queue.flush)
+    if hasattr(storage, "flush"):
+        await drain("ストレージへの書き込み", storage.flush)
+
+    if not bot.is_closed():
+        await bot.close()
+
+def register_health_checks(health, bot, sheets_manager, started_at):
+    """起動後の稼働状態の確認を登録（/healthz: メンションの確認、/readyz: Discordの接続・Sheets APIへの到達）"""
+    def poll_check():
+        age = time.time() - (LAST_POLL_TIMESTAMP.get() or started_at)
+        return age < HEALTH_MAX_POLL_AGE, {"last_poll_age_seconds": round(age)}
+
+    def discord_check():
+        detail = {"ready": bot.is_ready(), "closed": bot.is_closed()}
+        if math.isfinite(bot.latency):
+            detail["latency_seconds"] = round(bot.latency, 3)
+        return bot.is_ready() and not bot.is_closed(), detail
+
+    async def sheets_check():
+        if sheets_manager.breaker.state == sheets_manager.breaker.OPEN:
+            return False, "サーキットブレーカーが開いています"
+        modified_time = await sheets_manager.get_modified_time()
+        return modified_time is not None, {"modified_time": modified_time}
+
+    health.add_liveness("x_poll", poll_check)
+    health.add_readiness("discord", discord_check)
+    if sheets_manager is not None:
+        # 確認のたびにAPIを呼ばないよう、結果は60秒間使い回す
+        health.add_readiness("sheets", CachedCheck(sheets_check, ttl=60))
 
 async def main():
     """メイン実行関数"""
+    supervisor = TaskSupervisor()
+    watchdog = LoopWatchdog(threshold=HEALTH_STALL_SECONDS)
+    health = HealthChecks()
+    started_at = time.time()
     try:
         logger.info("Discord-X-Support-Hub を起動中...")
 
+        # イベントループの遅延を継続的に計測し、止まった場合は別スレッドから検知して実行中の処理を記録
+        watchdog.start()
+        supervisor.start("event_loop_lag", lambda: monitor_event_loop_lag(on_lag=watchdog.beat))
+        health.add_liveness("event_loop", watchdog.check)
+        health.add_liveness("tasks", supervisor.check)
+        startup_done = asyncio.Event()
+        health.add_readiness("startup", lambda: (startup_done.is_set(), None))
+
+        # メトリクス・稼働状態のエンドポイントを起動（METRICS_PORT=0 で無効）
+        if METRICS_PORT:
+            monitoring_server = MonitoringServer(METRICS_HOST, METRICS_PORT)
+            monitoring_server.add_health_checks(health)
+            await monitoring_server.start()
+
+        # プロファイリング（実行中は !profile on/off で切り替え可能）
+        PROFILER.threshold = PROFILE_THRESHOLD_MS / 1000
+        if PROFILING_ENABLED:
+            PROFILER.enable()
+
+        # 前回終了時の状態（WARM_SNAPSHOT_PATH を空にすると無効）
+        warm_snapshot = WarmSnapshot(WARM_SNAPSHOT_PATH) if WARM_SNAPSHOT_PATH else None
+        sections = await asyncio.to_thread(warm_snapshot.load) if warm_snapshot is not None else {}
+
         # X APIクライアントを初期化
         x_api_credentials = {
             'consumer_key': X_CONSUMER_KEY,
@@ -78,31 +283,94 @@ async def main():
             'access_token': X_ACCESS_TOKEN,
             'access_token_secret': X_ACCESS_TOKEN_SECRET
         }
-        x_monitor = XMonitor(x_api_credentials)
+        x_monitor = XMonitor(x_api_credentials, cursor_path=X_CURSOR_PATH)
+        x_monitor.restore(sections.get("x"))
 
-        # スプレッドシート管理を初期化
-        sheets_manager = SheetsManager(SHEETS_CREDENTIALS_PATH)
-        sheets_manager.set_spreadsheet_id(SPREADSHEET_ID)
+        # ストレージの初期化（STORAGE_BACKEND: sheets / sqlite / dual、初回はスプレッドシートからの取り込みを含む）と
+        # 自分のXアカウントIDの取得は並行して行う。Discordへのログインはストレージを使うコマンドを登録するため、その後に行う
+        (storage, sheets_manager), _ = await asyncio.gather(init_storage(STORAGE_BACKEND), x_monitor.load_user_id())
+
+        # テンプレート（スナップショットにあればそれを使い、変更は更新監視タスクが確認する）
+        template_manager = TemplateManager(storage, checksum_cell=TEMPLATES_CHECKSUM_CELL)
+        templates_restored = template_manager.restore(sections.get("templates"))
+
+        # X上の返信の送信キュー（X_REPLY_RATE_LIMIT: 15分あたりの投稿数の上限、X_REPLY_LOG_PATH: 二重投稿を防ぐ送信履歴）
+        reply_queue = ReplyQueue(
+            x_monitor, storage, concurrency=X_REPLY_CONCURRENCY, rate_limit=X_REPLY_RATE_LIMIT,
+            sent_path=X_REPLY_LOG_PATH
+        )
+
+        # 問い合わせの急増検知（平常時の件数は過去4週間の集計から作成、ポーリング間隔分遅れて届く問い合わせも数える）
+        anomaly_detector = AnomalyDetector(max_event_age=2 * POLL_INTERVAL)
 
-        # テンプレートを読み込み
-        templates = await sheets_manager.get_templates()
+        # Discordボットを初期化（前回のチャンネルがあれば、接続の完了を待たずに転送できる）
+        bot = SupportBot(
+            template_manager, storage, reply_queue, forward_batch_window=FORWARD_BATCH_WINDOW_MS / 1000,
+            anomaly_detector=anomaly_detector
+        )
+        bot.restore_channels(sections.get("discord"))
 
-        # Discordボットを初期化
-        bot = SupportBot(templates, sheets_manager)
+        # 互いに依存しない初期化は並行して行う（起動時間は最も遅いものだけになる）
+        startup = [
+            anomaly_detector.load_history(storage),
+            bot.login(DISCORD_TOKEN),
+            restore_sheets(sheets_manager, sections.get("sheets"))
+        ]
+        if not templates_restored:
+            startup.append(template_manager.load_templates())
+        await asyncio.gather(*startup)
+        register_health_checks(health, bot, sheets_manager, started_at)
+        startup_done.set()
 
-        # X監視タスクを開始
-        bot.loop.create_task(check_x_mentions(bot, x_monitor, sheets_manager))
+        # バックグラウンドタスク（止まった場合は間隔を倍にしながら再起動）
+        supervisor.start("x_mentions", lambda: check_x_mentions(bot, x_monitor, storage))
+        supervisor.start("template_refresh", lambda: template_manager.refresh_loop(TEMPLATE_REFRESH_INTERVAL))
 
-        # Botを起動
-        await bot.start(DISCORD_TOKEN)
+        # メモリ上の問い合わせは起動を待たせずに読み込み、シート上で直接編集されたら読み直す
+        # （スナップショットから復元した場合は、保存後に変更されていなければ読まない。読み込みが終わるまではシートから取得）
+        if sheets_manager is not None and sheets_manager.query_cache is not None:
+            supervisor.start(
+                "query_cache_refresh", lambda: sheets_manager.query_cache_refresh_loop(QUERY_CACHE_REFRESH_INTERVAL)
+            )
+
+        # 書き込み先のqueriesシートは古い問い合わせを月ごとのシートへ移して小さく保つ（ARCHIVE_KEEP_MONTHS=0 で無効）
+        if STORAGE_BACKEND != "sqlite" and ARCHIVE_KEEP_MONTHS:
+            supervisor.start("archive", lambda: sheets_manager.archive_loop(ARCHIVE_KEEP_MONTHS))
+
+        # 停止の合図を受けたら送信待ちを送り切ってBotを閉じ、状態を保存してから終了する（シグナルを扱えない環境では省略）
+        loop = asyncio.get_running_loop()
+        shutdown_tasks = []
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(
+                    signum, lambda: shutdown_tasks.append(asyncio.create_task(shutdown(supervisor, bot, reply_queue, storage)))
+                )
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        # Botを起動（ログインは済んでいるのでゲートウェイに接続するだけ）
+        try:
+            await bot.connect()
+        finally:
+            await asyncio.gather(*shutdown_tasks, return_exceptions=True)
+            await shutdown(supervisor, bot, reply_queue, storage)
+            watchdog.stop()
+            if warm_snapshot is not None:
+                await save_snapshot(warm_snapshot, x_monitor, bot, template_manager, sheets_manager)
 
     except Exception as e:
         logger.critical(f"アプリケーション起動中に致命的なエラーが発生しました: {e}", exc_info=True)
         raise
 
 if __name__ == "__main__":
-    # ログディレクトリの作成
-    os.makedirs("logs", exist_ok=True)
+    # ロギング設定（ファイル書き込みは別スレッドで行う）
+    log_listener = setup_logging(
+        json_lines=LOG_FORMAT == "json", max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT
+    )
 
-    # メイン関数を実行
-    asyncio.run(main())
\ No newline at end of file
+    try:
+        # メイン関数を実行
+        asyncio.run(main())
+    finally:
+        # 書き込み待ちのログを出力してから終了
+        log_listener.stop()
\ No newline at end of file
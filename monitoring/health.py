@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+稼働状態の監視: バックグラウンドタスクの再起動・イベントループの停止の検知と、/healthz・/readyz の判定
+
+バックグラウンドタスクは終了・例外で止まっても気づけないため、TaskSupervisorで間隔を
+倍にしながら再起動します。イベントループを止める同期処理は、別スレッドのLoopWatchdogが
+止まっている最中にスタックを記録します。/healthz（再起動すべきか）と /readyz（受け付けて
+よいか）は登録した確認をまとめて実行し、オーケストレーターの判定に使います。
+"""
+
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+
+from monitoring.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# タスクの再起動の待ち時間（秒、失敗が続くと倍にする）と、失敗の回数を数え直すまでの連続稼働時間（秒）
+RESTART_BASE_DELAY = 1.0
+RESTART_MAX_DELAY = 300.0
+HEALTHY_AFTER = 600.0
+
+# 連続してこの回数失敗したタスクがあれば /healthz を失敗にする
+MAX_TASK_FAILURES = 5
+
+# イベントループがこの秒数以上止まったらスタックを記録し、直近（LAG_WINDOW回の計測）に
+# MAX_STALLS回以上止まっていれば /healthz を失敗にする（1回だけの停止では再起動しない）
+STALL_THRESHOLD = 5.0
+LAG_WINDOW = 60
+MAX_STALLS = 3
+
+TASK_UP = REGISTRY.gauge("background_task_up", "バックグラウンドタスクが実行中か（1: 実行中、0: 再起動待ち）", ("task",))
+TASK_RESTARTS = REGISTRY.counter("background_task_restarts_total", "終了・失敗したバックグラウンドタスクを再起動した回数", ("task",))
+LOOP_STALLS = REGISTRY.counter("event_loop_stalls_total", "イベントループが一定時間以上止まった回数")
+HEALTH_STATUS = REGISTRY.gauge("health_check_status", "稼働状態の確認の結果（1: 正常）", ("check",))
+
+class TaskSupervisor:
+    """バックグラウンドタスクを実行し、終了・失敗したら間隔を倍にしながら再起動する"""
+
+    def __init__(self, base_delay=RESTART_BASE_DELAY, max_delay=RESTART_MAX_DELAY, healthy_after=HEALTHY_AFTER):
+        """初期化（healthy_after: この秒数以上動いてから止まった場合は失敗の回数を数え直す）"""
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.healthy_after = healthy_after
+        self.tasks = {}
+        self.failures = {}
+        self.last_errors = {}
+
+    def start(self, name, factory):
+        """タスクを開始（factory: 引数なしでコルーチンを返す関数、再起動のたびに呼ぶ）"""
+        self.failures[name] = 0
+        self.tasks[name] = asyncio.create_task(self._supervise(name, factory), name=name)
+        return self.tasks[name]
+
+    async def _supervise(self, name, factory):
+        """タスクを実行し、止まったら再起動する"""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            TASK_UP.set(1, task=name)
+            try:
+                await factory()
+                error = "終了しました"
+                logger.error(f"バックグラウンドタスク {name} が終了しました")
+
+            except asyncio.CancelledError:
+                TASK_UP.set(0, task=name)
+                raise
+
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                logger.error(f"バックグラウンドタスク {name} が停止しました: {e}", exc_info=True)
+
+            TASK_UP.set(0, task=name)
+            if loop.time() - started >= self.healthy_after:
+                self.failures[name] = 0
+            self.failures[name] += 1
+            self.last_errors[name] = error
+
+            delay = min(self.max_delay, self.base_delay * 2 ** (self.failures[name] - 1))
+            TASK_RESTARTS.inc(task=name)
+            logger.warning(f"バックグラウンドタスク {name} を{delay:.0f}秒後に再起動します（連続{self.failures[name]}回目）")
+            await asyncio.sleep(delay)
+
+    def check(self, max_failures=MAX_TASK_FAILURES):
+        """連続して失敗し続けているタスクがないか（/healthz 用）"""
+        failing = {name: count for name, count in self.failures.items() if count >= max_failures}
+        detail = {
+            name: {"failures": self.failures[name], "last_error": self.last_errors.get(name)}
+            for name in self.tasks if self.failures[name]
+        }
+        return not failing, detail
+
+    async def stop(self):
+        """すべてのタスクを止める"""
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+class LoopWatchdog:
+    """イベントループの遅延を記録し、止まっている間は別スレッドから検知してスタックを記録する"""
+
+    def __init__(self, threshold=STALL_THRESHOLD, window=LAG_WINDOW):
+        """初期化（window: /healthz で見る直近の遅延の件数、計測は1秒ごと）"""
+        self.threshold = threshold
+        self.lags = deque(maxlen=window)
+        self.last_beat = time.monotonic()
+        self.loop_thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def beat(self, lag):
+        """イベントループの遅延を記録（monitor_event_loop_lag の on_lag に渡す）"""
+        self.last_beat = time.monotonic()
+        self.lags.append(lag)
+
+    def start(self):
+        """監視スレッドを開始（イベントループのスレッドから呼ぶ）"""
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """監視スレッドを止める"""
+        self._stop.set()
+
+    def _watch(self):
+        """イベントループが止まっていないか確認（止まるたびに1回だけ記録）"""
+        stalled_at = None
+        while not self._stop.wait(self.threshold / 2):
+            beat = self.last_beat
+            if time.monotonic() - beat < self.threshold:
+                stalled_at = None
+                continue
+            if stalled_at == beat:
+                continue
+
+            stalled_at = beat
+            LOOP_STALLS.inc()
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "（取得できません）"
+            logger.warning(f"イベントループが{time.monotonic() - beat:.1f}秒間止まっています。実行中の処理:\n{stack}")
+
+    def check(self, max_stalls=MAX_STALLS):
+        """直近にイベントループが繰り返し止まっていないか（/healthz 用）"""
+        stalls = sum(1 for lag in self.lags if lag >= self.threshold)
+        return stalls < max_stalls, {"stalls": stalls, "max_lag_seconds": round(max(self.lags, default=0.0), 3)}
+
+class HealthChecks:
+    """/healthz（生存確認: 失敗が続けば再起動）と /readyz（受付可能か）の確認の一覧"""
+
+    def __init__(self):
+        """初期化"""
+        self.liveness = {}
+        self.readiness = {}
+
+    def add_liveness(self, name, check):
+        """/healthz の確認を追加（check: 引数なしで (正常か, 詳細) を返す関数またはコルーチン関数）"""
+        self.liveness[name] = check
+
+    def add_readiness(self, name, check):
+        """/readyz の確認を追加"""
+        self.readiness[name] = check
+
+    async def run(self, checks):
+        """確認をまとめて実行（すべて正常か, {確認名: 結果}）"""
+        results = {}
+        for name, check in checks.items():
+            try:
+                result = check()
+                if asyncio.iscoroutine(result):
+                    result = await result
+                ok, detail = result
+
+            except Exception as e:
+                ok, detail = False, f"{type(e).__name__}: {e}"
+
+            HEALTH_STATUS.set(1 if ok else 0, check=name)
+            results[name] = {"ok": ok, "detail": detail}
+        return all(result["ok"] for result in results.values()), results
+
+class CachedCheck:
+    """外部サービスへの確認の結果を一定時間使い回す（確認のたびにAPIを呼ばない）"""
+
+    def __init__(self, check, ttl=60.0):
+        """初期化（check: 引数なしで (正常か, 詳細) を返すコルーチン関数）"""
+        self.check = check
+        self.ttl = ttl
+        self.result = None
+        self.checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def __call__(self):
+        async with self._lock:
+            if self.result is None or time.monotonic() - self.checked_at >= self.ttl:
+                self.result = await self.check()
+                self.checked_at = time.monotonic()
+            return self.result
\ No newline at end of file
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+HTTP接続プール: Sheets・X APIのセッション共通設定と接続再利用の計測
+"""
+
+import socket
+import logging
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from monitoring.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# ホストごとに保持する接続数（to_threadで並行する呼び出し数より多めにする）
+POOL_MAXSIZE = 32
+
+# アイドル接続をOSにも維持させる（NAT・LBで切られにくくする）
+KEEPALIVE_SOCKET_OPTIONS = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+if hasattr(socket, "TCP_KEEPIDLE"):
+    KEEPALIVE_SOCKET_OPTIONS += [
+        (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60),
+        (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 20),
+        (socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+    ]
+
+HTTP_REQUESTS = REGISTRY.counter("http_requests_total", "HTTPリクエスト数", ("host",))
+HTTP_CONNECTIONS_OPENED = REGISTRY.counter(
+    "http_connections_opened_total", "新規に確立したHTTP接続数（TLSハンドシェイクを含む）", ("host",)
+)
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    """新規接続を数える接続プール"""
+
+    def _new_conn(self):
+        HTTP_CONNECTIONS_OPENED.inc(host=self.host)
+        return super()._new_conn()
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    """新規接続を数える接続プール（HTTPS）"""
+
+    def _new_conn(self):
+        HTTP_CONNECTIONS_OPENED.inc(host=self.host)
+        return super()._new_conn()
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """keep-alive・接続数を調整し、リクエスト数と接続数を記録するアダプター"""
+
+    def __init__(self, pool_maxsize=POOL_MAXSIZE, **kwargs):
+        """初期化"""
+        super().__init__(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize, **kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        pool_kwargs["socket_options"] = KEEPALIVE_SOCKET_OPTIONS
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool
+        }
+
+    def send(self, request, **kwargs):
+        HTTP_REQUESTS.inc(host=urlparse(request.url).hostname or "")
+        return super().send(request, **kwargs)
+
+def mount_pooled_adapter(session, pool_maxsize=POOL_MAXSIZE):
+    """requests.Session（またはその派生）に共通のアダプターを設定"""
+    adapter = PooledHTTPAdapter(pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def connection_reuse_ratio():
+    """接続再利用率（1 - 新規接続数 / リクエスト数）"""
+    requests_total = HTTP_REQUESTS.total()
+    if not requests_total:
+        return 0.0
+    return max(0.0, 1 - HTTP_CONNECTIONS_OPENED.total() / requests_total)
+
+REGISTRY.gauge("http_connection_reuse_ratio", "HTTP接続の再利用率").set_function(connection_reuse_ratio)
\ No newline at end of file
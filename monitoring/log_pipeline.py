@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+ログ出力: キュー経由の非同期書き込み・ローテーション・JSON形式
+"""
+
+import os
+import sys
+import gzip
+import copy
+import json
+import queue
+import shutil
+import logging
+import contextvars
+import logging.handlers
+from contextlib import contextmanager
+from datetime import datetime
+
+from monitoring.metrics import REGISTRY
+
+# 既定の出力先
+LOG_DIR = "logs"
+LOG_FILE_NAME = "support_hub.log"
+
+# 書き込み待ちの上限（超えた分は破棄して処理を止めない）
+LOG_QUEUE_SIZE = 10000
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# JSONに含める付加情報
+CONTEXT_FIELDS = ("query_id", "tweet_id")
+
+LOG_CONTEXT = contextvars.ContextVar("log_context", default={})
+
+LOG_RECORDS_DROPPED = REGISTRY.counter("log_records_dropped_total", "キューが満杯で破棄したログ件数")
+
+@contextmanager
+def log_context(**fields):
+    """ブロック内のログに問い合わせID・ツイートIDなどを付加"""
+    token = LOG_CONTEXT.set({**LOG_CONTEXT.get(), **fields})
+    try:
+        yield
+    finally:
+        LOG_CONTEXT.reset(token)
+
+class ContextFilter(logging.Filter):
+    """log_contextの値をレコードに設定（呼び出し元のスレッド・タスクで実行）"""
+
+    def filter(self, record):
+        for key, value in LOG_CONTEXT.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """1行1レコードのJSON形式"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key in CONTEXT_FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """キューが満杯のときは待たずに破棄するQueueHandler"""
+
+    def prepare(self, record):
+        """メッセージを確定し、例外は文字列にしてから別スレッドに渡す"""
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+class RotatingLogHandler(logging.handlers.TimedRotatingFileHandler):
+    """日付またはサイズでローテーションし、古いファイルをgzip圧縮するハンドラー"""
+
+    def __init__(self, filename, max_bytes=0, backup_count=14):
+        """初期化（max_bytes=0 なら日次のみ）"""
+        super().__init__(filename, when="midnight", backupCount=backup_count, encoding="utf-8")
+        self.max_bytes = max_bytes
+        self.namer = self._gzip_name
+        self.rotator = self._gzip_rotate
+
+    def shouldRollover(self, record):
+        if super().shouldRollover(record):
+            return True
+
+        if self.max_bytes and self.stream is not None:
+            self.stream.seek(0, 2)
+            return self.stream.tell() >= self.max_bytes
+
+        return False
+
+    @staticmethod
+    def _gzip_name(name):
+        """同じ日に複数回ローテーションしても上書きしない名前"""
+        candidate = f"{name}.gz"
+        number = 1
+        while os.path.exists(candidate):
+            candidate = f"{name}.{number}.gz"
+            number += 1
+        return candidate
+
+    @staticmethod
+    def _gzip_rotate(source, dest):
+        """ローテーションしたファイルを圧縮"""
+        with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+def setup_logging(log_dir=LOG_DIR, json_lines=False, max_bytes=0, backup_count=14, level=logging.INFO):
+    """キュー経由のロギングを設定し、書き込み用のQueueListenerを返す（終了時にstop()を呼ぶ）"""
+    os.makedirs(log_dir, exist_ok=True)
+
+    formatter = JsonFormatter() if json_lines else logging.Formatter(TEXT_FORMAT)
+
+    file_handler = RotatingLogHandler(os.path.join(log_dir, LOG_FILE_NAME), max_bytes, backup_count)
+    file_handler.setFormatter(formatter)
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    # 呼び出し側はキューに積むだけで、書き込み・圧縮はリスナーのスレッドで行う
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    return listener
\ No newline at end of file
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+メトリクス: カウンター・ゲージ・レイテンシヒストグラムの集計
+"""
+
+import time
+import asyncio
+import logging
+import threading
+import functools
+
+logger = logging.getLogger(__name__)
+
+# レイテンシヒストグラムのバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _format_value(value):
+    """Prometheusテキスト形式の数値表記"""
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _format_labels(labelnames, key, extra=None):
+    """ラベルを {name="value",...} 形式に整形"""
+    pairs = list(zip(labelnames, key))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+class _Metric:
+    """メトリクスの基底クラス"""
+
+    type_name = "untyped"
+
+    def __init__(self, name, help_text="", labelnames=()):
+        """初期化"""
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        """ラベルの値をキーに変換"""
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        """Prometheusテキスト形式の行を返す"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    """単調増加するカウンター"""
+
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        """カウンターを加算"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        """現在値を取得"""
+        return self._values.get(self._key(labels), 0)
+
+    def total(self):
+        """全ラベルの合計"""
+        with self._lock:
+            return sum(self._values.values())
+
+class Gauge(_Metric):
+    """増減する現在値"""
+
+    type_name = "gauge"
+
+    def __init__(self, name, help_text="", labelnames=()):
+        """初期化"""
+        super().__init__(name, help_text, labelnames)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        """値を設定"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        """値を加算"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        """値を減算"""
+        self.inc(-amount, **labels)
+
+    def set_function(self, func, **labels):
+        """出力時に呼び出して値を得る関数を登録（キューの深さなど）"""
+        with self._lock:
+            self._functions[self._key(labels)] = func
+
+    def get(self, **labels):
+        """現在値を取得"""
+        key = self._key(labels)
+        if key in self._functions:
+            return self._functions[key]()
+        return self._values.get(key, 0)
+
+    def render(self):
+        """関数登録された値も含めて出力"""
+        with self._lock:
+            functions = list(self._functions.items())
+
+        for key, func in functions:
+            try:
+                value = func()
+            except Exception as e:
+                logger.debug(f"ゲージ {self.name} の値取得に失敗しました: {e}")
+                continue
+            with self._lock:
+                self._values[key] = value
+
+        return super().render()
+
+class Histogram(_Metric):
+    """レイテンシなどの分布"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, help_text="", labelnames=(), buckets=DEFAULT_BUCKETS):
+        """初期化"""
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """値を記録"""
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [各バケットの件数..., 合計, 件数]
+                state = [0] * len(self.buckets) + [0.0, 0]
+                self._values[key] = state
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def time(self, **labels):
+        """実行時間を記録するコンテキストマネージャー"""
+        return _Timer(self, None, labels)
+
+    def snapshot(self, **labels):
+        """(バケット別件数, 合計, 件数) を取得"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            if state is None:
+                return [0] * len(self.buckets), 0.0, 0
+            return list(state[:-2]), state[-2], state[-1]
+
+    def render(self):
+        """バケットは累積値で出力"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, ("le", "+Inf"))
+            lines.append(f"{self.name}_bucket{labels} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+class _Timer:
+    """ヒストグラムに経過時間を記録し、例外をエラーカウンターに数える"""
+
+    def __init__(self, histogram, errors, labels):
+        """初期化"""
+        self.histogram = histogram
+        self.errors = errors
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        if exc_type is not None and self.errors is not None:
+            self.errors.inc(**self.labels)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+class MetricsRegistry:
+    """メトリクスを名前で管理するレジストリ"""
+
+    def __init__(self):
+        """初期化"""
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, labelnames, **kwargs):
+        """同名のメトリクスがあれば再利用"""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help_text, labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f"メトリクス {name} は {metric.type_name} として登録済みです")
+            return metric
+
+    def counter(self, name, help_text="", labelnames=()):
+        """カウンターを取得"""
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text="", labelnames=()):
+        """ゲージを取得"""
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text="", labelnames=(), buckets=DEFAULT_BUCKETS):
+        """ヒストグラムを取得"""
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def track(self, name, **labels):
+        """{name}_duration_seconds と {name}_errors_total に記録するコンテキストマネージャー"""
+        labelnames = tuple(sorted(labels))
+        histogram = self.histogram(f"{name}_duration_seconds", f"{name} の処理時間（秒）", labelnames)
+        errors = self.counter(f"{name}_errors_total", f"{name} のエラー件数", labelnames)
+        return _Timer(histogram, errors, labels)
+
+    def timed(self, name, **labels):
+        """非同期関数の処理時間を記録するデコレータ"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.track(name, **labels):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def render(self):
+        """全メトリクスをPrometheusテキスト形式で出力"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# アプリケーション全体で共有するレジストリ
+REGISTRY = MetricsRegistry()
+
+def track(name, **labels):
+    """共有レジストリで処理時間を記録"""
+    return REGISTRY.track(name, **labels)
+
+def timed(name, **labels):
+    """共有レジストリで非同期関数の処理時間を記録するデコレータ"""
+    return REGISTRY.timed(name, **labels)
+
+async def monitor_event_loop_lag(interval=1.0, registry=REGISTRY, on_lag=None):
+    """イベントループの遅延を継続的に計測するタスク（on_lag: 計測のたびに遅延（秒）を渡して呼ぶ関数）"""
+    lag_gauge = registry.gauge("event_loop_lag_seconds", "直近のイベントループ遅延（秒）")
+    lag_histogram = registry.histogram(
+        "event_loop_lag_distribution_seconds", "イベントループ遅延の分布（秒）",
+        buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+    )
+    loop = asyncio.get_running_loop()
+
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        lag_gauge.set(lag)
+        lag_histogram.observe(lag)
+        if on_lag is not None:
+            on_lag(lag)
\ No newline at end of file
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+プロファイラ: 処理時間の計測と低速処理のスタックサンプリング
+"""
+
+import os
+import sys
+import asyncio
+import time
+import logging
+import threading
+import functools
+from collections import deque, Counter as StackCounter
+from datetime import datetime
+
+from monitoring.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# 低速処理の出力先
+PROFILE_OUTPUT_DIR = "logs/profiles"
+
+# スタックサンプルの保持数（5ms間隔・数スレッドで約1分分）
+MAX_SAMPLES = 100000
+
+# 直近の低速処理の保持数
+MAX_RECENT_SLOW = 50
+
+SLOW_OPERATIONS = REGISTRY.counter("slow_operations_total", "閾値を超えた処理の件数", ("operation",))
+
+class _Token:
+    """計測中の処理"""
+
+    __slots__ = ("name", "wall_start", "cpu_start")
+
+    def __init__(self, name):
+        """初期化"""
+        self.name = name
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+
+class Profiler:
+    """オプトインのプロファイラ（無効時はフラグ確認のみ）"""
+
+    def __init__(self, threshold=1.0, sample_interval=0.005, output_dir=PROFILE_OUTPUT_DIR):
+        """初期化"""
+        self.enabled = False
+        self.threshold = threshold
+        self.sample_interval = sample_interval
+        self.output_dir = output_dir
+        self.recent_slow = deque(maxlen=MAX_RECENT_SLOW)
+        self._samples = deque(maxlen=MAX_SAMPLES)
+        self._stop_event = threading.Event()
+        self._sampler = None
+        self._writes = set()
+
+    def enable(self, threshold=None):
+        """プロファイリングを有効化"""
+        if threshold is not None:
+            self.threshold = threshold
+
+        if not self.enabled:
+            self._stop_event.clear()
+            self._sampler = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+            self._sampler.start()
+            self.enabled = True
+
+        logger.info(f"プロファイリングを有効化しました（閾値 {self.threshold * 1000:.0f}ms）")
+
+    def disable(self):
+        """プロファイリングを無効化"""
+        if self.enabled:
+            self.enabled = False
+            self._stop_event.set()
+            self._sampler = None
+            self._samples.clear()
+
+        logger.info("プロファイリングを無効化しました")
+
+    def _sample_loop(self):
+        """全スレッドのスタックを定期的に記録"""
+        own_id = threading.get_ident()
+
+        while not self._stop_event.wait(self.sample_interval):
+            now = time.perf_counter()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+
+                stack.append(names.get(thread_id, str(thread_id)))
+                self._samples.append((now, ";".join(reversed(stack))))
+
+    def begin(self, name):
+        """計測開始（無効時はNone）"""
+        if not self.enabled:
+            return None
+        return _Token(name)
+
+    def end(self, token):
+        """計測終了し、閾値を超えていれば記録"""
+        if token is None:
+            return None
+
+        wall = time.perf_counter() - token.wall_start
+        cpu = time.process_time() - token.cpu_start
+        if wall < self.threshold:
+            return None
+
+        record = {
+            "operation": token.name,
+            "wall_time": round(wall, 3),
+            "cpu_time": round(cpu, 3),
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "profile": None
+        }
+        self.recent_slow.append(record)
+        SLOW_OPERATIONS.inc(operation=token.name)
+
+        logger.warning(f"低速な処理: {token.name} 実時間 {wall:.3f}秒 / CPU {cpu:.3f}秒")
+        self._dump_samples(token, wall, record)
+        return record
+
+    def _dump_samples(self, token, wall, record):
+        """スタックの保存を別スレッドで行う（低速な処理の直後にイベントループでファイルI/Oをしない）"""
+        samples = list(self._samples)
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_samples(token, wall, samples, record)
+            return
+
+        task = loop.create_task(asyncio.to_thread(self._write_samples, token, wall, samples, record))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    def _write_samples(self, token, wall, samples, record):
+        """処理中に採取したスタックをfolded形式で保存し、保存先をrecordに記録"""
+        end = token.wall_start + wall
+        stacks = StackCounter(stack for ts, stack in samples if token.wall_start <= ts <= end)
+        if not stacks:
+            return None
+
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in token.name)
+            path = os.path.join(self.output_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{safe_name}.folded")
+
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+
+            record["profile"] = path
+            logger.info(f"プロファイルを保存しました: {token.name} ({path})")
+            return path
+
+        except Exception as e:
+            logger.error(f"プロファイルの保存に失敗しました: {e}", exc_info=True)
+            return None
+
+    def profiled(self, name):
+        """非同期関数をプロファイル対象にするデコレータ"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return await func(*args, **kwargs)
+
+                token = self.begin(name)
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.end(token)
+            return wrapper
+        return decorator
+
+# アプリケーション全体で共有するプロファイラ
+PROFILER = Profiler()
+
+def profiled(name):
+    """共有プロファイラで計測するデコレータ"""
+    return PROFILER.profiled(name)
\ No newline at end of file
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+障害対策: ジッター付き指数バックオフの再試行と、バックエンドごとのサーキットブレーカー
+"""
+
+import time
+import random
+import asyncio
+import logging
+import threading
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from monitoring.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# エラーの分類
+THROTTLED = "throttled"      # 429: 処理されておらず、バックエンドは稼働中
+UNAVAILABLE = "unavailable"  # 接続できない: 処理されておらず、バックエンドが停止中
+TRANSIENT = "transient"      # 5xx・タイムアウト・切断: 一時的だが処理されたかは不明
+PERMANENT = "permanent"      # 4xx・データの問題など: 再試行しても結果は変わらない
+
+RETRY_ATTEMPTS = REGISTRY.counter(
+    "retry_attempts_total", "一時的なエラーによる再試行の回数", ("backend", "operation")
+)
+CIRCUIT_STATE = REGISTRY.gauge(
+    "circuit_breaker_state", "サーキットブレーカーの状態（0: closed, 1: half_open, 2: open）", ("backend",)
+)
+CIRCUIT_REJECTED = REGISTRY.counter(
+    "circuit_breaker_rejected_total", "バックエンド停止中として即座に失敗させた呼び出し数", ("backend",)
+)
+
+class CircuitOpenError(Exception):
+    """バックエンドが停止中と判断し、呼び出しを行わなかった"""
+
+    def __init__(self, backend, retry_in):
+        """初期化（retry_in: 次に復旧を確認するまでの秒数）"""
+        super().__init__(f"{backend} は停止中と判断されています（{retry_in:.0f}秒後に復旧を確認します）")
+        self.backend = backend
+        self.retry_in = retry_in
+
+def classify_error(error):
+    """例外を再試行・回路判定用に分類"""
+    # gspreadのAPIError・tweepyのHTTPExceptionはどちらもresponseを持つ
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        if status == 429:
+            return THROTTLED
+        if status == 408 or status >= 500:
+            return TRANSIENT
+        return PERMANENT
+
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return UNAVAILABLE
+    if isinstance(error, requests.exceptions.ConnectionError):
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return UNAVAILABLE if isinstance(reason, NewConnectionError) else TRANSIENT
+    if isinstance(error, (requests.exceptions.Timeout, ConnectionError, TimeoutError)):
+        return TRANSIENT
+
+    return PERMANENT
+
+def retry_after(error):
+    """レスポンスのRetry-Afterヘッダー（秒、なければ0）"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+class RetryPolicy:
+    """操作の種類ごとの再試行設定"""
+
+    def __init__(self, name, attempts=4, base_delay=0.5, max_delay=10.0, idempotent=True):
+        """初期化（idempotent=False の操作は、処理されていないことが確実なエラーだけ再試行する）"""
+        self.name = name
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.idempotent = idempotent
+
+    def should_retry(self, kind, attempt):
+        """attempt回目の失敗の後に再試行するか"""
+        if attempt >= self.attempts:
+            return False
+        if kind in (THROTTLED, UNAVAILABLE):
+            return True
+        return kind == TRANSIENT and self.idempotent
+
+    def delay(self, attempt, error=None):
+        """待ち時間（フルジッター: 0 〜 base_delay×2^(attempt-1) の一様乱数、Retry-Afterがあればそれ以上）"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if error is not None:
+            delay = max(delay, min(retry_after(error), self.max_delay))
+        return delay
+
+# 操作の種類ごとの既定の設定
+READ_POLICY = RetryPolicy("read", attempts=4, base_delay=0.5, max_delay=8.0)
+IDEMPOTENT_WRITE_POLICY = RetryPolicy("idempotent_write", attempts=4, base_delay=1.0, max_delay=15.0)
+NON_IDEMPOTENT_WRITE_POLICY = RetryPolicy("non_idempotent_write", attempts=3, base_delay=1.0, max_delay=15.0, idempotent=False)
+POLL_POLICY = RetryPolicy("poll", attempts=5, base_delay=1.0, max_delay=30.0)
+
+class CircuitBreaker:
+    """連続して失敗したバックエンドへの呼び出しを一定時間止め、復旧を1件ずつ確認する"""
+
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+    def __init__(self, backend, failure_threshold=5, recovery_timeout=30.0):
+        """初期化（failure_threshold回連続で失敗したら開き、recovery_timeout秒後に復旧を確認）"""
+        self.backend = backend
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self._lock = threading.Lock()
+
+        CIRCUIT_STATE.set_function(lambda: self.state, backend=backend)
+
+    def before_call(self):
+        """呼び出してよいか確認（停止中ならCircuitOpenErrorを送出）"""
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.recovery_timeout - time.monotonic()
+                if remaining > 0:
+                    CIRCUIT_REJECTED.inc(backend=self.backend)
+                    raise CircuitOpenError(self.backend, remaining)
+                self.state = self.HALF_OPEN
+                self.probing = False
+
+            if self.state == self.HALF_OPEN:
+                # 復旧の確認は1件ずつ（他の呼び出しは結果が出るまで即座に失敗させる）
+                if self.probing:
+                    CIRCUIT_REJECTED.inc(backend=self.backend)
+                    raise CircuitOpenError(self.backend, 0)
+                self.probing = True
+
+    def record_success(self):
+        """応答があった（エラー応答でもバックエンドは稼働している）"""
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"{self.backend} の復旧を確認しました")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        """接続できない・5xxなどの失敗"""
+        with self._lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"{self.backend} への呼び出しを{self.recovery_timeout:.0f}秒間停止します（連続{self.failures}回失敗）")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def record(self, kind):
+        """エラーの分類に応じて記録"""
+        if kind in (UNAVAILABLE, TRANSIENT):
+            self.record_failure()
+        else:
+            self.record_success()
+
+async def retry_call(func, policy, breaker, operation):
+    """funcを呼び出し、一時的なエラーはpolicyに従って再試行（func: 引数なしでawaitableを返す関数）"""
+    attempt = 0
+    while True:
+        attempt += 1
+        breaker.before_call()
+        try:
+            result = await func()
+        except Exception as e:
+            kind = classify_error(e)
+            breaker.record(kind)
+            if not policy.should_retry(kind, attempt):
+                raise
+
+            delay = policy.delay(attempt, e)
+            RETRY_ATTEMPTS.inc(backend=breaker.backend, operation=operation)
+            logger.warning(f"{breaker.backend}.{operation} で一時的なエラーが発生しました（{attempt}回目、{delay:.1f}秒後に再試行）: {e}")
+            await asyncio.sleep(delay)
+            continue
+
+        breaker.record_success()
+        return result
\ No newline at end of file
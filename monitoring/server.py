@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+監視用HTTPサーバー: ローカルのメトリクス・稼働状態のエンドポイント
+"""
+
+import json
+import logging
+from aiohttp import web
+
+from monitoring.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Prometheusテキスト形式のContent-Type
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class MonitoringServer:
+    """メトリクスなどを公開するローカルHTTPサーバー"""
+
+    def __init__(self, host="127.0.0.1", port=9108, registry=REGISTRY):
+        """初期化"""
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self.app = web.Application()
+        self.runner = None
+        self.health = None
+
+        self.add_route("/metrics", self.metrics_handler)
+
+    def add_route(self, path, handler):
+        """GETエンドポイントを追加"""
+        self.app.router.add_get(path, handler)
+
+    async def metrics_handler(self, request):
+        """/metrics: Prometheusテキスト形式で出力"""
+        body = self.registry.render().encode("utf-8")
+        return web.Response(body=body, headers={"Content-Type": PROMETHEUS_CONTENT_TYPE})
+
+    def add_health_checks(self, health):
+        """/healthz・/readyz を追加（health: HealthChecks）"""
+        self.health = health
+        self.add_route("/healthz", self.healthz_handler)
+        self.add_route("/readyz", self.readyz_handler)
+
+    async def healthz_handler(self, request):
+        """/healthz: 生存確認（失敗は503、オーケストレーターが再起動する）"""
+        return await self._health_response(self.health.liveness)
+
+    async def readyz_handler(self, request):
+        """/readyz: 受付可能か（失敗は503）"""
+        return await self._health_response(self.health.readiness)
+
+    async def _health_response(self, checks):
+        """確認の結果をJSONで返す"""
+        ok, results = await self.health.run(checks)
+        return web.json_response(
+            {"status": "ok" if ok else "fail", "checks": results}, status=200 if ok else 503,
+            dumps=lambda value: json.dumps(value, ensure_ascii=False)
+        )
+
+    async def start(self):
+        """サーバーを起動"""
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        logger.info(f"監視用エンドポイントを http://{self.host}:{self.port} で公開しました")
+
+    async def stop(self):
+        """サーバーを停止"""
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
\ No newline at end of file
@@ -174,6 +174,19 @@ def setup_config_files():
     
     print(f"✓ {config_path}")
     
+    # テンプレート定数設定（{company_name}などの置換値）
+    template_constants = {
+        "company_name": "株式会社サンプル",
+        "support_email": "support@example.com",
+        "support_phone": "03-1234-5678"
+    }
+    
+    config_path = Path("config/template_constants.json")
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(template_constants, f, ensure_ascii=False, indent=2)
+    
+    print(f"✓ {config_path}")
+    
     # サンプルAPIレスポンス設定（デバッグ用）
     sample_responses = {
         "search_mentions": {
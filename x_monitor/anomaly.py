@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+急増検知: 届いた問い合わせの件数をカテゴリごとに5分単位で数え、平常時の件数と比べて急増を通知
+
+カテゴリごとに直近の件数の指数移動平均（EWMA）と、曜日・時間帯（1週間168区分）ごとの
+平常時の件数を持ち、問い合わせが届くたびに現在の5分間の件数がしきい値（平常時の件数から
+偶然には10万回に1回しか届かない件数）を超えたか判定します。保持する値も1件あたりの計算量も
+件数によらず一定です。5分間が終わるのを待たずに判定するため、しきい値に達したその1件で通知します。
+
+件数は届いた時刻ではなく投稿日時の5分間に数えます（1回のポーリングで10分間分がまとめて届いても
+1区間に集まらない）。遅れて届く問い合わせを待つため、区間はポーリング間隔より長い猶予の後に閉じます。
+検知の遅れはポーリング間隔（既定10分）が上限です。
+"""
+
+import math
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from monitoring.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# 件数を数える区間の長さ（秒）
+BIN_SECONDS = 300
+BINS_PER_HOUR = 3600 // BIN_SECONDS
+
+# 曜日・時間帯の区分数（1週間 = 168時間）
+SEASONAL_SLOTS = 7 * 24
+
+# 直近の件数の平滑化係数（1区間ごと、約50分で半減）と、曜日・時間帯ごとの平滑化係数
+LEVEL_ALPHA = 0.1
+SEASONAL_ALPHA = 0.05
+
+# 曜日・時間帯ごとの件数を使い始めるまでに必要な区間数（1週間分）
+SEASONAL_READY_BINS = BINS_PER_HOUR
+
+# 判定を始めるまでに必要な区間数（1時間分）
+WARMUP_BINS = BINS_PER_HOUR
+
+# しきい値: 平常時の件数をポアソン分布とみなし、1区間でその件数以上になる確率がALERT_PROBABILITY未満の件数。
+# 件数のばらつきがポアソン分布より大きいカテゴリは、平常時の件数 + 標準偏差のSPIKE_Z倍も下回らないようにする
+ALERT_PROBABILITY = 1e-5
+SPIKE_Z = 4.0
+MIN_SPIKE_COUNT = 5
+
+# 同じカテゴリを続けて通知しない時間（秒）
+ALERT_COOLDOWN = 1800
+
+# これより古い問い合わせ（停止後の取りこぼし回収など）は件数に含めない（秒）。
+# 区間を閉じるまで遅れて届く問い合わせを待つ時間も兼ねるため、ポーリング間隔（既定600秒）の2倍にする
+MAX_EVENT_AGE = 1200
+
+# この区間数より長く問い合わせ・時刻の更新がなければ停止していたとみなし、空白期間を平常時の件数に含めない
+MAX_GAP_BINS = BINS_PER_HOUR
+
+# 時刻を進める間隔（秒、問い合わせがないカテゴリの区間を閉じる）
+TICK_INTERVAL = 60
+
+# 傾向の判定: 数時間分の件数と平常時の件数の平滑化係数（約3時間で半減）、何倍以上・以下を増減とするか、
+# 偶然の揺らぎとみなさない差（標準偏差の何倍か）、判定に必要な平常時の件数（1時間あたり）
+TREND_ALPHA = 0.02
+TREND_RATIO = 1.5
+TREND_Z = 3.0
+TREND_MIN_HOURLY = 1.0
+
+# 起動時に平常時の件数を作るために読む期間（週）
+HISTORY_WEEKS = 4
+
+# 全カテゴリ合計の集計名
+TOTAL = "all"
+
+ANOMALIES = REGISTRY.counter("query_anomalies_total", "問い合わせの急増を検知した回数", ("category",))
+
+def _poisson_threshold(expected):
+    """平均expectedのポアソン分布で、その件数以上になる確率がALERT_PROBABILITY未満となる最小の件数"""
+    # 件数が多い場合は正規分布で近似する（計算量を一定に抑える）
+    if expected > 100:
+        return math.ceil(expected + 4.3 * math.sqrt(expected))
+
+    term = math.exp(-expected)
+    cumulative = term
+    count = 0
+    while 1 - cumulative >= ALERT_PROBABILITY:
+        count += 1
+        term *= expected / count
+        cumulative += term
+    return count + 1
+
+def _slot(timestamp):
+    """曜日・時間帯の区分（月曜0時 = 0）"""
+    moment = datetime.fromtimestamp(timestamp)
+    return moment.weekday() * 24 + moment.hour
+
+class CategoryBaseline:
+    """1カテゴリ分の件数と平常時の件数"""
+
+    def __init__(self, category, now, lateness=MAX_EVENT_AGE):
+        """初期化（lateness: 遅れて届く問い合わせを待ってから区間を閉じるまでの秒数）"""
+        self.category = category
+        self.lateness = lateness
+        self.bin_start = (now - lateness) // BIN_SECONDS * BIN_SECONDS
+        self.counts = {}
+        self.bins = 0
+        self.level = 0.0
+        self.variance = 0.0
+        self.trend_level = 0.0
+        self.trend_expected = 0.0
+        self.seasonal = [0.0] * SEASONAL_SLOTS
+        self.seasonal_bins = [0] * SEASONAL_SLOTS
+        self.alerted_until = 0
+        self.last_alert = None
+
+    @property
+    def ready(self):
+        """判定に十分な件数の履歴があるか"""
+        return self.bins >= WARMUP_BINS
+
+    def expected(self, bin_start=None):
+        """区間の平常時の件数（曜日・時間帯の履歴が十分あればそれを、なければ直近の平均を使う）"""
+        slot = _slot(self.bin_start if bin_start is None else bin_start)
+        if self.seasonal_bins[slot] >= SEASONAL_READY_BINS:
+            return self.seasonal[slot]
+        return self.level
+
+    def threshold(self, bin_start=None):
+        """区間の急増のしきい値"""
+        expected = self.expected(bin_start)
+        return max(MIN_SPIKE_COUNT, _poisson_threshold(expected), expected + SPIKE_Z * math.sqrt(self.variance))
+
+    def advance(self, now):
+        """遅れて届く問い合わせを待つ時間が過ぎた区間を閉じて平常時の件数を更新"""
+        current = (now - self.lateness) // BIN_SECONDS * BIN_SECONDS
+        gap = int((current - self.bin_start) // BIN_SECONDS)
+        if gap <= 0:
+            return
+
+        # 停止していた期間は件数0として扱わない
+        if gap > MAX_GAP_BINS:
+            self.bin_start = current
+            self.counts = {start: count for start, count in self.counts.items() if start >= current}
+            return
+
+        for _ in range(gap):
+            self._close(self.counts.pop(self.bin_start, 0))
+
+    def _close(self, count):
+        """区間を1つ閉じる（急増した区間で平常時の件数が引き上げられないよう、しきい値で頭打ちにする）"""
+        expected = self.expected()
+        value = min(count, self.threshold())
+
+        # 履歴が少ないうちは単純平均、その後は指数移動平均
+        weight = max(LEVEL_ALPHA, 1 / (self.bins + 1))
+        self.variance += weight * ((value - expected) ** 2 - self.variance)
+        self.level += weight * (value - self.level)
+
+        # 傾向の判定用に、実際の件数と平常時の件数を同じ重みで平滑化する（時間帯による増減を打ち消す）
+        weight = max(TREND_ALPHA, 1 / (self.bins + 1))
+        self.trend_level += weight * (value - self.trend_level)
+        self.trend_expected += weight * (expected - self.trend_expected)
+
+        slot = _slot(self.bin_start)
+        weight = max(SEASONAL_ALPHA, 1 / (self.seasonal_bins[slot] + 1))
+        self.seasonal[slot] += weight * (value - self.seasonal[slot])
+        self.seasonal_bins[slot] += 1
+
+        self.bins += 1
+        self.bin_start += BIN_SECONDS
+
+    def observe(self, timestamp, now):
+        """投稿日時timestampの1件をその区間に数え、急増していれば通知内容を返す"""
+        self.advance(now)
+        bin_start = timestamp // BIN_SECONDS * BIN_SECONDS
+        if bin_start < self.bin_start:
+            return None
+        count = self.counts[bin_start] = self.counts.get(bin_start, 0) + 1
+
+        if not self.ready or now < self.alerted_until:
+            return None
+
+        threshold = self.threshold(bin_start)
+        if count < threshold:
+            return None
+
+        self.alerted_until = now + ALERT_COOLDOWN
+        self.last_alert = {
+            "category": self.category,
+            "count": count,
+            "expected": round(self.expected(bin_start), 2),
+            "threshold": round(threshold, 2),
+            "window_start": datetime.fromtimestamp(bin_start),
+            "detected_at": datetime.fromtimestamp(now)
+        }
+        return self.last_alert
+
+class AnomalyDetector:
+    """カテゴリごとの問い合わせの急増検知"""
+
+    def __init__(self, notify=None, clock=time.time, max_event_age=MAX_EVENT_AGE):
+        """初期化（notify: 急増を検知したときに呼ぶ非同期関数、clock: 現在時刻のUNIX秒を返す関数、
+        max_event_age: 件数に含める問い合わせの投稿からの経過秒数。ポーリング間隔より長くする）"""
+        self.notify = notify
+        self.clock = clock
+        self.max_event_age = max_event_age
+        self.baselines = {}
+        self.task = None
+        self._notifications = set()
+
+    def _baseline(self, category, now):
+        """カテゴリの集計（なければ作成）"""
+        baseline = self.baselines.get(category)
+        if baseline is None:
+            baseline = self.baselines[category] = CategoryBaseline(category, now, self.max_event_age)
+        return baseline
+
+    def start(self):
+        """区間を進めるタスクを開始"""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._tick_loop())
+
+    async def _tick_loop(self):
+        """問い合わせがないカテゴリの区間も時刻どおりに閉じる"""
+        while True:
+            await asyncio.sleep(TICK_INTERVAL)
+            self.tick()
+
+    def tick(self, now=None):
+        """すべてのカテゴリの区間をnowまで進める"""
+        now = self.clock() if now is None else now
+        for baseline in self.baselines.values():
+            baseline.advance(now)
+
+    def observe(self, category, created_at=None, now=None):
+        """届いた問い合わせを数え、検知した急増のリストを返す（created_at: 投稿日時、通知は非同期に送信）"""
+        now = self.clock() if now is None else now
+
+        # 届いた時刻ではなく投稿日時の区間に数える（ポーリング間隔分がまとめて届いても1区間に集まらない）
+        timestamp = now if created_at is None else min(created_at.timestamp(), now)
+
+        # 停止中に投稿されていた問い合わせをまとめて数えると急増に見えるため除く
+        if timestamp < now - self.max_event_age:
+            return []
+
+        alerts = []
+        for name in (category or "general", TOTAL):
+            alert = self._baseline(name, now).observe(timestamp, now)
+            if alert is not None:
+                # カテゴリで検知した急増を全体でも重ねて通知しない
+                total = self._baseline(TOTAL, now)
+                total.alerted_until = max(total.alerted_until, now + ALERT_COOLDOWN)
+                alerts.append(alert)
+                ANOMALIES.inc(category=name)
+                logger.warning(
+                    f"問い合わせの急増を検知しました（{name}: {alert['count']}件/{BIN_SECONDS // 60}分、"
+                    f"平常時 {alert['expected']}件）"
+                )
+                self._schedule(alert)
+        return alerts
+
+    def _schedule(self, alert):
+        """通知を送信するタスクを開始（参照を保持して途中で破棄されないようにする）"""
+        if self.notify is None:
+            return
+        task = asyncio.get_running_loop().create_task(self._send(alert))
+        self._notifications.add(task)
+        task.add_done_callback(self._notifications.discard)
+
+    async def _send(self, alert):
+        """通知を送信"""
+        try:
+            await self.notify(alert)
+        except Exception as e:
+            logger.error(f"急増の通知に失敗しました: {e}", exc_info=True)
+
+    async def load_history(self, storage, weeks=HISTORY_WEEKS):
+        """保存先の時間単位の集計から平常時の件数を作成（集計がなければ届いた問い合わせから学習する）"""
+        end = datetime.fromtimestamp(self.clock() // 3600 * 3600)
+        start = end - timedelta(weeks=weeks)
+        try:
+            hourly_counts = await storage.get_hourly_counts(start, end)
+        except Exception as e:
+            logger.warning(f"急増検知の履歴を読み込めませんでした（届いた問い合わせから学習します）: {e}")
+            return
+        if hourly_counts:
+            self.warm_up(hourly_counts, start, end)
+
+    def warm_up(self, hourly_counts, start, end, now=None):
+        """時間単位の件数（(YYYY-MM-DD HH, {カテゴリ: 件数}) のリスト、[start, end)）から平常時の件数を作成"""
+        now = self.clock() if now is None else now
+        counts = dict(hourly_counts)
+        categories = {category for row in counts.values() for category in row} | {TOTAL}
+
+        sums = {category: [0.0] * SEASONAL_SLOTS for category in categories}
+        hours = [0] * SEASONAL_SLOTS
+        recent = {category: 0 for category in categories}
+        recent_hours = 0
+
+        hour = start.timestamp() // 3600 * 3600
+        while hour < end.timestamp():
+            moment = datetime.fromtimestamp(hour)
+            row = counts.get(moment.strftime("%Y-%m-%d %H"), {})
+            slot = _slot(hour)
+            hours[slot] += 1
+            is_recent = hour >= end.timestamp() - 86400
+            recent_hours += is_recent
+            for category in categories:
+                count = sum(row.values()) if category == TOTAL else row.get(category, 0)
+                sums[category][slot] += count
+                if is_recent:
+                    recent[category] += count
+            hour += 3600
+
+        for category in categories:
+            baseline = self._baseline(category, now)
+            for slot in range(SEASONAL_SLOTS):
+                if hours[slot]:
+                    baseline.seasonal[slot] = sums[category][slot] / hours[slot] / BINS_PER_HOUR
+                    baseline.seasonal_bins[slot] = hours[slot] * BINS_PER_HOUR
+            baseline.bins = sum(hours) * BINS_PER_HOUR
+            baseline.level = recent[category] / max(recent_hours, 1) / BINS_PER_HOUR
+            baseline.variance = baseline.level
+            baseline.trend_level = baseline.trend_expected = baseline.level
+
+        logger.info(f"急増検知の平常時の件数を過去{sum(hours)}時間分の集計から作成しました")
+
+    def describe(self, labels=None, now=None):
+        """現在の傾向の説明文（直近の急増、平常時と比べた増減）"""
+        now = self.clock() if now is None else now
+        labels = dict(labels or {}, **{TOTAL: "全体"})
+
+        lines = []
+        ready = False
+        for category, baseline in sorted(self.baselines.items(), key=lambda item: item[0] != TOTAL):
+            baseline.advance(now)
+            if not baseline.ready:
+                continue
+            ready = True
+            label = labels.get(category, category)
+
+            alert = baseline.last_alert
+            if alert is not None and now - alert["detected_at"].timestamp() < 3600:
+                lines.append(
+                    f"🚨 {label}: {alert['window_start'].strftime('%H:%M')}から急増"
+                    f"（{BIN_SECONDS // 60}分間に{alert['count']}件、平常時 {alert['expected']:.1f}件）"
+                )
+                continue
+
+            # 平滑化した件数は約1/TREND_ALPHA区間分の合計に相当するため、その件数のポアソン分布の揺らぎと比べる
+            expected = baseline.trend_expected
+            recent = baseline.trend_level
+            if expected * BINS_PER_HOUR < TREND_MIN_HOURLY:
+                continue
+            score = (recent - expected) * math.sqrt(1 / TREND_ALPHA / expected)
+            rates = f"直近数時間 {recent * BINS_PER_HOUR:.1f}件/時、平常時 {expected * BINS_PER_HOUR:.1f}件/時"
+            if recent >= expected * TREND_RATIO and score >= TREND_Z:
+                lines.append(f"📈 {label}: 増加傾向（{rates}）")
+            elif recent <= expected / TREND_RATIO and score <= -TREND_Z:
+                lines.append(f"📉 {label}: 減少傾向（{rates}）")
+
+        if not ready:
+            return "傾向を判断するデータが不足しています。"
+        return "\n".join(lines) or "問い合わせ数は平常の範囲です。"
\ No newline at end of file
@@ -6,81 +6,321 @@ Discord-X-Support-Hub
 X API クライアント: X (Twitter) APIとの通信処理
 """
 
+import os
+import json
+import time
 import tweepy
+import hashlib
 import logging
 import asyncio
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 import re
 
+from monitoring.metrics import track
+from monitoring.http_pool import mount_pooled_adapter
+from monitoring.resilience import CircuitBreaker, retry_call, READ_POLICY, NON_IDEMPOTENT_WRITE_POLICY, POLL_POLICY
+
 logger = logging.getLogger(__name__)
 
+# X API の時刻書式（UTC）
+X_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+# 取りこぼし回収の設定
+CATCHUP_WINDOW = timedelta(minutes=15)   # 1リクエストで取得する期間
+CATCHUP_CONCURRENCY = 4                   # 同時に取得する期間の数
+CATCHUP_REQUEST_BUDGET = 150              # 回収に使うリクエスト数の上限（メンションAPIは15分あたり180回）
+CATCHUP_MAX_AGE = timedelta(days=7)       # これより古い期間は回収しない
+MENTIONS_PAGE_SIZE = 100
+
+# 投稿者のユーザー名の保持件数と有効期間（秒、ユーザー名は変更されうるため期限を設ける）
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 24 * 60 * 60
+
+# カテゴリごとのキーワード
+CATEGORY_KEYWORDS = {
+    "product": ["製品", "商品", "使い方", "機能", "操作"],
+    "technical": ["エラー", "不具合", "バグ", "動かない", "表示されない", "クラッシュ"],
+    "billing": ["請求", "支払い", "料金", "価格", "返金", "課金"],
+    "complaint": ["クレーム", "不満", "改善", "遅い", "悪い"],
+    "feature": ["要望", "追加", "機能リクエスト", "欲しい", "実装して"]
+}
+
+def estimate_category(content):
+    """問い合わせ内容からカテゴリを推定（API呼び出しなし）"""
+    content = content.lower()
+
+    # 各カテゴリのキーワードマッチをカウント
+    category_scores = {}
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        score = sum(1 for keyword in keywords if keyword in content)
+        category_scores[category] = score
+
+    # 最もスコアが高いカテゴリを選択
+    if any(score > 0 for score in category_scores.values()):
+        max_category = max(category_scores.items(), key=lambda x: x[1])
+        if max_category[1] > 0:
+            return max_category[0]
+
+    # デフォルトカテゴリ
+    return "general"
+
 class XMonitor:
     """X (Twitter) APIのモニタリングクラス"""
 
-    def __init__(self, api_credentials):
-        """初期化"""
-        self.client = tweepy.Client(
-            consumer_key=api_credentials['consumer_key'],
-            consumer_secret=api_credentials['consumer_secret'],
-            access_token=api_credentials['access_token'],
-            access_token_secret=api_credentials['access_token_secret'],
-            wait_on_rate_limit=True
-        )
+    def __init__(self, api_credentials, client=None, cursor_path=None):
+        """初期化（clientを渡した場合はそれを使用: ベンチマーク・検証用、cursor_pathは最終確認時刻の保存先）"""
+        self.client = client
+        self.account = ""
+        if self.client is None:
+            self.client = tweepy.Client(
+                consumer_key=api_credentials['consumer_key'],
+                consumer_secret=api_credentials['consumer_secret'],
+                access_token=api_credentials['access_token'],
+                access_token_secret=api_credentials['access_token_secret'],
+                wait_on_rate_limit=True
+            )
+            # 接続を使い回すセッション設定（TLSハンドシェイクを毎回行わない）
+            mount_pooled_adapter(self.client.session)
+            # スナップショットが別のアカウントのものでないか確かめるための値（トークンそのものは保存しない）
+            self.account = hashlib.sha256(api_credentials['access_token'].encode("utf-8")).hexdigest()[:16]
 
         self.user_id = None
+        self.users = OrderedDict()
+        self.breaker = CircuitBreaker("x")
         self.monitored_keywords = [
             "サポート", "問い合わせ", "質問", "ヘルプ", "不具合", "エラー",
             "使い方", "機能", "要望", "改善", "クレーム", "返金"
         ]
-        self.last_check_time = datetime.now() - timedelta(hours=1)
+        self.cursor_path = cursor_path
+        # 取得したがまだ記録していないメンションと、保存した確認時刻以降に記録済みのメンション（tweet_id → 投稿日時）
+        self.unprocessed = {}
+        self.processed = {}
+        self.last_check_time = self._load_cursor() or datetime.now(timezone.utc) - timedelta(hours=1)
+
+    async def load_user_id(self):
+        """自分のユーザーIDを取得（スナップショットから復元済みの場合は取得しない）"""
+        if self.user_id is None:
+            await asyncio.to_thread(self._get_user_id)
+
+    def snapshot(self):
+        """スナップショットに保存する状態（自分のユーザーIDと投稿者のユーザー名）"""
+        return {
+            "account": self.account,
+            "user_id": self.user_id,
+            "users": [[author_id, username, fetched_at] for author_id, (username, fetched_at) in self.users.items()]
+        }
 
-        # 自分のユーザーIDを取得
-        self._get_user_id()
+    def restore(self, state):
+        """スナップショットの状態を復元（同じアカウントの場合のみ）"""
+        if not state or state.get("account") != self.account:
+            return False
+
+        self.user_id = state.get("user_id")
+        now = time.time()
+        for author_id, username, fetched_at in state.get("users", []):
+            if now - fetched_at < USER_CACHE_TTL:
+                self.users[author_id] = (username, fetched_at)
+        logger.info(f"X アカウントID: {self.user_id}（スナップショットから復元、ユーザー名{len(self.users)}件）")
+        return True
 
     def _get_user_id(self):
         """自分のユーザーIDを取得"""
         try:
-            me = self.client.get_me()
+            with track("x_api_request", endpoint="get_me"):
+                me = self.client.get_me()
             self.user_id = me.data.id
             logger.info(f"X アカウントID: {self.user_id}")
 
         except Exception as e:
             logger.error(f"ユーザーID取得中にエラーが発生しました: {e}", exc_info=True)
 
+    def _load_cursor(self):
+        """前回の最終確認時刻を読み込む"""
+        if not self.cursor_path:
+            return None
+
+        try:
+            with open(self.cursor_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            cursor = datetime.fromisoformat(state["last_check_time"])
+            self.processed = {
+                tweet_id: datetime.fromisoformat(created_at) for tweet_id, created_at in state.get("processed", [])
+            }
+            logger.info(f"前回の最終確認時刻: {cursor.isoformat()}")
+            return cursor
+
+        except FileNotFoundError:
+            return None
+
+        except Exception as e:
+            logger.warning(f"最終確認時刻の読み込みに失敗しました: {e}")
+            return None
+
+    def _save_cursor(self, cursor):
+        """最終確認時刻を更新して保存"""
+        self.last_check_time = cursor
+        self._persist_cursor()
+
+    def _persist_cursor(self):
+        """記録が済んだ位置までの確認時刻を保存（取得しただけのメンションは、停止しても次の起動で取得し直す）"""
+        cursor = min(self.unprocessed.values(), default=self.last_check_time)
+
+        # 取得し直すとX APIの開始時刻（秒単位）以降が重なるため、その分の記録済みのメンションを覚えておく
+        start = cursor.replace(microsecond=0)
+        self.processed = {tweet_id: created_at for tweet_id, created_at in self.processed.items() if created_at >= start}
+        if not self.cursor_path:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(self.cursor_path) or ".", exist_ok=True)
+            temp_path = f"{self.cursor_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "last_check_time": cursor.isoformat(),
+                    "processed": [[tweet_id, created_at.isoformat()] for tweet_id, created_at in self.processed.items()]
+                }, f)
+            os.replace(temp_path, self.cursor_path)
+
+        except Exception as e:
+            logger.warning(f"最終確認時刻の保存に失敗しました: {e}")
+
+    def _accept(self, mentions):
+        """取得したメンションから記録済み・処理待ちのものを除き、処理待ちに加える"""
+        accepted = []
+        for mention in mentions:
+            tweet_id = str(mention.id)
+            if tweet_id in self.processed or tweet_id in self.unprocessed:
+                continue
+            self.unprocessed[tweet_id] = mention.created_at
+            accepted.append(mention)
+        return accepted
+
+    def mark_processed(self, mention):
+        """メンションの記録が済んだことを確認時刻に反映して保存"""
+        tweet_id = str(mention.id)
+        created_at = self.unprocessed.pop(tweet_id, None)
+        if created_at is not None:
+            self.processed[tweet_id] = created_at
+        self._persist_cursor()
+
     async def check_new_mentions(self):
-        """新しいメンションを確認"""
+        """新しいメンションを確認（再試行しても取得できなければ例外を送出し、確認時刻は進めない）"""
         try:
+            # 起動時に取得できなかった場合はここで取得し直す
+            await self.load_user_id()
+
             logger.info("新規メンションを確認中...")
+            poll_started = datetime.now(timezone.utc)
 
-            # メンションの取得
-            mentions = self.client.get_users_mentions(
-                id=self.user_id,
-                start_time=self.last_check_time.strftime("%Y-%m-%dT%H:%M:%SZ"),
-                tweet_fields=["created_at", "text", "author_id", "conversation_id"]
+            # メンションの取得（ページをたどってすべて取得し、一時的なエラーは次の確認を待たずに数秒おきに再試行）
+            mentions = await retry_call(
+                lambda: asyncio.to_thread(self._fetch_mentions_window, self.last_check_time, poll_started),
+                POLL_POLICY, self.breaker, "get_users_mentions"
             )
 
             # DMの取得（実際のAPIでは実装方法が異なる場合があります）
             # この例ではメンションのみを処理
 
-            # 最終確認時間を更新
-            self.last_check_time = datetime.now()
+            # 最終確認時間を更新（取得中に届いた分を落とさないよう、取得開始時刻にする。
+            # 保存する確認時刻は、記録が済むまで処理待ちのメンションより前に留める）
+            mentions = self._accept(mentions)
+            self._save_cursor(poll_started)
 
-            if not mentions.data:
+            if not mentions:
                 logger.info("新規メンションはありませんでした")
                 return []
 
-            logger.info(f"{len(mentions.data)}件の新規メンションを検出")
-            return mentions.data
+            # APIは新しい順に返すため、取りこぼし回収と同じく古い順に処理する
+            logger.info(f"{len(mentions)}件の新規メンションを検出")
+            return sorted(mentions, key=lambda mention: mention.created_at)
 
         except Exception as e:
             logger.error(f"メンション確認中にエラーが発生しました: {e}", exc_info=True)
-            return []
+            raise
+
+    def needs_catch_up(self, window=CATCHUP_WINDOW):
+        """前回の確認から1期間以上空いているか（停止・障害の後）"""
+        return datetime.now(timezone.utc) - self.last_check_time > window
+
+    async def catch_up(self, window=CATCHUP_WINDOW, concurrency=CATCHUP_CONCURRENCY, budget=CATCHUP_REQUEST_BUDGET):
+        """前回の確認以降の期間を分割して並行取得し、重複を除いて古い順に返す"""
+        await self.load_user_id()
+        end = datetime.now(timezone.utc)
+        start = max(self.last_check_time, end - CATCHUP_MAX_AGE)
+        if start > self.last_check_time:
+            logger.warning(f"{CATCHUP_MAX_AGE.days}日より前のメンションは回収しません（{self.last_check_time.isoformat()} 以降が未確認）")
+
+        # リクエスト数が上限を超えないよう期間の長さを調整
+        window = max(window, (end - start) / budget)
+        windows = []
+        window_start = start
+        while window_start < end:
+            window_end = min(window_start + window, end)
+            windows.append((window_start, window_end))
+            window_start = window_end
+
+        logger.info(f"取りこぼし回収: {start.isoformat()} 〜 {end.isoformat()} を{len(windows)}期間に分割して取得します")
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(window_start, window_end):
+            async with semaphore:
+                # tweepyは同期通信のため別スレッドで並行実行（一時的なエラーは期間ごとに再試行）
+                return await retry_call(
+                    lambda: asyncio.to_thread(self._fetch_mentions_window, window_start, window_end),
+                    READ_POLICY, self.breaker, "get_users_mentions"
+                )
+
+        results = await asyncio.gather(*(fetch(*w) for w in windows), return_exceptions=True)
+
+        # tweet_idで重複を除く（前回の停止前に記録済みのメンションも除く）
+        mentions = {}
+        failed = 0
+        for result in results:
+            if isinstance(result, Exception):
+                failed += 1
+                logger.error(f"期間のメンション取得に失敗しました: {result}")
+                continue
+            for mention in result:
+                mentions[mention.id] = mention
+        mentions = {mention.id: mention for mention in self._accept(mentions.values())}
+
+        # 取得できなかった期間がある場合は次回に再試行できるよう確認時刻を進めない
+        if not failed:
+            self._save_cursor(end)
+        else:
+            logger.warning(f"{failed}期間の取得に失敗したため、最終確認時刻は更新しません")
+
+        logger.info(f"取りこぼし回収: {len(mentions)}件のメンションを取得しました")
+        return sorted(mentions.values(), key=lambda mention: mention.created_at)
+
+    def _fetch_mentions_window(self, window_start, window_end):
+        """指定期間のメンションをページをたどってすべて取得"""
+        mentions = []
+        pagination_token = None
+
+        while True:
+            with track("x_api_request", endpoint="get_users_mentions"):
+                response = self.client.get_users_mentions(
+                    id=self.user_id,
+                    start_time=window_start.strftime(X_TIME_FORMAT),
+                    end_time=window_end.strftime(X_TIME_FORMAT),
+                    max_results=MENTIONS_PAGE_SIZE,
+                    pagination_token=pagination_token,
+                    tweet_fields=["created_at", "text", "author_id", "conversation_id"]
+                )
+
+            mentions.extend(response.data or [])
+            pagination_token = (response.meta or {}).get("next_token")
+            if not pagination_token:
+                return mentions
 
     async def process_tweet(self, tweet):
         """ツイートを問い合わせデータに変換"""
         try:
-            # ユーザー情報を取得
-            user = self.client.get_user(id=tweet.author_id).data
+            # 投稿者のユーザー名を取得
+            username = await self._get_username(tweet.author_id)
 
             # ツイートの内容
             content = tweet.text
@@ -97,8 +337,8 @@ class XMonitor:
             # 問い合わせデータを作成
             query_data = {
                 "platform": "X",
-                "username": f"@{user.username}",
-                "user_id": user.id,
+                "username": f"@{username}",
+                "user_id": tweet.author_id,
                 "content": content,
                 "timestamp": timestamp,
                 "category": category,
@@ -107,61 +347,88 @@ class XMonitor:
                 "url": tweet_url
             }
 
-            logger.info(f"問い合わせ処理: @{user.username} のツイートをカテゴリ '{category}' として処理")
+            logger.info(f"問い合わせ処理: @{username} のツイートをカテゴリ '{category}' として処理")
             return query_data
 
         except Exception as e:
             logger.error(f"ツイート処理中にエラーが発生しました: {e}", exc_info=True)
-            # 最低限の情報を返す
+            # 最低限の情報を返す（X上で返信できるようツイートIDを、急増検知・集計のため投稿日時を残す）
+            content = getattr(tweet, "text", None) or "内容不明"
+            created_at = getattr(tweet, "created_at", None) or datetime.now()
             return {
                 "platform": "X",
                 "username": f"不明",
-                "content": tweet.text if hasattr(tweet, "text") else "内容不明",
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "user_id": getattr(tweet, "author_id", None),
+                "content": content,
+                "timestamp": created_at.strftime("%Y-%m-%d %H:%M:%S"),
                 "category": "general",
-                "status": "未対応"
+                "status": "未対応",
+                "tweet_id": tweet.id,
+                "url": f"https://twitter.com/user/status/{tweet.id}"
             }
 
-    def _estimate_category(self, content):
-        """問い合わせ内容からカテゴリを推定"""
-        content = content.lower()
-
-        # カテゴリごとのキーワード
-        category_keywords = {
-            "product": ["製品", "商品", "使い方", "機能", "操作"],
-            "technical": ["エラー", "不具合", "バグ", "動かない", "表示されない", "クラッシュ"],
-            "billing": ["請求", "支払い", "料金", "価格", "返金", "課金"],
-            "complaint": ["クレーム", "不満", "改善", "遅い", "悪い"],
-            "feature": ["要望", "追加", "機能リクエスト", "欲しい", "実装して"]
-        }
+    async def _get_username(self, author_id):
+        """投稿者のユーザー名を取得（有効期間内に取得済みの場合はAPIを呼ばない）"""
+        cached = self.users.get(author_id)
+        if cached is not None and time.time() - cached[1] < USER_CACHE_TTL:
+            self.users.move_to_end(author_id)
+            return cached[0]
 
-        # 各カテゴリのキーワードマッチをカウント
-        category_scores = {}
-        for category, keywords in category_keywords.items():
-            score = sum(1 for keyword in keywords if keyword in content)
-            category_scores[category] = score
+        user = await retry_call(
+            lambda: asyncio.to_thread(self._fetch_user, author_id), READ_POLICY, self.breaker, "get_user"
+        )
+        self.users[author_id] = (user.username, time.time())
+        self.users.move_to_end(author_id)
+        while len(self.users) > USER_CACHE_SIZE:
+            self.users.popitem(last=False)
+        return user.username
 
-        # 最もスコアが高いカテゴリを選択
-        if any(score > 0 for score in category_scores.values()):
-            max_category = max(category_scores.items(), key=lambda x: x[1])
-            if max_category[1] > 0:
-                return max_category[0]
+    def _fetch_user(self, user_id):
+        """ユーザー情報を取得"""
+        with track("x_api_request", endpoint="get_user"):
+            return self.client.get_user(id=user_id).data
 
-        # デフォルトカテゴリ
-        return "general"
+    def _estimate_category(self, content):
+        """問い合わせ内容からカテゴリを推定"""
+        return estimate_category(content)
 
     async def reply_to_tweet(self, tweet_id, message):
-        """ツイートに返信"""
-        try:
-            # ツイートに返信
-            response = self.client.create_tweet(
+        """ツイートに返信して返信のツイートIDを返す（失敗した場合は例外を送出）"""
+        # 二重投稿を避けるため、処理されていないことが確実なエラーだけ再試行
+        response = await retry_call(
+            lambda: asyncio.to_thread(self._create_reply, tweet_id, message),
+            NON_IDEMPOTENT_WRITE_POLICY, self.breaker, "create_tweet"
+        )
+
+        logger.info(f"ツイート {tweet_id} に返信しました")
+        return str(response.data["id"])
+
+    def _create_reply(self, tweet_id, message):
+        """返信ツイートを投稿"""
+        with track("x_api_request", endpoint="create_tweet"):
+            return self.client.create_tweet(
                 text=message,
                 in_reply_to_tweet_id=tweet_id
             )
 
-            logger.info(f"ツイート {tweet_id} に返信しました")
-            return response.data.id
+    async def find_reply(self, tweet_id, since):
+        """since以降の自分のツイートからtweet_idへの返信を探してIDを返す（投稿されたか不明な場合の確認用）"""
+        response = await retry_call(
+            lambda: asyncio.to_thread(self._fetch_own_tweets, since), READ_POLICY, self.breaker, "get_users_tweets"
+        )
 
-        except Exception as e:
-            logger.error(f"ツイート返信中にエラーが発生しました: {e}", exc_info=True)
-            return None
\ No newline at end of file
+        for tweet in response.data or []:
+            for referenced in tweet.referenced_tweets or []:
+                if referenced.type == "replied_to" and str(referenced.id) == str(tweet_id):
+                    return str(tweet.id)
+        return None
+
+    def _fetch_own_tweets(self, since):
+        """指定時刻以降の自分のツイートを取得"""
+        with track("x_api_request", endpoint="get_users_tweets"):
+            return self.client.get_users_tweets(
+                id=self.user_id,
+                start_time=since.strftime(X_TIME_FORMAT),
+                max_results=100,
+                tweet_fields=["created_at", "referenced_tweets"]
+            )
\ No newline at end of file
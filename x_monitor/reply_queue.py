@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Discord-X-Support-Hub
+返信キュー: Xへの返信を書き込みレート制限の範囲で並行して送信
+
+!reply・!template はキューに追加した時点で応答を返し、投稿の結果は後からコマンドを
+実行したチャンネルに報告します。同じ返信（問い合わせIDと本文が同じ）は1回だけ投稿されるよう、
+送信待ちの重複を受け付けず、投稿した返信を送信履歴のファイルに残します。本文の違う追加の
+返信は投稿し、最新の返信のツイートIDを問い合わせの reply_tweet_id 列に記録します。
+投稿されたか不明なエラーの後は、自分のツイートに返信が残っていないか確認してから再送します。
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import deque, OrderedDict
+from datetime import datetime, timezone
+
+from monitoring.metrics import REGISTRY
+from monitoring.log_pipeline import log_context
+from monitoring.resilience import CircuitOpenError, classify_error, PERMANENT, TRANSIENT
+
+logger = logging.getLogger(__name__)
+
+# X APIの投稿の上限（ユーザーあたり15分で100件程度、プランに合わせて調整）
+REPLY_RATE_LIMIT = 100
+REPLY_RATE_WINDOW = 900.0
+
+# 同時に送信する返信の数
+REPLY_CONCURRENCY = 4
+
+# 送信の試行回数と再送までの待ち時間（秒、試行ごとに2倍）
+REPLY_ATTEMPTS = 3
+REPLY_RETRY_DELAY = 5.0
+
+# 投稿した返信のツイートIDの記録の試行回数（失敗し続けた場合は投稿せずに記録だけをやり直す）
+RECORD_ATTEMPTS = 5
+
+# 二重投稿を防ぐために送信履歴に残す返信の件数（古い順に破棄）
+SENT_HISTORY_SIZE = 5000
+
+REPLIES = REGISTRY.counter("x_replies_total", "Xへの返信の処理結果", ("result",))
+REPLY_DELIVERY_SECONDS = REGISTRY.histogram(
+    "x_reply_delivery_seconds", "返信を受け付けてからX上に投稿されるまでの時間（秒）"
+)
+
+class SlidingWindowLimiter:
+    """直近window秒の送信数をlimit件以下に抑える（asyncio用）"""
+
+    def __init__(self, limit=REPLY_RATE_LIMIT, window=REPLY_RATE_WINDOW):
+        """初期化"""
+        self.limit = limit
+        self.window = window
+        self.sent = deque()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """送信枠を1件取得（空いていなければ最も古い送信が枠から外れるまで待機）"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self.sent and now - self.sent[0] >= self.window:
+                    self.sent.popleft()
+                if len(self.sent) < self.limit:
+                    self.sent.append(now)
+                    return
+                await asyncio.sleep(self.window - (now - self.sent[0]))
+
+class ReplyQueue:
+    """Xへの返信の送信キュー"""
+
+    def __init__(self, x_monitor, storage, concurrency=REPLY_CONCURRENCY,
+                 rate_limit=REPLY_RATE_LIMIT, rate_window=REPLY_RATE_WINDOW, sent_path=None):
+        """初期化（sent_path: 送信履歴の保存先、Noneの場合は再起動をまたいだ二重投稿の確認をしない）"""
+        self.x_monitor = x_monitor
+        self.storage = storage
+        self.concurrency = concurrency
+        self.limiter = SlidingWindowLimiter(rate_limit, rate_window)
+        self.queue = asyncio.Queue()
+        self.workers = []
+        self.pending = {}  # 問い合わせID → 送信待ち・送信中の返信
+        self.sent_path = sent_path
+        self.sent = self._load_sent()  # 返信のキー → 投稿した返信のツイートID
+
+        REGISTRY.gauge("x_reply_queue_depth", "Xへの返信の送信待ち件数").set_function(lambda: len(self.pending))
+
+    def start(self):
+        """送信タスクを開始（終了したタスクは補充）"""
+        self.workers = [worker for worker in self.workers if not worker.done()]
+        while len(self.workers) < self.concurrency:
+            self.workers.append(asyncio.create_task(self._worker()))
+
+    def _load_sent(self):
+        """送信履歴を読み込む"""
+        if not self.sent_path:
+            return OrderedDict()
+
+        try:
+            with open(self.sent_path, "r", encoding="utf-8") as f:
+                return OrderedDict(json.load(f)["sent"])
+
+        except FileNotFoundError:
+            return OrderedDict()
+
+        except Exception as e:
+            logger.warning(f"返信の送信履歴の読み込みに失敗しました: {e}")
+            return OrderedDict()
+
+    def _save_sent(self, sent):
+        """送信履歴を保存（別スレッドで実行）"""
+        os.makedirs(os.path.dirname(self.sent_path) or ".", exist_ok=True)
+        temp_path = f"{self.sent_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"sent": sent}, f)
+        os.replace(temp_path, self.sent_path)
+
+    async def _remember(self, job):
+        """投稿した返信を送信履歴に残す（再起動・コマンドの再実行で同じ返信を投稿しない）"""
+        self.sent[job["key"]] = job["reply_id"]
+        while len(self.sent) > SENT_HISTORY_SIZE:
+            self.sent.popitem(last=False)
+        if not self.sent_path:
+            return
+
+        try:
+            await asyncio.to_thread(self._save_sent, list(self.sent.items()))
+        except Exception as e:
+            logger.warning(f"返信の送信履歴の保存に失敗しました: {e}")
+
+    @staticmethod
+    def _reply_key(query_id, message):
+        """返信のキー（問い合わせIDと本文が同じなら同じ返信とみなす）"""
+        return hashlib.sha256(f"{query_id}\n{message}".encode("utf-8")).hexdigest()[:16]
+
+    def submit(self, query_id, message, channel=None):
+        """返信をキューに追加（同じ問い合わせの返信が送信待ちならFalse、結果はchannelに報告）"""
+        if query_id in self.pending:
+            return False
+
+        self.start()
+        job = {
+            "query_id": query_id,
+            "key": self._reply_key(query_id, message),
+            "message": message,
+            "channel": channel,
+            "queued_at": time.monotonic(),
+            "submitted_at": datetime.now(timezone.utc)
+        }
+        self.pending[query_id] = job
+        self.queue.put_nowait(job)
+        return True
+
+    async def flush(self):
+        """送信待ちがなくなるまで待機（終了時など）"""
+        await self.queue.join()
+
+    async def _worker(self):
+        """キューから取り出して送信"""
+        while True:
+            job = await self.queue.get()
+            try:
+                with log_context(query_id=job["query_id"]):
+                    await self._deliver(job)
+            except Exception as e:
+                REPLIES.inc(result="failed")
+                logger.error(f"返信の送信中にエラーが発生しました: {e}", exc_info=True)
+                await self._report(job, f"❌ 問い合わせ {job['query_id']} のX上での返信に失敗しました: {e}")
+            finally:
+                # 投稿済みで記録できなかった返信は送信待ちに残し、記録だけをやり直す
+                if job.pop("requeue", False):
+                    self.queue.put_nowait(job)
+                else:
+                    self.pending.pop(job["query_id"], None)
+                self.queue.task_done()
+
+    async def _deliver(self, job):
+        """返信を1件投稿し、ツイートIDを記録して結果を報告"""
+        query_id = job["query_id"]
+        if job.get("reply_id"):
+            await self._record(job)
+            return
+
+        # 再起動・コマンドの再実行で同じ返信を二重に投稿しない（本文の違う追加の返信は投稿する）
+        sent_id = self.sent.get(job["key"])
+        if sent_id:
+            REPLIES.inc(result="already_sent")
+            await self._report(job, f"ℹ️ 問い合わせ {query_id} には同じ内容でX上に返信済みです（{self._tweet_url(sent_id)}）")
+            return
+
+        # 元のツイートIDはシート上で直接修正されうるため、メモリ上の問い合わせではなく保存先から読む
+        query_data = await self.storage.get_query(query_id, fresh=True)
+        if not query_data:
+            raise ValueError(f"問い合わせ {query_id} が見つかりません")
+
+        tweet_id = query_data.get("tweet_id")
+        if not tweet_id:
+            REPLIES.inc(result="no_tweet")
+            await self._report(job, f"ℹ️ 問い合わせ {query_id} は元のツイートが記録されていないため、X上には返信しません。")
+            return
+
+        job["reply_id"] = await self._post(job, tweet_id)
+        await self._remember(job)
+        REPLY_DELIVERY_SECONDS.observe(time.monotonic() - job["queued_at"])
+        REPLIES.inc(result="sent")
+        await self._report(job, f"✅ 問い合わせ {query_id} にX上で返信しました: {self._tweet_url(job['reply_id'])}")
+
+        await self._record(job)
+
+    async def _record(self, job):
+        """投稿した返信のツイートIDを問い合わせに記録（記録されないと再実行で二重に返信するため、
+        失敗し続けた場合は送信待ちに戻して記録だけをやり直す）"""
+        reply_id = job["reply_id"]
+        for attempt in range(1, RECORD_ATTEMPTS + 1):
+            try:
+                await self.storage.update_queries([job["query_id"]], {"reply_tweet_id": reply_id})
+                return
+
+            except Exception as e:
+                logger.error(f"返信のツイートIDの記録に失敗しました（{reply_id}、{attempt}回目）: {e}", exc_info=True)
+                if attempt == RECORD_ATTEMPTS:
+                    job["requeue"] = True
+                    return
+                await asyncio.sleep(REPLY_RETRY_DELAY * 2 ** (attempt - 1))
+
+    async def _post(self, job, tweet_id):
+        """返信を投稿してIDを返す（投稿されたか不明なエラーの後は、投稿済みでないか確認してから再送）"""
+        uncertain = False
+        for attempt in range(1, REPLY_ATTEMPTS + 1):
+            try:
+                if uncertain:
+                    reply_id = await self.x_monitor.find_reply(tweet_id, job["submitted_at"])
+                    if reply_id:
+                        logger.info(f"前回の送信で投稿されていた返信を確認しました: {reply_id}")
+                        return reply_id
+                    uncertain = False
+
+                await self.limiter.acquire()
+                return await self.x_monitor.reply_to_tweet(tweet_id, job["message"])
+
+            except CircuitOpenError as e:
+                if attempt == REPLY_ATTEMPTS:
+                    raise
+                delay = max(e.retry_in, REPLY_RETRY_DELAY)
+
+            except Exception as e:
+                kind = classify_error(e)
+                if kind == PERMANENT or attempt == REPLY_ATTEMPTS:
+                    raise
+                uncertain = uncertain or kind == TRANSIENT
+                delay = REPLY_RETRY_DELAY * 2 ** (attempt - 1)
+
+            logger.warning(f"返信を送信できませんでした（{attempt}回目、{delay:.0f}秒後に再試行）")
+            await asyncio.sleep(delay)
+
+    async def _report(self, job, message):
+        """コマンドを実行したチャンネルに結果を報告"""
+        logger.info(message)
+        if job["channel"] is None:
+            return
+        try:
+            await job["channel"].send(message)
+        except Exception as e:
+            logger.warning(f"返信結果の報告に失敗しました: {e}")
+
+    def _tweet_url(self, tweet_id):
+        """ツイートのURL"""
+        return f"https://twitter.com/user/status/{tweet_id}"
\ No newline at end of file